@@ -20,7 +20,8 @@ class Task:
     def __init__(self, step, prefix, in_files, param_file,
             ref_uri, in_uri, out_uri, assets_uri,
             sample_file=None, target_file=None, sentieon_pkg=None,
-            license_file=None, threads=None, fam_dict=None):
+            license_file=None, threads=None, fam_dict=None,
+            fam_file=None, fam_shard=None):
 
         self.step = step
         self.prefix = prefix
@@ -55,12 +56,18 @@ class Task:
 
         self.ref_files = []
 
-        # fam_dict for denovo calling, keys are fam_id, fil, mat, pat
+        # fam file and the i/n shard of its families to split the
+        # cohort vcf for
+        self.fam_file = fam_file
+        self.fam_shard = fam_shard
+
+        # fam_dict for denovo calling, keys are fam_id, fil, mat, pat;
+        # only fam_vcf_from_cohort needs the samples
         if fam_dict != None:
             self.fam_id = fam_dict['fam_id']
-            self.fil = fam_dict['fil']
-            self.pat = fam_dict['pat']
-            self.mat = fam_dict['mat']
+            self.fil = fam_dict.get('fil')
+            self.pat = fam_dict.get('pat')
+            self.mat = fam_dict.get('mat')
 
     def get_reference_files(self, build):
         '''
@@ -259,6 +266,10 @@ class Task:
                 # These steps use vcfconvert
                 zip_cmd_list = all_cmds['sentieon_zipper'].rstrip()
                 return [raw_cmd_list, zip_cmd_list]
+            if self.step == 'denovo':
+                # prepares the trio vcf and ped, then runs triodenovo
+                triodenovo_cmd_list = all_cmds['triodenovo'].rstrip()
+                return [raw_cmd_list, triodenovo_cmd_list]
             return [raw_cmd_list]
 
     def build_cmd(self):
@@ -270,7 +281,7 @@ class Task:
         '''
 
         unformat_cmd_str = self.import_cmd_template()
-        if self.step not in ['haplotyper', 'genotyper']:
+        if self.step not in ['haplotyper', 'genotyper', 'denovo']:
             unformat_cmd_str = unformat_cmd_str[0]
 
         if self.step == 'sam_to_fq':
@@ -440,11 +451,32 @@ class Task:
                 pat=self.pat,
                 mat=self.mat)]
             self.result_files = ['{}.vcf'.format(self.fam_id), '{}.vcf.idx'.format(self.fam_id)]
+        elif self.step == 'split_families':
+            # the vcf package only ships in the triodenovo container
+            from vcf import families
+            vcf = [f for f in self.in_files if f.endswith('.gt.snp.indel.recal.vcf')][0]
+            shard, n_shards = [int(n) for n in self.fam_shard.split('/')]
+            fams = families.shard_families(
+                families.read_fam_file(self.fam_file), shard, n_shards)
+            # one process unless the job's vCPUs are given, all CPUs of
+            # the container are the host's under Batch
+            cmd_strs = [unformat_cmd_str.format(
+                vcf=vcf,
+                fam_file=self.fam_file,
+                shard=self.fam_shard,
+                threads=self.threads or 1)]
+            # BGZF compressed, index_results adds their indexes
+            self.result_files = []
+            for fam in fams:
+                self.result_files += ['{}.vcf.gz'.format(fam.fam_id), '{}.ped'.format(fam.fam_id)]
+            self.intermediate_files = [self.fam_file]
         elif self.step == 'scrub_vcf':
             vcf = vcf = [f for f in self.in_files if f.endswith('.vcf')][0]
+            # one process unless the job's vCPUs are given
             cmd_strs = [unformat_cmd_str.format(
                 vcf=vcf,
-                fam_id=self.fam_id)]
+                fam_id=self.fam_id,
+                threads=self.threads or 1)]
             self.result_files = ['{}.scrubbed.vcf'.format(self.fam_id)]
         elif self.step == 'ped_from_vcf':
             vcf = vcf = [f for f in self.in_files if f.endswith('.vcf')][0]
@@ -454,8 +486,27 @@ class Task:
             self.result_files = ['{}.ped'.format(self.fam_id)]
         elif self.step == 'triodenovo':
             cmd_strs = [unformat_cmd_str.format(
+                vcf='{}.scrubbed.vcf'.format(self.fam_id),
                 fam_id=self.fam_id)]
             self.result_files = ['{}.triodenovo.vcf'.format(self.fam_id)]
+        elif self.step == 'denovo':
+            # scrub_vcf, ped_from_vcf and triodenovo in one job
+            vcf = [f for f in self.in_files if f.endswith('.vcf.gz')][0]
+            scrubbed = '{}.scrubbed.vcf'.format(self.fam_id)
+            prepare_cmd_str = unformat_cmd_str[0].format(
+                vcf=vcf,
+                fam_id=self.fam_id,
+                fil=self.fil,
+                pat=self.pat,
+                mat=self.mat)
+            triodenovo_cmd_str = unformat_cmd_str[1].format(
+                vcf=scrubbed,
+                fam_id=self.fam_id)
+            cmd_strs = [prepare_cmd_str, triodenovo_cmd_str]
+            self.result_files = [
+                '{}.triodenovo.vcf'.format(self.fam_id),
+                '{}.ped'.format(self.fam_id)]
+            self.intermediate_files = [scrubbed]
         else:
             print('Unrecognised pipeline step {}!'.format(self.step))
             exit(1)
@@ -487,6 +538,17 @@ class Task:
                 print('NON ZERO EXIT: {}'.format(str(return_code)))
                 sys.stdout.flush()
                 exit(return_code)
+        elif self.step == 'denovo':
+            # triodenovo only runs on a prepared vcf and ped
+            for step_cmd in cmd:
+                print('STEP TO RUN: {}'.format(self.step))
+                print('COMMAND TO RUN: {}'.format(' '.join(step_cmd)))
+                sys.stdout.flush()
+                return_code = subprocess.call(step_cmd)
+                if return_code > 0:
+                    print('NON ZERO EXIT: {}'.format(str(return_code)))
+                    sys.stdout.flush()
+                    exit(return_code)
         elif self.step == 'sam_to_fq':
             print('RUNNING PICARD SAMTOFASTQ')
             sys.stdout.flush()
@@ -522,6 +584,25 @@ class Task:
                     sys.stdout.flush()
                     exit(return_code)
 
+    def index_results(self):
+        '''
+        Tabix indexes the BGZF compressed VCFs in result_files, so
+        downstream steps can fetch regions instead of scanning them.
+        The indexes are added to result_files. Run after run_cmd, in
+        containers that ship the vcf package.
+        '''
+        from vcf import bgzf, index
+        for file_name in list(self.result_files):
+            if not file_name.endswith('.vcf.gz') or not bgzf.is_bgzf(file_name):
+                continue
+            index_file = index.find_index(file_name)
+            if index_file is None:
+                print('Indexing {}.'.format(file_name))
+                index_file = index.build_index(file_name)
+            if index_file not in self.result_files:
+                self.result_files.append(index_file)
+        sys.stdout.flush()
+
     def upload_results(self):
         '''
         Uploads any output files to out_uri.
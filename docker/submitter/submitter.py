@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from pprint import pprint
 import boto3
 import datetime
@@ -13,7 +14,8 @@ def get_info_dict(bucket, key, file, file_type, start_point=None):
     b = S3_CLIENT.Bucket(bucket)
     b.download_file(key, file)
 
-    return_dict = {}
+    # in file order, the triodenovo step shards families in this order
+    return_dict = OrderedDict()
     print(start_point)
     with open(file, 'r') as f:
         for line in f:
@@ -30,6 +32,14 @@ def get_info_dict(bucket, key, file, file_type, start_point=None):
                     uri = fields[1].strip()
                     return_dict[sample] = uri
             elif file_type == 'fam_info':
+                # read as vcf.families.read_fam_file reads it, split_families
+                # jobs shard the families in this order
+                fields = [field.strip() for field in fields]
+                if not fields[0] or fields[0].startswith('#'):
+                    continue
+                if len(fields) < 4:
+                    raise ValueError('Family {} in {} needs father, child and '
+                                     'mother samples'.format(fields[0], file))
                 fam_id = fields[0]
                 pat = fields[1]
                 fil = fields[2]
@@ -57,7 +67,8 @@ def main():
     sample_file = event['sample_file']
     fam_file = event['fam_file']
     cohort_prefix = event['cohort_prefix']
-    sample_key = '{}/{}'.format(sample_s3_prefix, sample_file)
+    sample_key = '{}/{}'.format(
+        sample_s3_prefix, sample_file if step != 'triodenovo' else fam_file)
     file_type = 'sample_info' if step != 'triodenovo' else 'fam_info'
 
     info_dict = get_info_dict(
@@ -541,24 +552,32 @@ def main():
             job_ids.append(haplotyper_submit['jobId'])
 
     elif step == 'triodenovo':
-        for fam_id in info_dict:
-            print('fam_vcf_from_cohort for {}'.format(fam_id))
+        # split_families reads the cohort vcf once and writes the vcf and
+        # ped of every family; the families are dealt out to split_jobs jobs
+        # the same way vcf.families.shard_families does, in fam file order
+        fam_ids = list(info_dict)
+        split_jobs = max(min(int(event.get('split_jobs', 1)), len(fam_ids)), 1)
+        fam_uri = 's3://{}/{}'.format(sample_s3_bucket, sample_key)
+        split_threads = str(event['mode'][mode]['threads']['split'])
+        split_families_submits = {}
+        for shard in range(split_jobs):
+            print('split_families {}/{}'.format(shard, split_jobs))
             now_unformat = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             now = now_unformat.replace(' ', '_').replace(':', '-')
-            fil = info_dict[fam_id][0]
-            mat = info_dict[fam_id][1]
-            pat = info_dict[fam_id][2]
-            in_uri = '{}final-cohort-vcf/'.format(results_uri)
-            fam_vcf_from_cohort_submit = BATCH_CLIENT.submit_job(
-                jobName='fam_vcf_from_cohort_{}_{}'.format(fam_id, now),
+            split_families_submit = BATCH_CLIENT.submit_job(
+                jobName='split_families_{}_{}_{}'.format(shard, split_jobs, now),
                 jobQueue=job_queue,
-                jobDefinition=job_defs['fam_vcf_from_cohort'],
+                jobDefinition=job_defs['split_families_job'],
                 containerOverrides={
                     'environment': [
                         {
                             'name': 'build',
                             'value': build
                         },
+                        {
+                            'name': 'threads',
+                            'value': split_threads
+                        },
                         {
                             'name': 'ome',
                             'value': ome
@@ -569,7 +588,7 @@ def main():
                         },
                         {
                             'name': 'in_uri',
-                            'value': in_uri
+                            'value': '{}final-cohort-vcf/'.format(results_uri)
                         },
                         {
                             'name': 'out_uri',
@@ -588,20 +607,12 @@ def main():
                             'value': cohort_prefix
                         },
                         {
-                            'name': 'fam_id',
-                            'value': fam_id
-                        },
-                        {
-                            'name': 'fil',
-                            'value': fil
-                        },
-                        {
-                            'name': 'mat',
-                            'value': mat
+                            'name': 'fam_uri',
+                            'value': fam_uri
                         },
                         {
-                            'name': 'pat',
-                            'value': pat
+                            'name': 'fam_shard',
+                            'value': '{}/{}'.format(shard, split_jobs)
                         },
                         {
                             'name': 'log_uri',
@@ -610,67 +621,27 @@ def main():
                     ]
                 },
             )
-            job_ids.append(fam_vcf_from_cohort_submit['jobId'])
-            print(fam_vcf_from_cohort_submit)
+            job_ids.append(split_families_submit['jobId'])
+            print(split_families_submit)
+            # the families of this shard, as vcf.families.shard_families
+            # picks them
+            for fam_id in fam_ids[shard::split_jobs]:
+                split_families_submits[fam_id] = split_families_submit
 
-            scrub_vcf_submit = BATCH_CLIENT.submit_job(
-                jobName='scrub_vcf_{}_{}'.format(fam_id, now),
-                jobQueue=job_queue,
-                jobDefinition=job_defs['scrub_vcf'],
-                dependsOn=[{'jobId':fam_vcf_from_cohort_submit['jobId']}],
-                containerOverrides={
-                    'environment': [
-                        {
-                            'name': 'build',
-                            'value': build
-                        },
-                        {
-                            'name': 'ome',
-                            'value': ome
-                        },
-                        {
-                            'name': 'param_file',
-                            'value': param_file
-                        },
-                        {
-                            'name': 'in_uri',
-                            'value': '{}fam-vcfs/'.format(results_uri)
-                        },
-                        {
-                            'name': 'out_uri',
-                            'value': '{}denovo-processing/'.format(results_uri)
-                        },
-                        {
-                            'name': 'assets_uri',
-                            'value': assets_uri
-                        },
-                        {
-                            'name': 'ref_uri',
-                            'value': ref_uri
-                        },
-                        {
-                            'name': 'prefix',
-                            'value': cohort_prefix
-                        },
-                        {
-                            'name': 'fam_id',
-                            'value': fam_id
-                        },
-                        {
-                            'name': 'log_uri',
-                            'value': '{}logs/'.format(results_uri)
-                        }
-                    ]
-                },
-            )
-            job_ids.append(scrub_vcf_submit['jobId'])
-            print(scrub_vcf_submit)
+        for fam_id in fam_ids:
+            # one job scrubs the family vcf, derives its ped and runs
+            # triodenovo, instead of scrub_vcf, ped_from_vcf and triodenovo
+            print('Submitting denovo for {}'.format(fam_id))
+            now_unformat = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            now = now_unformat.replace(' ', '_').replace(':', '-')
+            split_families_submit = split_families_submits[fam_id]
+            fil, pat, mat = info_dict[fam_id]
 
-            ped_from_vcf_submit = BATCH_CLIENT.submit_job(
-                jobName='ped_from_vcf_{}_{}'.format(fam_id, now),
+            denovo_submit = BATCH_CLIENT.submit_job(
+                jobName='denovo_{}_{}'.format(fam_id, now),
                 jobQueue=job_queue,
-                jobDefinition=job_defs['ped_from_vcf'],
-                dependsOn=[{'jobId':fam_vcf_from_cohort_submit['jobId']}],
+                jobDefinition=job_defs['denovo_job'],
+                dependsOn=[{'jobId':split_families_submit['jobId']}],
                 containerOverrides={
                     'environment': [
                         {
@@ -691,7 +662,7 @@ def main():
                         },
                         {
                             'name': 'out_uri',
-                            'value': '{}denovo-processing/'.format(results_uri)
+                            'value': '{}triodenovo-results/'.format(results_uri)
                         },
                         {
                             'name': 'assets_uri',
@@ -710,57 +681,16 @@ def main():
                             'value': fam_id
                         },
                         {
-                            'name': 'log_uri',
-                            'value': '{}logs/'.format(results_uri)
-                        }
-                    ]
-                },
-            )
-            job_ids.append(ped_from_vcf_submit['jobId'])
-            print(ped_from_vcf_submit)
-
-            triodenovo_submit = BATCH_CLIENT.submit_job(
-                jobName='triodenovo_{}_{}'.format(fam_id, now),
-                jobQueue=job_queue,
-                jobDefinition=job_defs['triodenovo'],
-                dependsOn=[{'jobId':fam_vcf_from_cohort_submit['jobId']}],
-                containerOverrides={
-                    'environment': [
-                        {
-                            'name': 'build',
-                            'value': build
-                        },
-                        {
-                            'name': 'ome',
-                            'value': ome
-                        },
-                        {
-                            'name': 'param_file',
-                            'value': param_file
-                        },
-                        {
-                            'name': 'in_uri',
-                            'value': '{}denovo-processing/'.format(results_uri)
-                        },
-                        {
-                            'name': 'out_uri',
-                            'value': '{}triodenovo-results/'.format(results_uri)
-                        },
-                        {
-                            'name': 'assets_uri',
-                            'value': assets_uri
-                        },
-                        {
-                            'name': 'ref_uri',
-                            'value': ref_uri
+                            'name': 'fil',
+                            'value': fil
                         },
                         {
-                            'name': 'prefix',
-                            'value': cohort_prefix
+                            'name': 'pat',
+                            'value': pat
                         },
                         {
-                            'name': 'fam_id',
-                            'value': fam_id
+                            'name': 'mat',
+                            'value': mat
                         },
                         {
                             'name': 'log_uri',
@@ -769,8 +699,8 @@ def main():
                     ]
                 },
             )
-            job_ids.append(triodenovo_submit['jobId'])
-            print(triodenovo_submit)
+            job_ids.append(denovo_submit['jobId'])
+            print(denovo_submit)
 
     elif step == 'bamQC':
         for sample in info_dict:
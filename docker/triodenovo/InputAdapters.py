@@ -1,4 +1,6 @@
 from VCFLineParser import SimpleLineParser
+from vcf import bgzf, index, scatter
+import multiprocessing
 import sys
 import argparse
 
@@ -25,41 +27,71 @@ class TrioDeNovoInputAdapter(object):
         alt = fields[4]
         return alt == '*'
 
+    def keep_line(self, stripped_line):
+        """
+        True for data lines triodenovo can use
+        """
+        try:
+            # raises ValueError if number FORMAT fields doesn't match number of subject fields
+            subj_dict = SimpleLineParser.subj_dict(
+                SimpleLineParser.split(stripped_line)
+            )
+
+            # raises ValueError if any subject PL is '.'
+            TrioDeNovoInputAdapter.check_format_field(subj_dict, 'PL')
+            TrioDeNovoInputAdapter.check_format_field(subj_dict, 'DP')
+        except ValueError as ve:
+            # Skip lines with mis-matched FORMAT fields
+            # sys.stderr.write(str(ve) + '\n')
+            return False
+        return not self.is_spanning_del_only(stripped_line)
+
     def parse(self):
         with open(self.vcf, 'r') as vcf_fh:
             for line in vcf_fh:
                 stripped_line = line.strip()
                 if SimpleLineParser.is_header_line(stripped_line):
                     self.output_handle.write(line)
-                if not SimpleLineParser.is_header_line(stripped_line):
-                    # not a header line
-                    try:
-                        # raises ValueError if number FORMAT fields doesn't match number of subject fields
-                        subj_dict = SimpleLineParser.subj_dict(
-                            SimpleLineParser.split(stripped_line)
-                        )
+                elif self.keep_line(stripped_line):
+                    self.output_handle.write(line)
 
-                        # raises ValueError if any subject PL is '.'
-                        TrioDeNovoInputAdapter.check_format_field(subj_dict, 'PL')
-                        TrioDeNovoInputAdapter.check_format_field(subj_dict, 'DP')
 
-                        # if did not throw a value error, write line
-                        if not self.is_spanning_del_only(stripped_line):
-                            self.output_handle.write(line)
-                    except ValueError as ve:
-                        # Skip lines with mis-matched FORMAT fields
-                        # sys.stderr.write(str(ve) + '\n')
-                        # sys.stderr.write(line)
-                        continue
+def scrub_shard(reader, output_handle):
+    """
+    Scrub the records of one shard of vcf.scatter.scatter_vcf
+    """
+    adapter = TrioDeNovoInputAdapter(reader.filename, output_handle)
+    for line in scatter.header_lines(reader):
+        output_handle.write(line + '\n')
+    # reader.reader yields the stripped data lines of the shard
+    for line in reader.reader:
+        if adapter.keep_line(line):
+            output_handle.write(line + '\n')
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', dest='vcf', required=True)
-    parser.add_argument('-o', dest='out', required=False, type=argparse.FileType('w'), default=sys.stdout)
+    parser.add_argument('-o', dest='out', required=False,
+                        help='Output VCF, BGZF compressed and tabix indexed if it ends in .gz [stdout]')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Scrub shards of the input in this many processes, 0 for all CPUs')
     args = parser.parse_args()
 
-    TrioDeNovoInputAdapter(args.vcf, args.out).parse()
-
-    if args.out != sys.stdout:
-        print('Closing ' + str(args.out))
-        args.out.close()
+    workers = args.workers or multiprocessing.cpu_count()
+    shards = None
+    if args.out is not None and workers > 1:
+        shards = scatter.plan_shards(args.vcf, workers * 4)
+    if args.out is None:
+        TrioDeNovoInputAdapter(args.vcf, sys.stdout).parse()
+    elif shards:
+        scatter.scatter_vcf(args.vcf, scrub_shard, args.out, workers=workers,
+                            shards=shards, indexed=True)
+    else:
+        if args.out.endswith('.gz'):
+            out = index.IndexingWriter(args.out, threads=bgzf.default_threads())
+        else:
+            out = open(args.out, 'w')
+        TrioDeNovoInputAdapter(args.vcf, out).parse()
+        print('Closing ' + args.out)
+        out.close()
@@ -0,0 +1,59 @@
+import SDK
+import os
+from datetime import datetime
+
+def main():
+    prefix = os.environ['prefix']
+    param_file = os.environ['param_file']
+    ref_uri = os.environ['ref_uri']
+    in_uri = os.environ['in_uri']
+    out_uri = os.environ['out_uri']
+    assets_uri = os.environ['assets_uri']
+    build = os.environ['build']
+    fam_id = os.environ['fam_id']
+    # the trio as the fam file lists it
+    fil = os.environ['fil']
+    pat = os.environ['pat']
+    mat = os.environ['mat']
+    # written BGZF compressed and indexed by split_families
+    vcf = '{}.vcf.gz'.format(fam_id)
+
+    # the scrubbed vcf and the ped are made from the family vcf in the
+    # same job, then triodenovo is run on them; the triodenovo binary is
+    # on the PATH of the image
+    in_files = [vcf]
+
+    print(in_files)
+
+    start_time = datetime.now()
+    print('DENOVO for {} was started at {}.'.format(fam_id, str(start_time)))
+
+    task = SDK.Task(
+        step='denovo',
+        prefix=prefix,
+        in_files=in_files,
+        param_file=param_file,
+        ref_uri=ref_uri,
+        in_uri=in_uri,
+        out_uri=out_uri,
+        assets_uri=assets_uri,
+        fam_dict={'fam_id': fam_id, 'fil': fil, 'pat': pat, 'mat': mat})
+    dir_contents = os.listdir('.')
+
+    print('Current dir contents: {}'.format(str(dir_contents)))
+    task.get_reference_files(build)
+    task.download_files('INPUT')
+    task.download_files('REF')
+    task.download_files('PARAMS')
+    task.build_cmd()
+    task.run_cmd()
+    task.upload_results()
+    task.cleanup()
+
+    end_time = datetime.now()
+    print('DENOVO for {} ended at {}.'.format(fam_id, str(end_time)))
+    total_time = end_time - start_time
+    print('Total time for DENOVO was {}.'.format(str(total_time)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+""" Make a family VCF ready for triodenovo in one pass (see vcf.families)
+
+Writes the PED file of the trio given by --fam-id, --father, --child and
+--mother, as the fam file lists it, or derived from the D, M and F sample
+names of the header when the samples are not given, and the records with
+PL and DP in every call and an ALT other than a lone spanning deletion,
+replacing scrub_vcf and ped_from_vcf.
+"""
+
+import argparse
+import sys
+
+from vcf import families
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-i', dest='vcf', required=True, help='Family VCF')
+    parser.add_argument('-o', dest='out', required=True,
+            help='Output VCF, BGZF compressed and tabix indexed if it ends in .gz')
+    parser.add_argument('--ped', required=True, help='Output PED file')
+    parser.add_argument('--fam-id',
+            help='Family id, derived from the sample names if not given')
+    parser.add_argument('--father', help='Father sample')
+    parser.add_argument('--child', help='Child sample')
+    parser.add_argument('--mother', help='Mother sample')
+    args = parser.parse_args()
+
+    trio = (args.father, args.child, args.mother)
+    family = None
+    if any(trio):
+        if not all(trio) or not args.fam_id:
+            parser.error('--father, --child and --mother go together, with --fam-id')
+        family = families.Family(args.fam_id, *trio)
+
+    try:
+        family, kept, dropped = families.prepare_trio(
+            args.vcf, args.out, args.ped, family=family, fam_id=args.fam_id)
+    except ValueError as ve:
+        sys.stderr.write('{}\n'.format(ve))
+        sys.exit(1)
+    print('Family {}: kept {} records, dropped {}.'.format(
+        family.fam_id, kept, dropped))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 import sys
 import argparse
+import functools
 import pkg_resources
+from StringIO import StringIO
 
 import vcf
+from vcf import parallel
 from vcf.parser import _Filter
 
+#: records handed to the filters at a time
+BLOCK_SIZE = 1000
+
 def create_filt_parser(name):
     parser = argparse.ArgumentParser(description='Parser for %s' % name,
             add_help=False
@@ -22,7 +28,7 @@ def create_core_parser():
             add_help=False,
             formatter_class=argparse.ArgumentDefaultsHelpFormatter,
             usage="""%(prog)s [-h] [--no-short-circuit] [--no-filtered]
-              [--output OUTPUT] [--local-script LOCAL_SCRIPT]
+              [--output OUTPUT] [--local-script LOCAL_SCRIPT] [--workers N]
               input filter [filter_args] [filter [filter_args]] ...
             """
             )
@@ -40,6 +46,8 @@ def create_core_parser():
             help='Output only sites passing the filters')
     parser.add_argument('--local-script', action='store', default=None,
             help='Python file in current working directory with the filter classes')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+            help='Filter byte ranges of the input in N processes, output order is kept')
     parser.add_argument('rest', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
 
     return parser
@@ -67,9 +75,73 @@ def create_core_parser():
     # TODO: allow filter specification by short name
     # TODO: flag that writes filter output into INFO column
     # TODO: argument use implies filter use
-    # TODO: parallelize
     # TODO: prevent plugins raising an exception from crashing the script
 
+def block_fields(chain):
+    """ FORMAT fields the chain reads from arrays, None if no filter uses arrays """
+    wanted = [filt.block_fields for filt in chain if filt.block_fields is not None]
+    if not wanted:
+        return None
+    fields = []
+    for names in wanted:
+        fields.extend(name for name in names if name not in fields)
+    return fields
+
+def block_rows(block, rows):
+    """ The ``rows`` of a block of arrays, None stays None """
+    if block is None:
+        return None
+    calldata = dict((name, array[rows]) for name, array in block.calldata.items())
+    return block._replace(CHROM=block.CHROM[rows], POS=block.POS[rows],
+                          REF=block.REF[rows], ALT=block.ALT[rows],
+                          QUAL=block.QUAL[rows], calldata=calldata)
+
+def filter_records(reader, chain, short_circuit=True, drop_filtered=False):
+    """ Run the filter chain over blocks of records, yield the records to output
+
+        Filters run in chain order.  When a record stops at its first
+        failed filter (short circuit or dropping filtered sites) the later
+        filters only see the records no earlier filter failed.
+    """
+    fields = block_fields(chain)
+    stop_early = short_circuit or drop_filtered
+    for records, block in reader.iter_record_blocks(BLOCK_SIZE, fields):
+        failed = [[] for record in records]
+        rows = range(len(records))
+        for filt in chain:
+            if stop_early:
+                rows = [i for i in rows if not failed[i]]
+                if not rows: break
+            if len(rows) == len(records):
+                mask = filt.filter_block(records, block)[0]
+            else:
+                mask = filt.filter_block([records[i] for i in rows],
+                                         block_rows(block, rows))[0]
+            for i, filtered in zip(rows, mask):
+                if filtered: failed[i].append(filt)
+
+        for record, record_failed in zip(records, failed):
+            # save some work by skipping the rest of the code
+            if drop_filtered and record_failed: continue
+
+            for filt in record_failed:
+                record.add_filter(filt.filter_name())
+
+            # use PASS only if other filter names appear in the FILTER column
+            #FIXME: is this good idea?
+            if record.FILTER is None and not drop_filtered: record.FILTER = 'PASS'
+            yield record
+
+def filter_chunk(reader, chain, short_circuit, drop_filtered):
+    """ Filter one chunk of the input in a worker, return the output lines """
+    out = StringIO()
+    writer = vcf.Writer(out, reader)
+    # the header is written once, by the main process
+    out.seek(0)
+    out.truncate()
+    writer.write_records(filter_records(reader, chain, short_circuit, drop_filtered))
+    return out.getvalue()
+
 def main():
     # dynamically build the list of available filters
     filters = {}
@@ -126,6 +198,9 @@ def main():
         parser.print_help()
         parser.exit()
 
+    if args.workers > 1 and args.input is sys.stdin:
+        sys.exit("--workers needs an input file, not STDIN")
+
     inp = vcf.Reader(args.input)
 
     # build filter chain
@@ -139,30 +214,24 @@ def main():
         inp.filters[f.filter_name()] = _Filter(f.filter_name(), short_doc)
 
     # output must be created after all the filter records have been added
-    output = vcf.Writer(args.output, inp)
+    stream = args.output
+    if isinstance(stream, str):
+        stream = open(stream, 'w')
+    output = vcf.Writer(stream, inp)
 
     # apply filters
     short_circuit = not args.no_short_circuit
     drop_filtered = args.no_filtered
 
-    for record in inp:
-        output_record = True
-        for filt in chain:
-            result = filt(record)
-            if result == None: continue
-
-            # save some work by skipping the rest of the code
-            if drop_filtered:
-                output_record = False
-                break
-
-            record.add_filter(filt.filter_name())
-            if short_circuit: break
+    if args.workers > 1:
+        work = functools.partial(filter_chunk, chain=chain,
+                short_circuit=short_circuit, drop_filtered=drop_filtered)
+        for lines in parallel.map_chunks(args.input.name, work, workers=args.workers):
+            stream.write(lines)
+    else:
+        output.write_records(filter_records(inp, chain, short_circuit, drop_filtered))
 
-        if output_record:
-            # use PASS only if other filter names appear in the FILTER column
-            #FIXME: is this good idea?
-            if record.FILTER is None and not drop_filtered: record.FILTER = 'PASS'
-            output.write_record(record)
+    if stream is not args.output:
+        stream.close()
 
 if __name__ == '__main__': main()
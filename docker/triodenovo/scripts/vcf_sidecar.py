@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+""" Convert a VCF file into a columnar NumPy sidecar (see vcf.columnar)
+
+The sidecar is written next to the input as <input>.npc unless --output is
+given.  Later runs can open it with vcf.columnar.ColumnarReader.
+"""
+
+import argparse
+
+from vcf import columnar
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='VCF file to convert')
+    parser.add_argument('--output', help='Sidecar directory [<input>.npc]')
+    parser.add_argument('--fields', default=','.join(columnar.FIELDS),
+            help='Comma separated FORMAT fields to store [%(default)s]')
+    parser.add_argument('--info', default='',
+            help='Comma separated INFO keys to store as numeric columns')
+    parser.add_argument('--chunk-size', type=int, default=columnar.CHUNK_SIZE,
+            help='Sites per chunk [%(default)s]')
+    parser.add_argument('--force', action='store_true',
+            help='Convert even if an up to date sidecar exists')
+    args = parser.parse_args()
+
+    fields = [f for f in args.fields.split(',') if f]
+    info = [k for k in args.info.split(',') if k]
+    if not args.force and columnar.is_fresh(args.input, args.output,
+                                            fields=fields, info=info):
+        print(columnar.sidecar_path(args.input) if args.output is None
+              else args.output)
+        return
+    print(columnar.write_sidecar(args.input, args.output, fields=fields,
+                                 info=info, chunk_size=args.chunk_size))
+
+
+if __name__ == '__main__':
+    main()
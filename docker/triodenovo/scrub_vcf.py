@@ -54,9 +54,9 @@ def main():
     build = os.environ['build']
     fam_id = os.environ['fam_id']
     vcf = '{}.vcf'.format(fam_id)
-    idx = '{}.idx'.format(vcf)
 
-    in_files = [vcf, idx]
+    # split_families writes no GATK .idx next to the family vcf
+    in_files = [vcf]
 
     print(in_files)
 
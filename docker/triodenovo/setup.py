@@ -32,7 +32,7 @@ setup(
     name='PyVCF',
     packages=['vcf', 'vcf.test'],
     scripts=['scripts/vcf_melt', 'scripts/vcf_filter.py',
-             'scripts/vcf_sample_filter.py'],
+             'scripts/vcf_sample_filter.py', 'scripts/vcf_sidecar.py'],
     author='James Casbon and @jdoughertyii',
     author_email='casbon@gmail.com',
     description='Variant Call Format (VCF) parser for Python',
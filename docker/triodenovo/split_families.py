@@ -0,0 +1,63 @@
+import SDK
+import os
+from datetime import datetime
+
+def main():
+    prefix = os.environ['prefix']
+    param_file = os.environ['param_file']
+    ref_uri = os.environ['ref_uri']
+    in_uri = os.environ['in_uri']
+    out_uri = os.environ['out_uri']
+    assets_uri = os.environ['assets_uri']
+    build = os.environ['build']
+    # s3://bucket/key of the fam file, and the i/n shard of its families
+    fam_uri = os.environ['fam_uri']
+    fam_shard = os.environ['fam_shard']
+    # the vCPUs of the job, cpu_count() is the host's under Batch
+    threads = os.environ.get('threads', '1')
+    vcf = '{}.gt.snp.indel.recal.vcf'.format(prefix)
+    fam_file = fam_uri.split('/')[-1]
+
+    in_files = [vcf]
+
+    print(in_files)
+
+    start_time = datetime.now()
+    print('SPLIT FAMILIES {} for {} was started at {}.'.format(fam_shard, prefix, str(start_time)))
+
+    print('Downloading {}.'.format(fam_uri))
+    SDK.s3.Bucket(fam_uri.split('/')[2]).download_file(
+        '/'.join(fam_uri.split('/')[3:]), fam_file)
+
+    task = SDK.Task(
+        step='split_families',
+        prefix=prefix,
+        threads=threads,
+        in_files=in_files,
+        param_file=param_file,
+        ref_uri=ref_uri,
+        in_uri=in_uri,
+        out_uri=out_uri,
+        assets_uri=assets_uri,
+        fam_file=fam_file,
+        fam_shard=fam_shard)
+    dir_contents = os.listdir('.')
+
+    print('Current dir contents: {}'.format(str(dir_contents)))
+    task.get_reference_files(build)
+    task.download_files('INPUT')
+    task.download_files('REF')
+    task.download_files('PARAMS')
+    task.build_cmd()
+    task.run_cmd()
+    task.index_results()
+    task.upload_results()
+    task.cleanup()
+
+    end_time = datetime.now()
+    print('SPLIT FAMILIES {} for {} ended at {}.'.format(fam_shard, prefix, str(end_time)))
+    total_time = end_time - start_time
+    print('Total time for SPLIT FAMILIES was {}.'.format(str(total_time)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+""" Split a cohort VCF into one VCF and PED file per family (see vcf.families)
+
+The fam file lists a family id and the father, child and mother samples
+per line, tab separated.  The cohort is read once for all the families;
+--shard i/n takes every n-th family from the i-th, to spread the families
+over n jobs.
+"""
+
+import argparse
+import multiprocessing
+
+from vcf import families
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-i', dest='vcf', required=True, help='Cohort VCF')
+    parser.add_argument('--fam', required=True, help='Fam file')
+    parser.add_argument('--out-dir', default='.',
+            help='Directory for the family files [%(default)s]')
+    parser.add_argument('--suffix', default='.vcf',
+            help='Family VCF suffix, BGZF compressed if it ends in .gz [%(default)s]')
+    parser.add_argument('--shard', default='0/1',
+            help='Split only shard i of n of the families, as i/n [%(default)s]')
+    parser.add_argument('--workers', type=int, default=1,
+            help='Split shards of the cohort in this many processes, 0 for all CPUs')
+    parser.add_argument('--buffer-mb', type=int,
+            default=families.BUFFER_SIZE >> 20,
+            help='Megabytes of output buffered in memory [%(default)s]')
+    parser.add_argument('--variant-only', action='store_true',
+            help='Drop records where the family has no non reference allele')
+    args = parser.parse_args()
+
+    shard, n_shards = [int(n) for n in args.shard.split('/')]
+    selected = families.shard_families(families.read_fam_file(args.fam),
+                                       shard, n_shards)
+    vcf_paths, ped_paths = families.split_families(
+        args.vcf, selected, args.out_dir, args.suffix,
+        workers=args.workers or multiprocessing.cpu_count(),
+        buffer_size=args.buffer_mb << 20, variant_only=args.variant_only)
+    for path in vcf_paths + ped_paths:
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
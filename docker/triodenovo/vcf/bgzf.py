@@ -0,0 +1,416 @@
+"""
+Blocked GNU Zip Format (BGZF) support.
+
+BGZF files, as written by bgzip, htslib and Sentieon, are a series of
+gzip members holding at most 64KB of data each.  Every member records its
+own compressed size in a 'BC' extra subfield, so blocks can be located
+without inflating anything and inflated independently of each other.
+
+``BgzfReader`` uses that to inflate the blocks ahead of the read position
+on a thread pool (zlib releases the GIL while it inflates), so reading a
+compressed VCF is no longer limited by decompression on one core.
+``BgzfWriter`` likewise deflates the blocks it writes on a thread pool.
+"""
+
+import bisect
+import collections
+import multiprocessing
+import os
+import struct
+import threading
+import zlib
+from multiprocessing.pool import ThreadPool
+
+
+# ID1 ID2 CM FLG MTIME XFL OS XLEN
+_HEADER = struct.Struct('<4BI2BH')
+_SUBFIELD = struct.Struct('<2BH')
+_FEXTRA = 4
+
+#: most data bgzip puts in one block, leaving room for incompressible input
+MAX_BLOCK_DATA = 0xff00
+#: the empty block that marks the end of a BGZF file
+EOF_BLOCK = (b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43'
+             b'\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+#: blocks inflated ahead of the read position when reading with threads
+READ_AHEAD = 16
+#: blocks a threaded writer keeps in flight per thread
+WRITE_QUEUE = 4
+
+# thread pools shared by all readers, keyed by size; the pid is checked so
+# that a forked worker process makes its own
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def default_threads():
+    """ Inflating threads to use: one per CPU besides the parsing one, at
+        most four, and none on a single CPU """
+    return max(min(multiprocessing.cpu_count() - 1, 4), 0)
+
+
+def _pool(threads):
+    with _pools_lock:
+        pid, pool = _pools.get(threads, (None, None))
+        if pid != os.getpid():
+            pool = ThreadPool(threads)
+            _pools[threads] = (os.getpid(), pool)
+        return pool
+
+
+def is_bgzf(filename):
+    """ Return True if the file starts with a BGZF block """
+    with open(filename, 'rb') as handle:
+        return _block_size(handle) is not None
+
+
+def at_block(handle):
+    """ Return True if a seekable handle is at a BGZF block, without moving it """
+    pos = handle.tell()
+    try:
+        return _block_size(handle) is not None
+    finally:
+        handle.seek(pos)
+
+
+def _block_size(handle):
+    """ Read a block header, return the total block size or None.
+
+        The handle is left just past the extra field.  None is returned at
+        end of file or when the data is not a BGZF block.
+    """
+    header = handle.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+    id1, id2, cm, flg, mtime, xfl, os, xlen = _HEADER.unpack(header)
+    if (id1, id2, cm) != (31, 139, 8) or not flg & _FEXTRA:
+        return None
+    extra = handle.read(xlen)
+    pos = 0
+    while pos + _SUBFIELD.size <= len(extra):
+        si1, si2, slen = _SUBFIELD.unpack_from(extra, pos)
+        if (si1, si2, slen) == (66, 67, 2):
+            return struct.unpack_from('<H', extra, pos + _SUBFIELD.size)[0] + 1
+        pos += _SUBFIELD.size + slen
+    return None
+
+
+def iter_block_offsets(handle):
+    """ Yield ``(offset, size)`` of every block, reading only the headers """
+    handle.seek(0)
+    offset = 0
+    while True:
+        size = _block_size(handle)
+        if size is None:
+            return
+        yield offset, size
+        offset += size
+        handle.seek(offset)
+
+
+def inflate_block(raw):
+    """ Inflate the raw bytes of one complete block """
+    xlen = struct.unpack_from('<H', raw, 10)[0]
+    return zlib.decompress(raw[12 + xlen:-8], -15)
+
+
+def read_block(handle):
+    """ Read and inflate the block at the current position.
+
+        Returns ``(offset, data)`` or None at the end of the file.
+    """
+    offset = handle.tell()
+    size = _block_size(handle)
+    if size is None:
+        return None
+    handle.seek(offset)
+    return offset, inflate_block(handle.read(size))
+
+
+def compress_block(data, level=6):
+    """ Deflate at most ``MAX_BLOCK_DATA`` bytes into one complete block """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    return (_HEADER.pack(31, 139, 8, _FEXTRA, 0, 0, 255, 6)
+            + _SUBFIELD.pack(66, 67, 2) + struct.pack('<H', len(cdata) + 25)
+            + cdata
+            + struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data)))
+
+
+class BgzfReader(object):
+    """ Binary reader for BGZF files addressed by virtual offsets.
+
+        A virtual offset is ``block_offset << 16 | offset_in_block``, the
+        file positions stored in tabix and CSI indexes.  ``seek`` and
+        ``tell`` work on virtual offsets; reads return inflated bytes.
+
+        With ``threads`` the ``read_ahead`` blocks after the current one
+        are read and handed to a pool of that many threads to inflate.
+        Iterating yields lines, decoded when an ``encoding`` is given.
+    """
+
+    def __init__(self, filename=None, fileobj=None, threads=0,
+                 read_ahead=READ_AHEAD, encoding=None):
+        self._handle = fileobj if fileobj is not None else open(filename, 'rb')
+        self._threads = threads
+        self._read_ahead = read_ahead if threads else 0
+        self.encoding = encoding
+        # (offset, size, AsyncResult) of the blocks being inflated, in order
+        self._pending = collections.deque()
+        # offset of the next block to queue, None at the end of the file
+        self._ahead = None
+        self._block_offset = 0
+        self._block_size = 0
+        self._data = b''
+        self._within = 0
+        self._load_block(0)
+
+    def _read_raw(self, offset):
+        """ The raw bytes of the block at ``offset``, None past the end """
+        self._handle.seek(offset)
+        size = _block_size(self._handle)
+        if size is None:
+            return None
+        self._handle.seek(offset)
+        return self._handle.read(size)
+
+    def _fill(self):
+        """ Queue the blocks after the current one for inflating """
+        pool = _pool(self._threads)
+        while len(self._pending) < self._read_ahead and self._ahead is not None:
+            raw = self._read_raw(self._ahead)
+            if raw is None:
+                self._ahead = None
+                break
+            self._pending.append(
+                (self._ahead, len(raw), pool.apply_async(inflate_block, (raw,))))
+            self._ahead += len(raw)
+
+    def _load_block(self, offset):
+        self._block_offset = offset
+        self._within = 0
+        if self._pending and self._pending[0][0] == offset:
+            _, self._block_size, result = self._pending.popleft()
+            self._data = result.get()
+        else:
+            # a seek, or no read-ahead: drop what is queued
+            self._pending.clear()
+            raw = self._read_raw(offset)
+            if raw is None:
+                self._ahead = None
+                self._block_size = 0
+                self._data = b''
+                return False
+            self._block_size = len(raw)
+            self._data = inflate_block(raw)
+            self._ahead = offset + len(raw)
+        if self._read_ahead:
+            self._fill()
+        return True
+
+    def _next_block(self):
+        """ Move to the next block with data, False at end of file """
+        while self._block_size:
+            if self._load_block(self._block_offset + self._block_size) and self._data:
+                return True
+        return False
+
+    def seek(self, voffset):
+        """ Move to a virtual offset """
+        block_offset = voffset >> 16
+        if block_offset != self._block_offset or not self._block_size:
+            self._load_block(block_offset)
+        self._within = voffset & 0xffff
+
+    def tell(self):
+        """ The current virtual offset """
+        if self._within >= len(self._data) and self._block_size:
+            # the end of a block is the start of the next one
+            return (self._block_offset + self._block_size) << 16
+        return (self._block_offset << 16) | self._within
+
+    def readline(self):
+        """ Read one line, including the newline, b'' at end of file """
+        parts = []
+        while True:
+            idx = self._data.find(b'\n', self._within)
+            if idx >= 0:
+                parts.append(self._data[self._within:idx + 1])
+                self._within = idx + 1
+                return b''.join(parts)
+            parts.append(self._data[self._within:])
+            self._within = len(self._data)
+            if not self._next_block():
+                return b''.join(parts)
+
+    def read(self, size=-1):
+        """ Read up to ``size`` bytes, everything left if negative """
+        parts = []
+        while size != 0:
+            if self._within >= len(self._data) and not self._next_block():
+                break
+            end = len(self._data) if size < 0 else min(len(self._data), self._within + size)
+            parts.append(self._data[self._within:end])
+            if size > 0:
+                size -= end - self._within
+            self._within = end
+        return b''.join(parts)
+
+    def __iter__(self):
+        """ Iterate over the lines from the current position on.
+
+            Lines are split out of a whole block at a time, so ``tell`` is
+            only meaningful again once the iteration is over.
+        """
+        newline = u'\n' if self.encoding else b'\n'
+        tail = b''
+        while True:
+            data = self._data[self._within:]
+            self._within = len(self._data)
+            if tail:
+                data = tail + data
+            end = data.rfind(b'\n') + 1
+            tail = data[end:]
+            if end:
+                text = data[:end]
+                if self.encoding:
+                    # a block of complete lines never ends inside a character
+                    text = text.decode(self.encoding)
+                lines = text.split(newline)
+                lines.pop()
+                for line in lines:
+                    yield line + newline
+            if not self._next_block():
+                break
+        if tail:
+            yield tail.decode(self.encoding) if self.encoding else tail
+
+    def close(self):
+        self._pending.clear()
+        self._handle.close()
+
+
+class BgzfWriter(object):
+    """ Binary writer of BGZF files, as written by bgzip.
+
+        Data is cut into blocks of ``MAX_BLOCK_DATA`` bytes.  With
+        ``threads`` the blocks are deflated on a pool of that many threads
+        and written in order as they complete.  Text written to a writer
+        with an ``encoding`` is encoded first.  ``close`` writes the end
+        of file marker and closes the file.
+
+        ``position`` counts the bytes of data written.  With
+        ``keep_blocks`` the writer remembers where every block starts, so
+        ``virtual_offset`` can turn such a position into a virtual offset
+        once its block is written.
+    """
+
+    def __init__(self, filename=None, fileobj=None, threads=0, level=6,
+                 encoding=None, keep_blocks=False):
+        self._handle = fileobj if fileobj is not None else open(filename, 'wb')
+        self._threads = threads
+        self.level = level
+        self.encoding = encoding
+        self._buffer = []
+        self._buffered = 0
+        # AsyncResults of the blocks being deflated, in order
+        self._pending = collections.deque()
+        # bytes written to the file so far
+        self._offset = 0
+        self.position = 0
+        # data and file offsets of the blocks, when kept
+        self._block_starts = [] if keep_blocks else None
+        self._block_offsets = [] if keep_blocks else None
+        self._deflated = 0
+        self.closed = False
+
+    def write(self, data):
+        if self.encoding and not isinstance(data, bytes):
+            data = data.encode(self.encoding)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        self.position += len(data)
+        if self._buffered >= MAX_BLOCK_DATA:
+            self._cut_blocks(False)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def _cut_blocks(self, partial):
+        """ Compress the buffered data in whole blocks, and the rest too
+            when ``partial`` """
+        data = b''.join(self._buffer)
+        whole = len(data) if partial else len(data) - len(data) % MAX_BLOCK_DATA
+        for start in range(0, whole, MAX_BLOCK_DATA):
+            self._compress(data[start:start + MAX_BLOCK_DATA])
+        rest = data[whole:]
+        self._buffer = [rest] if rest else []
+        self._buffered = len(rest)
+
+    def _compress(self, data):
+        if self._block_starts is not None:
+            self._block_starts.append(self._deflated)
+        self._deflated += len(data)
+        if not self._threads:
+            self._write_block(compress_block(data, self.level))
+            return
+        self._pending.append(
+            _pool(self._threads).apply_async(compress_block, (data, self.level)))
+        while len(self._pending) > self._threads * WRITE_QUEUE:
+            self._write_block(self._pending.popleft().get())
+
+    def _write_block(self, raw):
+        if self._block_offsets is not None:
+            self._block_offsets.append(self._offset)
+        self._handle.write(raw)
+        self._offset += len(raw)
+
+    def _drain(self):
+        while self._pending:
+            self._write_block(self._pending.popleft().get())
+
+    def tell(self):
+        """ The virtual offset the next byte written will have.
+
+            Waits for the blocks being deflated, so it is not meant to be
+            called for every line.
+        """
+        self._drain()
+        return (self._offset << 16) | self._buffered
+
+    def virtual_offset(self, position):
+        """ The virtual offset of the byte at data ``position``.
+
+            Needs ``keep_blocks``.  Blocks still buffered or being deflated
+            are not placed yet; ``flush`` places everything written.  The
+            end of a block is given as the start of the next one.
+        """
+        self._drain()
+        if position > self._deflated:
+            raise ValueError('Position %d is not written to a block yet'
+                             % position)
+        if position == self._deflated:
+            return self._offset << 16
+        i = bisect.bisect_right(self._block_starts, position) - 1
+        return (self._block_offsets[i] << 16) | (position - self._block_starts[i])
+
+    def flush(self):
+        """ Write everything written so far, ending the current block """
+        self._cut_blocks(True)
+        self._drain()
+        self._handle.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        self._handle.write(EOF_BLOCK)
+        self._handle.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,439 @@
+"""
+Columnar sidecar caches of parsed VCF files.
+
+``write_sidecar`` parses a VCF once into a directory of NumPy ``.npy``
+files.  Sites are stored in chunks, like the record batches of Arrow, and
+every chunk has one file per column:
+
+* ``CHROM``, ``ID``, ``REF``, ``ALT``, ``FILTER`` and ``INFO`` hold the
+  text of those VCF columns as Arrow lays out strings: ``<name>.data``
+  (uint8) is the UTF-8 text of all the sites one after another and
+  ``<name>.offsets`` (int64, one more than the sites) where each starts,
+  so a long value costs its own bytes only,
+* ``POS`` (int64) and ``QUAL`` (float64, NaN when missing),
+* ``INFO_<key>`` (float64) for every INFO key asked for, the first value
+  of the key, NaN when missing, 1 or 0 for flags,
+* ``GT_text`` with the genotype strings and ``GT`` plus the other FORMAT
+  fields as sites x samples arrays, exactly as ``Reader.iter_blocks``
+  builds them.
+
+``meta.json`` keeps the header lines, the stored fields, the number of
+sites per chunk, the path, mtime and size of the source VCF and the
+options the sidecar was written with.
+
+``ColumnarReader`` reads a sidecar back.  The arrays are memory-mapped, so
+later passes over the cohort need no parsing at all: ``iter_blocks`` hands
+out the stored arrays and iterating the reader builds ``_Record`` objects
+from them, in the same way as ``Reader`` does.
+
+requires numpy
+"""
+
+import itertools
+import json
+import os
+import shutil
+import sys
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from model import _Call, _Record, make_calldata_tuple
+from parser import Reader, _Block
+
+
+#: appended to the VCF filename to name its sidecar directory
+SUFFIX = '.npc'
+#: sites per chunk
+CHUNK_SIZE = 100000
+#: FORMAT fields stored by default
+FIELDS = ('GT', 'DP', 'GQ', 'PL')
+#: version of the sidecar layout, bumped on incompatible changes
+LAYOUT_VERSION = 2
+
+_SITE_COLUMNS = ('CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO')
+_TEXT_COLUMNS = ('CHROM', 'ID', 'REF', 'ALT', 'FILTER', 'INFO')
+
+
+def sidecar_path(filename):
+    """ The default sidecar directory of a VCF file """
+    return filename + SUFFIX
+
+
+def _source_stat(filename):
+    stat = os.stat(filename)
+    return {'path': os.path.abspath(filename), 'mtime': stat.st_mtime,
+            'size': stat.st_size}
+
+
+def _options(fields, info, kwargs):
+    """ The ``write_sidecar`` options as stored in meta.json """
+    fields = ['GT'] + [field for field in fields if field != 'GT']
+    options = {'fields': fields, 'info': list(info), 'reader': kwargs}
+    # as read back, e.g. tuples become lists
+    return json.loads(json.dumps(options, sort_keys=True, default=repr))
+
+
+def _text_array(values):
+    """ Fixed width byte string array of some text values """
+    if sys.version > '3':
+        values = [value.encode('utf-8') for value in values]
+    return numpy.array(values, dtype=bytes)
+
+
+class TextColumn(object):
+    """ A stored text column, value ``i`` is ``data[offsets[i]:offsets[i + 1]]`` """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return _text(self.data[self.offsets[i]:self.offsets[i + 1]].tobytes())
+
+    def tolist(self):
+        """ All the values as text """
+        data = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        return [_text(data[start:end])
+                for (start, end) in zip(offsets, offsets[1:])]
+
+
+def _text_column(values):
+    """ The offsets and data arrays of some text values """
+    if sys.version > '3':
+        values = [value.encode('utf-8') for value in values]
+    offsets = numpy.zeros(len(values) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(value) for value in values], out=offsets[1:])
+    data = b''.join(values)
+    if not data:
+        return offsets, numpy.zeros(0, dtype=numpy.uint8)
+    return offsets, numpy.frombuffer(data, dtype=numpy.uint8)
+
+
+def _object_array(values):
+    array = numpy.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _text(value):
+    """ A stored byte string as text """
+    if sys.version > '3':
+        return value.decode('utf-8')
+    return value
+
+
+def _native(value):
+    """ A string read back from meta.json as ``str`` """
+    if sys.version > '3':
+        return value
+    return value.encode('utf-8')
+
+
+def _info_value(info_str, key, flag):
+    """ First value of ``key`` in a raw INFO column as a float """
+    for entry in info_str.split(';'):
+        name, _, value = entry.partition('=')
+        if name != key:
+            continue
+        if flag:
+            return 1.0
+        value = value.split(',', 1)[0]
+        try:
+            return float(value)
+        except ValueError:
+            return numpy.nan
+    return 0.0 if flag else numpy.nan
+
+
+def _gt_text(reader, rows):
+    """ The GT strings of the calls of some split data lines """
+    n_samples = len(reader.samples)
+    texts = []
+    for row in rows:
+        keys = row[8].split(':') if len(row) > 8 else []
+        if 'GT' not in keys:
+            texts.append(['.'] * n_samples)
+            continue
+        j = keys.index('GT')
+        calls = [sample.split(':') for sample in reader._sample_fields(row)]
+        texts.append([call[j] if len(call) > j else '.' for call in calls])
+    if not texts or not n_samples:
+        return numpy.empty((len(rows), n_samples), dtype='S1')
+    return _text_array([gt for site in texts for gt in site]).reshape(
+        len(rows), n_samples)
+
+
+def write_sidecar(filename, path=None, fields=FIELDS, info=(),
+                  chunk_size=CHUNK_SIZE, **kwargs):
+    """ Parse a VCF into a columnar sidecar directory and return its path.
+
+        ``path`` defaults to the filename with ``SUFFIX`` appended.
+        ``fields`` lists the FORMAT fields to store, GT is always stored;
+        every field must be one that ``Reader.iter_blocks`` accepts.
+        ``info`` lists INFO keys to store as numeric columns, the whole
+        INFO text is stored either way.  Other keyword arguments go to the
+        ``Reader``, e.g. ``samples`` to keep only some samples.
+
+        The sidecar is written next to its final location and renamed into
+        place, so a reader never sees a half written one.
+    """
+    if not numpy:
+        raise Exception('numpy not available, try "pip install numpy"?')
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be at least 1')
+
+    path = path or sidecar_path(filename)
+    fields = ['GT'] + [field for field in fields if field != 'GT']
+    reader = Reader(filename=filename, **kwargs)
+    specs = [reader._block_field_spec(field) for field in fields]
+    flags = dict((key, key in reader.infos and reader.infos[key].type == 'Flag')
+                 for key in info)
+
+    tmp_path = '%s.tmp%d' % (path, os.getpid())
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    try:
+        chunks = []
+        while True:
+            lines = list(itertools.islice(reader.reader, chunk_size))
+            if not lines:
+                break
+            block = reader._parse_block(lines, specs)
+            rows = [reader._split_row(line) for line in lines]
+            columns = {
+                'POS': block.POS,
+                'QUAL': block.QUAL,
+                'GT_text': _gt_text(reader, rows),
+            }
+            for name, values in (('CHROM', block.CHROM.tolist()),
+                                 ('ID', [row[2] for row in rows]),
+                                 ('REF', block.REF.tolist()),
+                                 ('ALT', [row[4] for row in rows]),
+                                 ('FILTER', [row[6] for row in rows]),
+                                 ('INFO', [row[7] for row in rows])):
+                offsets, data = _text_column(values)
+                columns[name + '.offsets'] = offsets
+                columns[name + '.data'] = data
+            for key in info:
+                columns['INFO_' + key] = numpy.array(
+                    [_info_value(row[7], key, flags[key]) for row in rows],
+                    dtype=numpy.float64)
+            columns.update(block.calldata)
+
+            chunk_dir = os.path.join(tmp_path, '%06d' % len(chunks))
+            os.mkdir(chunk_dir)
+            for name, values in columns.items():
+                numpy.save(os.path.join(chunk_dir, name + '.npy'), values)
+            chunks.append(len(lines))
+
+        meta = {
+            'version': LAYOUT_VERSION,
+            'source': _source_stat(filename),
+            'header': reader._header_lines + [
+                '#' + '\t'.join(reader._column_headers + reader.samples)],
+            'fields': fields,
+            'info': list(info),
+            'chunks': chunks,
+            'options': _options(fields, info, kwargs),
+        }
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as handle:
+            json.dump(meta, handle)
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+    except:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return path
+
+
+def is_fresh(filename, path=None, fields=FIELDS, info=(), **kwargs):
+    """ True if the sidecar of ``filename`` exists, matches the file and
+        was written with the same ``write_sidecar`` options; ``chunk_size``
+        is not compared.
+    """
+    kwargs.pop('chunk_size', None)
+    path = path or sidecar_path(filename)
+    try:
+        with open(os.path.join(path, 'meta.json')) as handle:
+            meta = json.load(handle)
+    except (IOError, OSError, ValueError):
+        return False
+    source = meta.get('source', {})
+    stat = _source_stat(filename)
+    return (meta.get('version') == LAYOUT_VERSION
+            and source.get('mtime') == stat['mtime']
+            and source.get('size') == stat['size']
+            and meta.get('options') == _options(fields, info, kwargs))
+
+
+def open_sidecar(filename, path=None, **kwargs):
+    """ ``ColumnarReader`` over the sidecar of a VCF, converting first when
+        there is no sidecar, the VCF changed since it was written or it was
+        written with other options.  Keyword arguments go to
+        ``write_sidecar``.
+    """
+    path = path or sidecar_path(filename)
+    if not is_fresh(filename, path, **kwargs):
+        write_sidecar(filename, path, **kwargs)
+    return ColumnarReader(path)
+
+
+class ColumnarReader(object):
+    """ Reader-compatible access to a sidecar written by ``write_sidecar``.
+
+        The header attributes (``metadata``, ``infos``, ``formats``,
+        ``samples``, ...) are those of a ``Reader`` over the source VCF, so
+        a ``Writer`` can use this reader as its template.  Iterating yields
+        ``_Record`` objects; their calls only carry the stored FORMAT
+        fields, and numeric fields missing in a call are None.
+
+        ``mmap`` maps the arrays instead of reading them into memory.
+    """
+
+    def __init__(self, path, mmap=True):
+        if not numpy:
+            raise Exception('numpy not available, try "pip install numpy"?')
+        with open(os.path.join(path, 'meta.json')) as handle:
+            meta = json.load(handle)
+        if meta.get('version') != LAYOUT_VERSION:
+            raise ValueError('Unsupported sidecar layout in %s' % path)
+        self.path = path
+        self.filename = meta['source']['path']
+        self.fields = [_native(field) for field in meta['fields']]
+        self.info_fields = [_native(key) for key in meta['info']]
+        self.chunk_sizes = meta['chunks']
+        self.n_sites = sum(self.chunk_sizes)
+        self._mmap_mode = 'r' if mmap else None
+
+        # the header is parsed by a Reader over just the header lines
+        header = [_native(line) for line in meta['header']]
+        self._template = Reader(StringIO('\n'.join(header) + '\n'))
+        for attr in ('metadata', 'infos', 'filters', 'alts', 'formats',
+                     'contigs', 'samples', '_sample_indexes',
+                     '_header_lines', '_column_headers'):
+            setattr(self, attr, getattr(self._template, attr))
+        self._specs = [self._template._block_field_spec(field)
+                       for field in self.fields]
+        self._records = None
+
+    def __len__(self):
+        return self.n_sites
+
+    def chunk(self, index):
+        """ The arrays of one chunk as a dict keyed by column name, text
+            columns as ``TextColumn`` """
+        chunk_dir = os.path.join(self.path, '%06d' % index)
+
+        def load(name):
+            return numpy.load(os.path.join(chunk_dir, name + '.npy'),
+                              mmap_mode=self._mmap_mode)
+
+        names = (['POS', 'QUAL', 'GT_text'] + self.fields
+                 + ['INFO_' + key for key in self.info_fields])
+        columns = dict((name, load(name)) for name in names)
+        for name in _TEXT_COLUMNS:
+            columns[name] = TextColumn(load(name + '.offsets'),
+                                       load(name + '.data'))
+        return columns
+
+    def iter_chunks(self):
+        """ Iterate over the column dicts of all the chunks """
+        for index in range(len(self.chunk_sizes)):
+            yield self.chunk(index)
+
+    def iter_blocks(self):
+        """ Iterate over the sidecar as ``Block`` namedtuples, one per chunk.
+
+            ``POS``, ``QUAL`` and ``calldata`` are the stored arrays, the
+            same as ``Reader.iter_blocks`` returns for the stored fields.
+            ``CHROM``, ``REF`` and ``ALT`` are object arrays of text, ALT
+            keeps the comma separated text of the VCF column.
+        """
+        for columns in self.iter_chunks():
+            yield _Block(_object_array(columns['CHROM'].tolist()),
+                         columns['POS'],
+                         _object_array(columns['REF'].tolist()),
+                         _object_array(columns['ALT'].tolist()),
+                         columns['QUAL'],
+                         dict((field, columns[field]) for field in self.fields))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        '''Return the next record in the sidecar.'''
+        if self._records is None:
+            self._records = self._iter_records()
+        return next(self._records)
+
+    next = __next__  # Python 2
+
+    def _call_values(self, name, dtype, missing, single, values):
+        """ Python values of one field for the calls of one chunk """
+        if dtype is numpy.int8:
+            # GT keeps its text, '.' included, as in Reader
+            return values
+        if missing != missing:
+            mask = numpy.isnan(values)
+            # the shortest text of a float32 is the value in the VCF
+            rows = values.astype(str).astype(numpy.float64).tolist()
+        else:
+            mask = values == missing
+            rows = values.tolist()
+        if single:
+            return [[None if m else v for (v, m) in zip(row, row_mask)]
+                    for (row, row_mask) in zip(rows, mask.tolist())]
+        return [[[v for (v, m) in zip(call, call_mask) if not m] or None
+                 for (call, call_mask) in zip(row, row_mask)]
+                for (row, row_mask) in zip(rows, mask.tolist())]
+
+    def _iter_records(self):
+        template = self._template
+        fmt = ':'.join(self.fields)
+        samp_fmt = make_calldata_tuple(self.fields)
+        samples = self.samples
+        for columns in self.iter_chunks():
+            calls = []
+            for (name, dtype, missing, single) in self._specs:
+                if name == 'GT':
+                    gts = [[_text(gt) for gt in site]
+                           for site in columns['GT_text'].tolist()]
+                    calls.append(self._call_values(name, dtype, missing,
+                                                   single, gts))
+                else:
+                    calls.append(self._call_values(name, dtype, missing,
+                                                   single, columns[name]))
+
+            site_columns = [columns[name].tolist() for name in _SITE_COLUMNS]
+            for i, (chrom, pos, ID, ref, alt, qual, filt, info) in \
+                    enumerate(zip(*site_columns)):
+                if qual != qual:
+                    qual = None
+                elif qual == int(qual):
+                    qual = int(qual)
+                record = _Record(
+                    chrom, pos, ID if ID != '.' else None, ref,
+                    template._map(template._parse_alt, alt.split(',')),
+                    qual, template._parse_filter(filt),
+                    template._parse_info(info), fmt,
+                    self._sample_indexes)
+                record.samples = [
+                    _Call(record, sample, samp_fmt(*values))
+                    for (sample, values) in
+                    zip(samples, zip(*[field[i] for field in calls]))]
+                yield record
@@ -1,13 +1,15 @@
-from model import _Call
+# cython: language_level=3str
+from vcf.model import _Call
 
-cdef _map(func, iterable, bad=['.', '']):
+cdef list _map(func, iterable):
     '''``map``, but make bad values None.'''
-    return [func(x) if x not in bad else None
+    return [func(x) if x != '.' and x != '' else None
             for x in iterable]
 
 INTEGER = 'Integer'
 FLOAT = 'Float'
 NUMERIC = 'Numeric'
+FLAG = 'Flag'
 
 def _parse_filter(filt_str):
     '''Parse the FILTER field of a VCF entry into a Python list
@@ -22,74 +24,90 @@ def _parse_filter(filt_str):
     else:
         return filt_str.split(';')
 
-def parse_samples(
-        list names, list samples, samp_fmt,
-        list samp_fmt_types, list samp_fmt_nums, site):
+def parse_info(info_str, dict converters, make_converter):
+    '''Parse the INFO field of a VCF entry into a dictionary of Python
+    types, with the per key ``converters`` of the Reader.
 
-    cdef char *name, *fmt, *entry_type, *sample
-    cdef int i, j
-    cdef list samp_data = []
-    cdef dict sampdict
-    cdef list sampvals
-    n_samples = len(samples)
-    n_formats = len(samp_fmt._fields)
-
-    for i in range(n_samples):
-        name = names[i]
-        sample = samples[i]
+    NOTE: this method has a python equivalent and care must be taken
+    to keep the two methods equivalent
+    '''
+    if info_str == '.':
+        return {}
 
-        # parse the data for this sample
-        sampdat = [None] * n_formats
+    cdef dict retdict = {}
 
-        sampvals = sample.split(':')
+    for entry in info_str.split(';'):
+        ID, sep, value = entry.partition('=')
+        convert = converters.get(ID)
+        if convert is None:
+            convert = converters[ID] = make_converter(ID)
+        retdict[ID] = convert(value if sep else None)
 
-        for j in range(n_formats):
-            if j >= len(sampvals):
-                break
-            vals = sampvals[j]
+    return retdict
 
-            # short circuit the most common
-            if samp_fmt._fields[j] == 'GT':
-                sampdat[j] = vals
-                continue
-            # genotype filters are a special case
-            elif samp_fmt._fields[j] == 'FT':
-                sampdat[j] = _parse_filter(vals)
-                continue
-            elif not vals or vals == '.':
-                sampdat[j] = None
-                continue
-
-            entry_type = samp_fmt_types[j]
-            # TODO: entry_num is None for unbounded lists
-            entry_num = samp_fmt_nums[j]
-
-            # we don't need to split single entries
-            if entry_num == 1:
-                if entry_type == INTEGER:
-                    try:
-                        sampdat[j] = int(vals)
-                    except ValueError:
-                        sampdat[j] = float(vals)
-                elif entry_type == FLOAT or entry_type == NUMERIC:
-                    sampdat[j] = float(vals)
-                else:
-                    sampdat[j] = vals
-                continue
+def parse_sample(name, sample, samp_fmt,
+                 list samp_fmt_types, list samp_fmt_nums, site):
+    '''Parse a single sample entry into a ``_Call``.
 
-            vals = vals.split(',')
+    NOTE: this method has a python equivalent and care must be taken
+    to keep the two methods equivalent
+    '''
+    cdef tuple fields = samp_fmt._fields
+    cdef Py_ssize_t j
+    cdef Py_ssize_t n_formats = len(fields)
+    cdef list sampdat = [None] * n_formats
+    cdef list sampvals = sample.split(':')
+
+    for j in range(min(n_formats, len(sampvals))):
+        vals = sampvals[j]
+
+        # short circuit the most common
+        if fields[j] == 'GT':
+            sampdat[j] = vals
+            continue
+        # genotype filters are a special case
+        elif fields[j] == 'FT':
+            sampdat[j] = _parse_filter(vals)
+            continue
+        elif not vals or vals == '.':
+            sampdat[j] = None
+            continue
+
+        entry_type = samp_fmt_types[j]
+        # TODO: entry_num is None for unbounded lists
+        entry_num = samp_fmt_nums[j]
+
+        # we don't need to split single entries
+        if entry_num == 1:
             if entry_type == INTEGER:
                 try:
-                    sampdat[j] = _map(int, vals)
+                    sampdat[j] = int(vals)
                 except ValueError:
-                    sampdat[j] = map(float, vals)
+                    sampdat[j] = float(vals)
             elif entry_type == FLOAT or entry_type == NUMERIC:
-                sampdat[j] = _map(float, vals)
+                sampdat[j] = float(vals)
             else:
                 sampdat[j] = vals
+            continue
 
-        # create a call object
-        call = _Call(site, name, samp_fmt(*sampdat))
-        samp_data.append(call)
+        vals = vals.split(',')
+        if entry_type == INTEGER:
+            try:
+                sampdat[j] = _map(int, vals)
+            except ValueError:
+                sampdat[j] = _map(float, vals)
+        elif entry_type == FLOAT or entry_type == NUMERIC:
+            sampdat[j] = _map(float, vals)
+        else:
+            sampdat[j] = vals
 
-    return samp_data
+    # create a call object
+    return _Call(site, name, samp_fmt(*sampdat))
+
+def parse_samples(
+        list names, list samples, samp_fmt,
+        list samp_fmt_types, list samp_fmt_nums, site):
+    '''Parse all sample entries of a record into a list of ``_Call``'''
+    return [parse_sample(names[i], samples[i], samp_fmt,
+                         samp_fmt_types, samp_fmt_nums, site)
+            for i in range(len(samples))]
@@ -0,0 +1,351 @@
+"""
+Splitting a cohort VCF into per family VCFs in one pass.
+
+``split_families`` reads the cohort once and writes, for every trio of a
+fam file, the records of the cohort restricted to its three samples, as
+GATK ``SelectVariants -sn`` does for one family at a time, along with a
+PED file of the trio.  INFO is copied from the cohort unchanged.
+
+Records are not parsed: each line is split into columns once, only up to
+the last column any family needs, and every family takes the site
+columns and its own three sample columns.  The family VCFs are buffered
+in memory, ``buffer_size`` bytes for all of them together, and appended
+to the files in batches, so only one file is open at a time however many
+families there are.
+
+With ``workers`` the cohort is cut into shards (see ``vcf.scatter``)
+split in a process pool, and the parts of each family are concatenated
+in shard order.  ``shard_families`` instead deals the
+families out to a few jobs that each read the cohort once.
+
+``prepare_trio`` then makes a family VCF ready for triodenovo in one more
+pass: the PED file is written for the trio of the fam file, or derived
+from the sample names of the header without one, and only the records
+triodenovo can use are kept, those with PL and DP in
+every call and an ALT other than a lone spanning deletion.
+"""
+
+import collections
+import os
+import shutil
+import tempfile
+
+import bgzf
+import index
+import scatter
+from parallel import _imap
+from parser import Reader
+
+
+#: bytes of family VCF lines held in memory before they are written out
+BUFFER_SIZE = 256 << 20
+
+
+Family = collections.namedtuple('Family', ['fam_id', 'father', 'child', 'mother'])
+
+
+def read_fam_file(filename):
+    """ The families of a fam file, in file order.
+
+        Every line holds a family id and the father, child and mother
+        sample names, tab separated.  A family listed twice keeps the
+        samples of its last line.
+    """
+    families = collections.OrderedDict()
+    with open(filename) as handle:
+        for line in handle:
+            fields = [field.strip() for field in line.split('\t')]
+            if not fields[0] or fields[0].startswith('#'):
+                continue
+            if len(fields) < 4:
+                raise ValueError('Family %s in %s needs father, child and '
+                                 'mother samples' % (fields[0], filename))
+            families[fields[0]] = Family(*fields[:4])
+    return list(families.values())
+
+
+def shard_families(families, shard, n_shards):
+    """ Every ``n_shards``-th family, starting at the ``shard``-th """
+    if not 0 <= shard < n_shards:
+        raise ValueError('shard must be in [0, %d)' % n_shards)
+    return families[shard::n_shards]
+
+
+def ped_lines(family):
+    """ The PED lines of a trio, as ped_from_vcf_main.py writes them """
+    return ['\t'.join((family.fam_id, family.father, '0', '0', '1')),
+            '\t'.join((family.fam_id, family.mother, '0', '0', '2')),
+            '\t'.join((family.fam_id, family.child, family.father,
+                       family.mother, '2'))]
+
+
+def _family_columns(samples, families):
+    """ The cohort columns of the samples of every family, in cohort order """
+    positions = dict((name, i + 9) for (i, name) in enumerate(samples))
+    columns = []
+    missing = []
+    for family in families:
+        trio = (family.father, family.child, family.mother)
+        absent = [name for name in trio if name not in positions]
+        if absent:
+            missing.append('%s (%s)' % (family.fam_id, ', '.join(absent)))
+        else:
+            columns.append(sorted(positions[name] for name in trio))
+    if missing:
+        raise ValueError('Samples missing from the cohort VCF for families '
+                         '%s' % '; '.join(missing))
+    return columns
+
+
+def _is_variant(calls):
+    """ Whether any of the calls has a non reference allele """
+    for call in calls:
+        gt = call.split(':', 1)[0]
+        for allele in gt.replace('|', '/').split('/'):
+            if allele not in ('0', '.'):
+                return True
+    return False
+
+
+class _Outputs(object):
+    """ Buffered writes to many files, appended to them in batches.
+
+        The lines of every file are kept in memory until all buffers
+        together hold ``buffer_size`` bytes, then each file is opened in
+        turn and its lines appended.  Compressed files are written as
+        whole BGZF blocks, deflated on ``threads`` threads; the data short
+        of a block waits for the next batch.
+    """
+
+    def __init__(self, paths, buffer_size=BUFFER_SIZE, compressed=False,
+                 threads=0, encoding='ascii'):
+        self.paths = paths
+        self.buffer_size = buffer_size
+        self.compressed = compressed
+        self.encoding = encoding
+        self._threads = threads
+        self.buffers = [[] for _ in paths]
+        self.buffered = 0
+        self._tails = [b''] * len(paths)
+        for path in paths:
+            open(path, 'wb').close()
+
+    def _blocks(self, i, data, final):
+        if not isinstance(data, bytes):
+            data = data.encode(self.encoding)
+        data = self._tails[i] + data
+        whole = len(data) if final else len(data) - len(data) % bgzf.MAX_BLOCK_DATA
+        blocks = [data[start:start + bgzf.MAX_BLOCK_DATA]
+                  for start in range(0, whole, bgzf.MAX_BLOCK_DATA)]
+        self._tails[i] = data[whole:]
+        if self._threads and len(blocks) > 1:
+            blocks = bgzf._pool(self._threads).map(bgzf.compress_block, blocks)
+        else:
+            blocks = [bgzf.compress_block(block) for block in blocks]
+        if final:
+            blocks.append(bgzf.EOF_BLOCK)
+        return b''.join(blocks)
+
+    def flush(self, final=False):
+        for i, path in enumerate(self.paths):
+            lines = self.buffers[i]
+            if not lines and not final:
+                continue
+            self.buffers[i] = []
+            if self.compressed:
+                with open(path, 'ab') as handle:
+                    handle.write(self._blocks(i, ''.join(lines), final))
+            else:
+                with open(path, 'a') as handle:
+                    handle.writelines(lines)
+        self.buffered = 0
+
+    def close(self):
+        self.flush(final=True)
+
+
+def _project(lines, columns, outputs, variant_only=False):
+    """ Append the lines of every family to ``outputs`` """
+    maxsplit = max(max(trio) for trio in columns) + 1
+    buffers = outputs.buffers
+    for line in lines:
+        row = line.split('\t', maxsplit)
+        if len(row) <= maxsplit:
+            # the last sample column is wanted, without the newline
+            row[-1] = row[-1].rstrip('\r\n')
+        site = '\t'.join(row[:9])
+        keep_all = not variant_only or not row[8].startswith('GT')
+        size = 0
+        for buffer, (a, b, c) in zip(buffers, columns):
+            if keep_all or _is_variant((row[a], row[b], row[c])):
+                text = '%s\t%s\t%s\t%s\n' % (site, row[a], row[b], row[c])
+                buffer.append(text)
+                size += len(text)
+        outputs.buffered += size
+        if outputs.buffered >= outputs.buffer_size:
+            outputs.flush()
+
+
+def _header(reader, samples):
+    return '\n'.join(reader._header_lines + [
+        '#' + '\t'.join(reader._column_headers + samples)]) + '\n'
+
+
+def _split_shard(task):
+    filename, shard, columns, parts, variant_only, buffer_size, kwargs = task
+    reader = scatter.shard_reader(filename, shard, **kwargs)
+    outputs = _Outputs(parts, buffer_size)
+    _project(reader.reader, columns, outputs, variant_only)
+    outputs.close()
+
+
+def split_families(filename, families, out_dir='.', suffix='.vcf', workers=1,
+                   buffer_size=BUFFER_SIZE, variant_only=False, threads=None,
+                   **kwargs):
+    """ Write the VCF and PED file of every family of a cohort VCF.
+
+        The files are ``<fam_id><suffix>`` and ``<fam_id>.ped`` in
+        ``out_dir``; a ``suffix`` ending in .gz gives BGZF compressed VCFs,
+        deflated on ``threads`` threads (default
+        ``bgzf.default_threads()``).  With ``variant_only`` a family only
+        gets the records where one of its samples has a non reference
+        allele, as ``SelectVariants --excludeNonVariants``.  ``workers``
+        processes split the shards of ``vcf.scatter.plan_shards``.  Other
+        keyword arguments are passed on to ``Reader``.
+
+        Returns the paths of the VCFs and of the PED files.
+    """
+    reader = Reader(filename=filename, **kwargs)
+    columns = _family_columns(reader.samples, families)
+    if threads is None:
+        threads = bgzf.default_threads()
+    compressed = suffix.endswith('.gz')
+    vcf_paths = [os.path.join(out_dir, family.fam_id + suffix) for family in families]
+    ped_paths = [os.path.join(out_dir, family.fam_id + '.ped') for family in families]
+    for family, path in zip(families, ped_paths):
+        with open(path, 'w') as handle:
+            handle.write('\n'.join(ped_lines(family)) + '\n')
+    headers = [_header(reader, [reader.samples[i - 9] for i in trio])
+               for trio in columns]
+
+    shards = None
+    if workers > 1:
+        shards = scatter.plan_shards(filename, workers * 4, **kwargs)
+
+    if not shards:
+        outputs = _Outputs(vcf_paths, buffer_size, compressed, threads,
+                           reader.encoding)
+        for buffer, header in zip(outputs.buffers, headers):
+            buffer.append(header)
+        _project(reader.reader, columns, outputs, variant_only)
+        outputs.close()
+        return vcf_paths, ped_paths
+
+    reader._reader.close()
+    tmp_dir = tempfile.mkdtemp(prefix='.split', dir=os.path.abspath(out_dir))
+    try:
+        parts = [[os.path.join(tmp_dir, '%06d.%d.vcf' % (n, i))
+                  for i in range(len(families))] for n in range(len(shards))]
+        tasks = [(filename, shard, columns, shard_parts, variant_only,
+                  buffer_size // workers, kwargs)
+                 for (shard, shard_parts) in zip(shards, parts)]
+        for _ in _imap(_split_shard, tasks, workers):
+            pass
+        for i, (path, header) in enumerate(zip(vcf_paths, headers)):
+            if compressed:
+                out = bgzf.BgzfWriter(path, threads=threads,
+                                      encoding=reader.encoding)
+            else:
+                out = open(path, 'w')
+            with out:
+                out.write(header)
+                for shard_parts in parts:
+                    with open(shard_parts[i]) as part:
+                        shutil.copyfileobj(part, out)
+                    os.remove(shard_parts[i])
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return vcf_paths, ped_paths
+
+
+def trio_from_samples(samples):
+    """ The family of a trio VCF, from the names of its last three samples.
+
+        The father's name starts with D, the mother's with M and the
+        child's with F, followed by the family id, as ped_from_vcf_main.py
+        expects them.
+    """
+    roles = {}
+    for name in samples[-3:]:
+        if name[:1] and name[:1] in 'DMF' and name[:1] not in roles:
+            roles[name[:1]] = name
+    if len(roles) < 3:
+        raise ValueError('No D, M and F samples among %s' % ', '.join(samples[-3:]))
+    return Family(roles['D'][1:], roles['D'], roles['F'], roles['M'])
+
+
+def keep_call_line(line):
+    """ Whether triodenovo can use a data line.
+
+        Every call needs a PL and a DP value other than '.', with as many
+        fields as FORMAT, and ALT must not be a lone spanning deletion.
+    """
+    row = line.rstrip('\r\n').split('\t')
+    if len(row) < 9 or row[4] == '*':
+        return False
+    keys = row[8].split(':')
+    try:
+        pl = keys.index('PL')
+        dp = keys.index('DP')
+    except ValueError:
+        return False
+    n_keys = len(keys)
+    for call in row[9:]:
+        values = call.split(':')
+        if len(values) != n_keys or values[pl] == '.' or values[dp] == '.':
+            return False
+    return True
+
+
+def prepare_trio(filename, output, ped_file=None, family=None, fam_id=None,
+                 **kwargs):
+    """ Write a trio VCF as triodenovo reads it, and its PED file.
+
+        One pass over ``filename`` copies the header and the records
+        ``keep_call_line`` accepts to ``output``, BGZF compressed and
+        tabix indexed if it ends in .gz.  The PED file of ``family``,
+        derived from the header by ``trio_from_samples`` when not given,
+        is written to ``ped_file`` when given; ``fam_id`` replaces the
+        family id of a derived family.  Other keyword arguments are passed
+        on to ``Reader``.
+
+        Returns the family and the number of records kept and dropped.
+    """
+    reader = Reader(filename=filename, **kwargs)
+    if family is None:
+        family = trio_from_samples(reader.samples)
+        if fam_id is not None:
+            family = family._replace(fam_id=fam_id)
+    else:
+        # ValueError for samples the VCF does not have
+        _family_columns(reader.samples, [family])
+    if ped_file is not None:
+        with open(ped_file, 'w') as handle:
+            handle.write('\n'.join(ped_lines(family)) + '\n')
+
+    if output.endswith('.gz'):
+        out = index.IndexingWriter(output, threads=bgzf.default_threads(),
+                                   encoding=reader.encoding)
+    else:
+        out = open(output, 'w')
+    kept = dropped = 0
+    with out:
+        out.write(_header(reader, reader.samples))
+        # reader.reader yields the stripped data lines
+        for line in reader.reader:
+            if keep_call_line(line):
+                out.write(line + '\n')
+                kept += 1
+            else:
+                dropped += 1
+    return family, kept, dropped
@@ -1,7 +1,43 @@
 try:
-    from rpy2 import robjects
-except:
-    robjects = None
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from scipy import stats
+except ImportError:
+    stats = None
+
+
+def error_bias_test(ra, aa, gt):
+    """ Error bias log likelihood ratio for sites x samples arrays.
+
+        ``ra`` and ``aa`` hold the reference and alternate allele depths and
+        ``gt`` the ``gt_type`` codes of each call.  Uncalled samples (code -1)
+        and missing depths (negative or NaN) are left out of a site.
+
+        Returns ``(test_val, ab)``, the log bayes factor of the constant
+        error model over the genotype model and the pooled alternate allele
+        balance, one value per site.  Both are NaN for a site without depth.
+
+        requires numpy and scipy
+    """
+    ra = numpy.atleast_2d(numpy.asarray(ra, dtype=numpy.float64))
+    aa = numpy.atleast_2d(numpy.asarray(aa, dtype=numpy.float64))
+    gt = numpy.atleast_2d(numpy.asarray(gt))
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        use = (gt >= 0) & (ra >= 0) & (aa >= 0)
+        ra = numpy.where(use, ra, 0)
+        aa = numpy.where(use, aa, 0)
+        depth = ra + aa
+        ab = aa.sum(axis=1) / depth.sum(axis=1)
+        gtp = numpy.where(use, 0.5 + 0.48 * (gt - 1), 0.5)
+
+        error_likelihood = stats.binom.logpmf(aa, depth, ab[:, None])
+        gt_likelihood = stats.binom.logpmf(aa, depth, gtp)
+        test_val = error_likelihood.sum(axis=1) - gt_likelihood.sum(axis=1)
+    return test_val, ab
 
 
 class Base(object):
@@ -14,6 +50,10 @@ class Base(object):
     name = 'f'
     """ name used to activate filter and in VCF headers """
 
+    block_fields = None
+    """ FORMAT fields ``filter_block`` reads from ``Reader.iter_blocks``
+        arrays, None if it does not use arrays """
+
     @classmethod
     def customize_parser(self, parser):
         """ hook to extend argparse parser with custom arguments """
@@ -27,11 +67,31 @@ class Base(object):
         """ filter a site, return not None if the site should be filtered """
         raise NotImplementedError('Filters must implement this method')
 
+    def filter_block(self, records, block):
+        """ filter a block of sites at once.
+
+            ``records`` is a list of ``_Record`` and ``block`` the matching
+            ``Block`` of arrays holding ``block_fields``, or None when numpy
+            is missing or the filter declares no fields.  Return ``(mask,
+            values)`` with one entry per site: ``mask`` is True for sites to
+            filter and ``values`` holds what ``__call__`` would return.
+
+            The default calls the filter on every record.
+        """
+        values = [self(record) for record in records]
+        return [value is not None for value in values], values
+
     def filter_name(self):
         """ return the name to put in the VCF header, default is ``name`` + ``threshold`` """
         return '%s%s' % (self.name, self.threshold)
 
 
+def _block_values(mask, values):
+    """ ``(mask, values)`` lists from arrays, values are None where unmasked """
+    mask = mask.tolist()
+    return mask, [v if m else None for (m, v) in zip(mask, values.tolist())]
+
+
 class SiteQuality(Base):
     """ Filter low quailty sites """
 
@@ -45,10 +105,20 @@ class SiteQuality(Base):
     def __init__(self, args):
         self.threshold = args.site_quality
 
+    block_fields = ()
+
     def __call__(self, record):
         if record.QUAL < self.threshold:
             return record.QUAL
 
+    def filter_block(self, records, block):
+        if block is None:
+            return Base.filter_block(self, records, block)
+        # missing QUAL is NaN, never below the threshold
+        with numpy.errstate(invalid='ignore'):
+            mask = (block.QUAL < self.threshold).tolist()
+        return mask, [r.QUAL if m else None for (m, r) in zip(mask, records)]
+
 
 class VariantGenotypeQuality(Base):
     """ Filters sites with only low quality variants.
@@ -64,14 +134,34 @@ class VariantGenotypeQuality(Base):
         parser.add_argument('--genotype-quality', type=int, default=50,
                 help='Filter sites with no genotypes above this quality')
 
-        def __init__(self, args):
-            self.threshold = args.genotype_quality
+    block_fields = ('GT', 'GQ')
+
+    def __init__(self, args):
+        self.threshold = args.genotype_quality
 
     def __call__(self, record):
         if not record.is_monomorphic:
-            vgq = max([x['GQ'] for x in record if x.is_variant])
-            if vgq < self.threshold:
-                return vgq
+            # calls without GQ in their FORMAT count as missing
+            gqs = [getattr(x.data, 'GQ', None) for x in record if x.is_variant]
+            gqs = [gq for gq in gqs if gq is not None]
+            if gqs and max(gqs) < self.threshold:
+                return max(gqs)
+
+    def filter_block(self, records, block):
+        if block is None or not block.calldata['GQ'].shape[1]:
+            return Base.filter_block(self, records, block)
+        gq = block.calldata['GQ']
+        # missing is NaN for a Float GQ and -1 for an Integer one
+        if gq.dtype.kind == 'f':
+            present = ~numpy.isnan(gq)
+        else:
+            present = gq >= 0
+        variant = (block.calldata['GT'] > 0) & present
+        vgq = numpy.where(variant, gq, -numpy.inf).max(axis=1)
+        polymorphic = numpy.array([not r.is_monomorphic for r in records],
+                                  dtype=bool)
+        mask = polymorphic & variant.any(axis=1) & (vgq < self.threshold)
+        return _block_values(mask, vgq)
 
 
 class ErrorBiasFilter(Base):
@@ -90,7 +180,7 @@ class ErrorBiasFilter(Base):
         The test value is the log of the bayes factor.  Higher values
         are more likely to be errors.
 
-        Note: this filter requires rpy2
+        Note: this filter requires numpy and scipy
     """
 
     name = 'eb'
@@ -102,31 +192,8 @@ class ErrorBiasFilter(Base):
 
     def __init__(self, args):
         self.threshold = args.eblr
-        if robjects is None:
-            raise Exception('Please install rpy2')
-        self.ll_test = robjects.r('''
-            function(ra, aa, gt, diag=F) {
-                ra_sum = sum(ra)
-                aa_sum = sum(aa)
-                ab = aa_sum / (ra_sum + aa_sum)
-                gtp = 0.5 + (0.48*(gt-1))
-
-                error_likelihood = log(dbinom(aa, ra+aa, ab))
-                gt_likelihood = log(dbinom(aa, ra+aa, gtp))
-
-                if (diag) {
-                    print(ra)
-                    print(aa)
-                    print(gtp)
-                    print(ab)
-                    print(error_likelihood)
-                    print(gt_likelihood)
-                }
-                error_likelihood = sum(error_likelihood)
-                gt_likelihood = sum(gt_likelihood)
-                c(error_likelihood - gt_likelihood, ab)
-            }
-            ''')
+        if numpy is None or stats is None:
+            raise Exception('Please install numpy and scipy')
 
     def __call__(self, record):
         if record.is_monomorphic:
@@ -138,21 +205,50 @@ class ErrorBiasFilter(Base):
     def bias_test(self, calls):
         calls = [x for x in calls if x.called]
         #TODO: single genotype assumption
-  
+
         try:
             # freebayes
-            ra = robjects.IntVector([x['RO'][0] for x in calls])
-            aa = robjects.IntVector([x['AO'][0] for x in calls])
+            ra = [x['RO'] for x in calls]
+            aa = [x['AO'][0] for x in calls]
         except AttributeError:
             # GATK
-            ra = robjects.IntVector([x['AD'][0] for x in calls])
-            aa = robjects.IntVector([x['AD'][1] for x in calls])
+            ra = [x['AD'][0] for x in calls]
+            aa = [x['AD'][1] for x in calls]
 
-        gt = robjects.IntVector([x.gt_type for x in calls])
-        test_val, ab = self.ll_test(ra, aa, gt)
+        gt = [x.gt_type for x in calls]
+        test_val, ab = error_bias_test(
+            [[_depth(d) for d in ra]], [[_depth(d) for d in aa]], [gt])
+        test_val, ab = float(test_val[0]), float(ab[0])
 
         return test_val < 0, test_val, ab
 
+    def block_test(self, block):
+        """ Test every site of a ``Reader.iter_blocks`` block at once.
+
+            The block must hold ``GT`` and either ``AD`` or ``RO`` and ``AO``
+            calldata.  Returns the ``(test_val, ab)`` arrays of
+            ``error_bias_test``, ``test_val`` is NaN for monomorphic sites.
+        """
+        calldata = block.calldata
+        if 'RO' in calldata and 'AO' in calldata:
+            ra = calldata['RO']
+            aa = calldata['AO'][:, :, 0]
+        else:
+            ra = calldata['AD'][:, :, 0]
+            aa = calldata['AD'][:, :, 1]
+        test_val, ab = error_bias_test(ra, aa, calldata['GT'])
+        monomorphic = numpy.array([alts == ['.'] for alts in block.ALT],
+                                  dtype=bool)
+        test_val[monomorphic] = numpy.nan
+        return test_val, ab
+
+
+def _depth(value):
+    """ Depth of a call as a number, -1 when missing """
+    if isinstance(value, list):
+        value = value[0]
+    return -1 if value is None else value
+
 
 class DepthPerSample(Base):
     'Threshold read depth per sample'
@@ -167,6 +263,8 @@ class DepthPerSample(Base):
     def __init__(self, args):
         self.threshold = args.depth_per_sample
 
+    block_fields = ('DP',)
+
     def __call__(self, record):
         # do not test depth for indels
         if record.is_indel:
@@ -176,6 +274,17 @@ class DepthPerSample(Base):
         if mindepth < self.threshold:
             return mindepth
 
+    def filter_block(self, records, block):
+        if block is None or not block.calldata['DP'].shape[1]:
+            return Base.filter_block(self, records, block)
+        dp = block.calldata['DP']
+        mindepth = dp.min(axis=1)
+        # like min() over the calls, a missing depth (-1 here, None there)
+        # does not count as below the threshold
+        snv = numpy.array([not r.is_indel for r in records], dtype=bool)
+        mask = snv & (mindepth >= 0) & (mindepth < self.threshold)
+        return _block_values(mask, mindepth)
+
 
 class AvgDepthPerSample(Base):
     'Threshold average read depth per sample (read_depth / sample_count)'
@@ -195,6 +304,13 @@ class AvgDepthPerSample(Base):
         if avgcov < self.threshold:
             return avgcov
 
+    def filter_block(self, records, block):
+        if numpy is None or not records or not len(records[0].samples):
+            return Base.filter_block(self, records, block)
+        dp = numpy.array([r.INFO['DP'] for r in records], dtype=float)
+        avgcov = dp / len(records[0].samples)
+        return _block_values(avgcov < self.threshold, avgcov)
+
 
 class SnpOnly(Base):
     'Choose only SNP variants'
@@ -205,5 +321,9 @@ class SnpOnly(Base):
         if not record.is_snp:
             return True
 
+    def filter_block(self, records, block):
+        mask = [not r.is_snp for r in records]
+        return mask, [True if m else None for m in mask]
+
     def filter_name(self):
         return self.name
@@ -0,0 +1,531 @@
+"""
+Tabix (.tbi) and CSI (.csi) index support.
+
+Both formats bin records with the UCSC binning scheme and store, per bin,
+the chunks of BGZF virtual offsets holding its records.  Tabix uses a
+fixed scheme (16kb leaf bins, 5 levels) with a separate linear index,
+CSI makes the scheme configurable and keeps a minimum offset per bin.
+
+Indexes are read with ``read_index`` and built with ``build_index``, in
+one pass over an existing BGZF file, or by writing the VCF through an
+``IndexingWriter``, which indexes the lines as they are compressed.  Both
+write a tabix index unless a ``##contig`` is too long for it, as tabix
+only reaches position 2^29, and a CSI index then.
+"""
+
+import gzip
+import os
+import re
+import struct
+
+import bgzf
+
+
+#: tabix binning scheme
+TBI_MIN_SHIFT = 14
+TBI_DEPTH = 5
+#: CSI depth when the contig lengths are not known, as tabix -C uses
+CSI_DEPTH = 6
+
+#: tabix header of VCF indexes: format, sequence, begin and end columns,
+#: meta character and lines to skip
+_VCF_CONF = (2, 1, 2, 0, ord('#'), 0)
+
+_CONTIG_LENGTH = re.compile(br'^##contig=<(?:.*,)?length=(\d+)')
+
+
+def reg2bins(start, end, min_shift=TBI_MIN_SHIFT, depth=TBI_DEPTH):
+    """ All bins that may hold records overlapping [start, end) """
+    bins = []
+    end -= 1
+    shift = min_shift + depth * 3
+    first = 0
+    for level in range(depth + 1):
+        bins.extend(range(first + (start >> shift), first + (end >> shift) + 1))
+        shift -= 3
+        first += 1 << (level * 3)
+    return bins
+
+
+def reg2bin(start, end, min_shift=TBI_MIN_SHIFT, depth=TBI_DEPTH):
+    """ The smallest bin holding all of [start, end) """
+    end -= 1
+    shift = min_shift
+    first = ((1 << (depth * 3)) - 1) // 7
+    for level in range(depth, 0, -1):
+        if start >> shift == end >> shift:
+            return first + (start >> shift)
+        shift += 3
+        first -= 1 << ((level - 1) * 3)
+    return 0
+
+
+def bin_start(b, min_shift=TBI_MIN_SHIFT, depth=TBI_DEPTH):
+    """ First position of a bin, None for the pseudo bin """
+    first = 0
+    for level in range(depth + 1):
+        size = 1 << (level * 3)
+        if b < first + size:
+            return (b - first) << (min_shift + (depth - level) * 3)
+        first += size
+    return None
+
+
+def _pseudo_bin(depth):
+    """ The bin past the scheme holding the per sequence statistics """
+    return ((1 << ((depth + 1) * 3)) - 1) // 7 + 1
+
+
+class Index(object):
+    """ A parsed tabix or CSI index.
+
+        ``names`` lists the sequence names in index order, ``bins`` holds a
+        ``{bin: [(begin, end), ...]}`` chunk dict per sequence and
+        ``offsets`` a ``{bin: min offset}`` dict (CSI) or a linear index
+        list of 16kb window offsets (tabix) per sequence.
+    """
+
+    def __init__(self, names, bins, offsets, min_shift=TBI_MIN_SHIFT,
+                 depth=TBI_DEPTH, linear=True):
+        self.names = names
+        self.bins = bins
+        self.offsets = offsets
+        self.min_shift = min_shift
+        self.depth = depth
+        self.linear = linear
+        self._tids = dict((name, i) for (i, name) in enumerate(names))
+
+    @property
+    def max_position(self):
+        return 1 << (self.min_shift + self.depth * 3)
+
+    def _min_offset(self, tid, start):
+        """ Smallest virtual offset a record overlapping start can have """
+        offsets = self.offsets[tid]
+        if self.linear:
+            window = start >> TBI_MIN_SHIFT
+            if window >= len(offsets):
+                return offsets[-1] if offsets else 0
+            return offsets[window]
+        first = ((1 << (self.depth * 3)) - 1) // 7
+        leaf = first + (start >> self.min_shift)
+        while leaf > 0 and leaf not in offsets:
+            leaf = (leaf - 1) >> 3
+        return offsets.get(leaf, 0)
+
+    def chunks(self, chrom, start=None, end=None):
+        """ Sorted, merged (begin, end) virtual offset ranges to scan """
+        tid = self._tids.get(chrom)
+        if tid is None:
+            return []
+        start = start or 0
+        end = min(end, self.max_position) if end is not None else self.max_position
+        if end <= start:
+            return []
+        min_offset = self._min_offset(tid, start)
+        bins = self.bins[tid]
+        found = []
+        for b in reg2bins(start, end, self.min_shift, self.depth):
+            for chunk in bins.get(b, ()):
+                if chunk[1] > min_offset:
+                    found.append(chunk)
+        found.sort()
+        merged = []
+        for chunk in found:
+            if merged and chunk[0] <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], chunk[1]))
+            else:
+                merged.append(chunk)
+        return merged
+
+
+class _Buffer(object):
+    """ Sequential little-endian reads from a bytes buffer """
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return values
+
+    def read(self, size):
+        value = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return value
+
+
+def _read_names(buf):
+    """ Read the tabix header fields, return the sequence names """
+    (fmt, col_seq, col_beg, col_end, meta, skip, l_nm) = buf.unpack('<7i')
+    return [name.decode('ascii') if not isinstance(name, str) else name
+            for name in buf.read(l_nm).split(b'\0')[:-1]]
+
+
+def _read_tbi(buf):
+    n_ref = buf.unpack('<i')[0]
+    names = _read_names(buf)
+    if len(names) != n_ref:
+        raise ValueError('Corrupt tabix index, %d sequence names for %d '
+                         'sequences' % (len(names), n_ref))
+    bins = []
+    offsets = []
+    for _ in names:
+        ref_bins = {}
+        for _ in range(buf.unpack('<i')[0]):
+            b, n_chunk = buf.unpack('<Ii')
+            chunks = buf.unpack('<%dQ' % (2 * n_chunk))
+            ref_bins[b] = list(zip(chunks[::2], chunks[1::2]))
+        n_intv = buf.unpack('<i')[0]
+        bins.append(ref_bins)
+        offsets.append(list(buf.unpack('<%dQ' % n_intv)))
+    return Index(names, bins, offsets)
+
+
+def _read_csi(buf):
+    min_shift, depth, l_aux = buf.unpack('<3i')
+    aux = buf.read(l_aux)
+    names = _read_names(_Buffer(aux)) if l_aux >= 28 else []
+    n_ref = buf.unpack('<i')[0]
+    bins = []
+    offsets = []
+    for _ in range(n_ref):
+        ref_bins = {}
+        ref_offsets = {}
+        for _ in range(buf.unpack('<i')[0]):
+            b, loffset, n_chunk = buf.unpack('<IQi')
+            chunks = buf.unpack('<%dQ' % (2 * n_chunk))
+            ref_bins[b] = list(zip(chunks[::2], chunks[1::2]))
+            ref_offsets[b] = loffset
+        bins.append(ref_bins)
+        offsets.append(ref_offsets)
+    return Index(names, bins, offsets, min_shift, depth, linear=False)
+
+
+def read_index(filename):
+    """ Parse a .tbi or .csi index file """
+    with gzip.open(filename, 'rb') as handle:
+        buf = _Buffer(handle.read())
+    magic = buf.read(4)
+    if magic == b'TBI\1':
+        return _read_tbi(buf)
+    elif magic == b'CSI\1':
+        return _read_csi(buf)
+    raise ValueError('%s is not a tabix or CSI index' % filename)
+
+
+def find_index(filename):
+    """ The path of the .tbi or .csi index next to a file, or None """
+    for suffix in ('.tbi', '.csi'):
+        if os.path.exists(filename + suffix):
+            return filename + suffix
+    return None
+
+
+class IndexBuilder(object):
+    """ Builds an ``Index`` from records added in file order.
+
+        ``add`` takes the zero-based, half-open span of a record and the
+        offsets of its first byte and of the byte after it.  They are
+        virtual offsets, or any increasing positions ``build`` is given a
+        function to turn into virtual offsets.  Records must be sorted by
+        position within a sequence and the sequences must not repeat.
+        With ``csi`` the binning scheme is ``min_shift`` and ``depth``,
+        tabix has a fixed one.
+    """
+
+    def __init__(self, csi=False, min_shift=TBI_MIN_SHIFT, depth=TBI_DEPTH):
+        if not csi and (min_shift, depth) != (TBI_MIN_SHIFT, TBI_DEPTH):
+            raise ValueError('Tabix indexes have a fixed binning scheme')
+        self.csi = csi
+        self.min_shift = min_shift
+        self.depth = depth
+        self.names = []
+        self._tids = {}
+        # per sequence: {bin: [[begin, end], ...]}, offsets of the first
+        # record in every 16kb window (None where there is none) and
+        # [begin, end, records] for the pseudo bin
+        self._bins = []
+        self._linear = []
+        self._stats = []
+        self._start = 0
+
+    @property
+    def max_position(self):
+        return 1 << (self.min_shift + self.depth * 3)
+
+    def add(self, chrom, start, end, begin, stop):
+        """ Add the record at [start, end) of ``chrom``, stored from offset
+            ``begin`` up to ``stop`` """
+        if not self.names or chrom != self.names[-1]:
+            if chrom in self._tids:
+                raise ValueError('Records are not sorted, %s comes back after '
+                                 '%s' % (chrom, self.names[-1]))
+            self._tids[chrom] = len(self.names)
+            self.names.append(chrom)
+            self._bins.append({})
+            self._linear.append([])
+            self._stats.append([begin, stop, 0])
+        elif start < self._start:
+            raise ValueError('Records are not sorted, %s:%d comes after %s:%d'
+                             % (chrom, start + 1, chrom, self._start + 1))
+        end = max(end, start + 1)
+        if end > self.max_position:
+            raise ValueError('%s:%d is past the %d positions of the binning '
+                             'scheme, a CSI index with more levels is needed'
+                             % (chrom, end, self.max_position))
+        self._start = start
+
+        chunks = self._bins[-1].setdefault(
+            reg2bin(start, end, self.min_shift, self.depth), [])
+        if chunks and chunks[-1][1] == begin:
+            chunks[-1][1] = stop
+        else:
+            chunks.append([begin, stop])
+
+        linear = self._linear[-1]
+        last = (end - 1) >> TBI_MIN_SHIFT
+        if last >= len(linear):
+            linear.extend([None] * (last + 1 - len(linear)))
+        for window in range(start >> TBI_MIN_SHIFT, last + 1):
+            if linear[window] is None:
+                linear[window] = begin
+
+        stats = self._stats[-1]
+        stats[1] = stop
+        stats[2] += 1
+
+    def build(self, resolve=None):
+        """ The ``Index`` of the records added, with the offsets passed
+            through ``resolve`` when given """
+        if resolve is None:
+            resolve = lambda offset: offset
+        pseudo = _pseudo_bin(self.depth)
+        bins = []
+        offsets = []
+        for ref_bins, linear, stats in zip(self._bins, self._linear, self._stats):
+            # windows without records of their own take the offset of the
+            # window before, or of the first record when there is none
+            linear = [resolve(offset) if offset is not None else None
+                      for offset in linear]
+            fill = next((offset for offset in linear if offset is not None), 0)
+            for window, offset in enumerate(linear):
+                if offset is None:
+                    linear[window] = fill
+                else:
+                    fill = offset
+
+            resolved = {}
+            for b, chunks in ref_bins.items():
+                merged = []
+                for begin, stop in chunks:
+                    begin, stop = resolve(begin), resolve(stop)
+                    # chunks sharing a block are read together anyway
+                    if merged and merged[-1][1] >> 16 == begin >> 16:
+                        merged[-1] = (merged[-1][0], stop)
+                    else:
+                        merged.append((begin, stop))
+                resolved[b] = merged
+            resolved[pseudo] = [(resolve(stats[0]), resolve(stats[1])),
+                                (stats[2], 0)]
+            bins.append(resolved)
+
+            if not self.csi:
+                offsets.append(linear)
+                continue
+            loffsets = {pseudo: 0}
+            for b in ref_bins:
+                window = bin_start(b, self.min_shift, self.depth) >> TBI_MIN_SHIFT
+                loffsets[b] = linear[min(window, len(linear) - 1)]
+            offsets.append(loffsets)
+        return Index(list(self.names), bins, offsets, self.min_shift,
+                     self.depth, linear=not self.csi)
+
+
+def _chunk_bytes(chunks):
+    data = [struct.pack('<i', len(chunks))]
+    data.extend(struct.pack('<QQ', begin, end) for (begin, end) in chunks)
+    return b''.join(data)
+
+
+def write_index(idx, filename):
+    """ Write an ``Index`` of a VCF as a tabix file, or CSI when it is not
+        linear """
+    names = b''.join(name.encode('ascii') + b'\0' for name in idx.names)
+    conf = struct.pack('<7i', *(_VCF_CONF + (len(names),))) + names
+    if idx.linear:
+        data = [b'TBI\1', struct.pack('<i', len(idx.names)), conf]
+    else:
+        data = [b'CSI\1', struct.pack('<3i', idx.min_shift, idx.depth, len(conf)),
+                conf, struct.pack('<i', len(idx.names))]
+    for ref_bins, offsets in zip(idx.bins, idx.offsets):
+        data.append(struct.pack('<i', len(ref_bins)))
+        for b in sorted(ref_bins):
+            if idx.linear:
+                data.append(struct.pack('<I', b))
+            else:
+                data.append(struct.pack('<IQ', b, offsets.get(b, 0)))
+            data.append(_chunk_bytes(ref_bins[b]))
+        if idx.linear:
+            data.append(struct.pack('<i%dQ' % len(offsets), len(offsets), *offsets))
+    with bgzf.BgzfWriter(filename) as handle:
+        handle.write(b''.join(data))
+
+
+def vcf_span(line):
+    """ (chrom, start, end) of a VCF data line, zero-based and half-open.
+
+        The end is that of the REF allele, or the INFO END when it is past
+        it, as ``Reader.fetch`` has it.
+    """
+    row = line.split(b'\t', 8)
+    chrom = row[0]
+    if not isinstance(chrom, str):
+        chrom = chrom.decode('ascii')
+    start = int(row[1]) - 1
+    end = start + len(row[3])
+    if len(row) > 7 and b'END=' in row[7]:
+        info = (b';' + row[7]).split(b';END=', 1)
+        try:
+            end = max(int(info[1].split(b';', 1)[0]), end)
+        except (IndexError, ValueError):
+            pass
+    return chrom, start, end
+
+
+def _csi_depth(length, min_shift):
+    """ Levels of a CSI binning scheme reaching past ``length`` """
+    depth = 0
+    size = 1 << min_shift
+    while size < length:
+        depth += 1
+        size <<= 3
+    return depth
+
+
+class _LineIndexer(object):
+    """ Adds the lines of a VCF to an index builder as they are read or
+        written, picking tabix or CSI by the ``##contig`` lengths """
+
+    def __init__(self, csi=None, min_shift=TBI_MIN_SHIFT):
+        self.csi = csi
+        self.min_shift = min_shift
+        self.builder = None
+        self._lengths = []
+
+    def _new_builder(self):
+        longest = max(self._lengths) if self._lengths else 0
+        csi = self.csi
+        if csi is None:
+            csi = longest > 1 << (TBI_MIN_SHIFT + TBI_DEPTH * 3)
+        if not csi:
+            return IndexBuilder()
+        # room for a record running a little past the end, as htslib
+        depth = _csi_depth(longest + 256, self.min_shift) if longest else CSI_DEPTH
+        return IndexBuilder(True, self.min_shift, depth)
+
+    def add_line(self, line, begin, stop):
+        if line.startswith(b'#'):
+            match = _CONTIG_LENGTH.match(line)
+            if match:
+                self._lengths.append(int(match.group(1)))
+            return
+        if not line:
+            return
+        if self.builder is None:
+            self.builder = self._new_builder()
+        chrom, start, end = vcf_span(line)
+        self.builder.add(chrom, start, end, begin, stop)
+
+    def build(self, resolve=None):
+        if self.builder is None:
+            self.builder = self._new_builder()
+        return self.builder.build(resolve)
+
+
+def index_path(filename, idx):
+    """ Where the index of ``filename`` goes, .tbi or .csi by its kind """
+    return filename + ('.tbi' if idx.linear else '.csi')
+
+
+def build_index(filename, index_filename=None, csi=None,
+                min_shift=TBI_MIN_SHIFT, threads=None):
+    """ Index a BGZF compressed VCF in one pass, as ``tabix -p vcf``.
+
+        A tabix index is built unless ``csi`` is True, or is None and a
+        ``##contig`` is too long for tabix; ``min_shift`` sets the leaf bin
+        size of a CSI index.  The index is written to ``index_filename``,
+        by default the file name plus .tbi or .csi, which is returned.
+        ``threads`` inflate blocks ahead of the scan, default
+        ``bgzf.default_threads()``.
+    """
+    if not bgzf.is_bgzf(filename):
+        raise ValueError('%s is not BGZF compressed, only bgzip files can '
+                         'be indexed' % filename)
+    if threads is None:
+        threads = bgzf.default_threads()
+    indexer = _LineIndexer(csi, min_shift)
+    reader = bgzf.BgzfReader(filename, threads=threads)
+    try:
+        begin = reader.tell()
+        for line in iter(reader.readline, b''):
+            stop = reader.tell()
+            indexer.add_line(line.rstrip(b'\r\n'), begin, stop)
+            begin = stop
+    finally:
+        reader.close()
+    idx = indexer.build()
+    index_filename = index_filename or index_path(filename, idx)
+    write_index(idx, index_filename)
+    return index_filename
+
+
+class IndexingWriter(bgzf.BgzfWriter):
+    """ ``BgzfWriter`` that indexes the VCF written through it.
+
+        Every line is added to the index as it is written, so no second
+        pass over the file is needed.  On ``close`` the index is written
+        to ``index_filename``, by default the file name plus .tbi or .csi,
+        and kept as ``index``.  ``csi`` and ``min_shift`` are as for
+        ``build_index``; other keyword arguments go to ``BgzfWriter``.
+    """
+
+    def __init__(self, filename=None, fileobj=None, index_filename=None,
+                 csi=None, min_shift=TBI_MIN_SHIFT, **kwargs):
+        name = filename if filename is not None else getattr(fileobj, 'name', None)
+        if index_filename is None and not isinstance(name, basestring):
+            raise ValueError('index_filename is needed for a file without a name')
+        kwargs['keep_blocks'] = True
+        bgzf.BgzfWriter.__init__(self, filename, fileobj, **kwargs)
+        self.name = name
+        self.index_filename = index_filename
+        self.index = None
+        self._indexer = _LineIndexer(csi, min_shift)
+        self._tail = b''
+
+    def write(self, data):
+        if self.encoding and not isinstance(data, bytes):
+            data = data.encode(self.encoding)
+        begin = self.position - len(self._tail)
+        bgzf.BgzfWriter.write(self, data)
+        lines = (self._tail + data).split(b'\n')
+        self._tail = lines.pop()
+        for line in lines:
+            stop = begin + len(line) + 1
+            self._indexer.add_line(line, begin, stop)
+            begin = stop
+
+    def close(self):
+        if self.closed:
+            return
+        if self._tail:
+            self._indexer.add_line(self._tail, self.position - len(self._tail),
+                                   self.position)
+            self._tail = b''
+        self.flush()
+        self.index = self._indexer.build(self.virtual_offset)
+        bgzf.BgzfWriter.close(self)
+        self.index_filename = self.index_filename or index_path(self.name, self.index)
+        write_index(self.index, self.index_filename)
@@ -1,4 +1,5 @@
 from abc import ABCMeta, abstractmethod
+import array
 import collections
 import sys
 import re
@@ -7,9 +8,65 @@ try:
     from collections import Counter
 except ImportError:
     from counter import Counter
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    from collections import Mapping, MutableMapping
 
 allele_delimiter = re.compile(r'''[|/]''') # to split a genotype into alleles
 
+#: ``gt_type`` value used in genotype code arrays for uncalled genotypes
+GT_UNCALLED = -1
+
+_gt_codes = {}
+
+
+def gt_type_code(gt):
+    """ The ``_Call.gt_type`` of a raw GT string as a small integer.
+
+        hom_ref = 0, het = 1, hom_alt = 2 and uncalled (or missing GT) is
+        ``GT_UNCALLED``.  Results are memoized, there are only a handful of
+        distinct GT strings in a file.
+    """
+    try:
+        return _gt_codes[gt]
+    except KeyError:
+        pass
+    if not gt:
+        code = GT_UNCALLED
+    else:
+        alleles = [(al if al != '.' else None) for al in allele_delimiter.split(gt)]
+        if not any(al is not None for al in alleles):
+            code = GT_UNCALLED
+        elif all(X == alleles[0] for X in alleles[1:]):
+            code = 0 if alleles[0] == "0" else 2
+        else:
+            code = 1
+    _gt_codes[gt] = code
+    return code
+
+
+#: Genotype counts of a ``_Record``: ``codes`` holds the ``gt_type_code``
+#: of every sample, ``counts`` the number of samples per code (uncalled
+#: last), ``allele_counts`` the alleles of the called genotypes and
+#: ``num_chroms`` the number of those alleles.
+_GenotypeTally = collections.namedtuple(
+    'GenotypeTally', ['codes', 'counts', 'allele_counts', 'num_chroms'])
+
+_gt_allele_lists = {}
+
+
+def _gt_allele_list(gt):
+    """ The ``_Call.gt_alleles`` of a raw GT string, memoized """
+    try:
+        return _gt_allele_lists[gt]
+    except KeyError:
+        pass
+    alleles = _gt_allele_lists[gt] = [
+        (al if al != '.' else None) for al in allele_delimiter.split(gt)]
+    return alleles
+
+
 class _Call(object):
     """ A genotype call, a cell entry in a VCF file"""
 
@@ -130,6 +187,184 @@ class _Call(object):
             return True
 
 
+class _LazyCalls(object):
+    """ The ``_Call``s of a ``_Record``, decoded on demand.
+
+        Keeps the raw sample columns of a line and only builds the
+        ``_Call`` (and its ``CallData``) for a sample the first time it is
+        accessed, so site-level passes never pay for genotype parsing.
+        Behaves like a list otherwise; pickling stores the
+        decoded calls as a plain list.
+    """
+
+    __slots__ = ['_raw', '_calls', '_decode']
+
+    def __init__(self, raw, decode):
+        #: the tab-split sample columns
+        self._raw = raw
+        self._calls = [None] * len(raw)
+        #: ``decode(index, column)`` returns the ``_Call`` of one column
+        self._decode = decode
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._raw)))]
+        call = self._calls[index]
+        if call is None:
+            call = self._calls[index] = self._decode(index, self._raw[index])
+        return call
+
+    def __setitem__(self, index, call):
+        self._calls[index] = call
+
+    def __iter__(self):
+        for i in range(len(self._raw)):
+            yield self[i]
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __reduce__(self):
+        return (list, (list(self), ))
+
+
+class _RecordInfo(dict):
+    """ The INFO dict of a parsed ``_Record``, noting whether it changed.
+
+        ``Writer`` reuses the source text of records whose fields were not
+        changed.  Setting or removing keys is noticed, changes made inside
+        a list value are not.  Pickling stores a plain dict.
+    """
+
+    __slots__ = ['_changed']
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._changed = False
+
+    def __setitem__(self, key, value):
+        self._changed = True
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._changed = True
+        dict.__delitem__(self, key)
+
+    def __reduce__(self):
+        return (dict, (dict(self), ))
+
+
+def _marking(name):
+    """ A ``_RecordInfo`` method that notes the change before calling dict's """
+    method = getattr(dict, name)
+
+    def marking(self, *args, **kwargs):
+        self._changed = True
+        return method(self, *args, **kwargs)
+    marking.__name__ = name
+    return marking
+
+for _name in ('pop', 'popitem', 'setdefault', 'update', 'clear'):
+    setattr(_RecordInfo, _name, _marking(_name))
+
+
+class _LazyInfo(MutableMapping):
+    """ The INFO of a record read with ``Reader(info_fields=...)``.
+
+        Keys that are not in the whitelist are held as their raw text and
+        only converted, to the type the header gives them, the first time
+        they are accessed.  A mapping rather than a dict subclass: copies
+        made with ``dict(info)`` or ``d.update(info)`` go through ``keys``
+        and ``__getitem__`` and so see every key, decoded, where Python 2
+        would copy the raw text of a dict subclass.  So unlike the INFO of
+        a ``Reader`` without ``info_fields``, ``isinstance(info, dict)`` is
+        False and ``json.dumps(info)`` raises; use ``info.copy()``, a plain
+        dict.  Notes changes like ``_RecordInfo``; pickling stores a plain
+        dict.
+    """
+
+    __slots__ = ['_data', '_raw', '_decode', '_changed']
+
+    def __init__(self, decoded, raw, decode):
+        #: ``{key: value}`` of the decoded keys
+        self._data = decoded
+        #: ``{key: text after '=' or None}`` of the undecoded keys
+        self._raw = raw
+        #: ``decode(key, text)`` returns the value of one key
+        self._decode = decode
+        self._changed = False
+
+    def __getitem__(self, key):
+        try:
+            return self._data[key]
+        except KeyError:
+            if key not in self._raw:
+                raise
+        value = self._data[key] = self._decode(key, self._raw.pop(key))
+        return value
+
+    def __setitem__(self, key, value):
+        self._changed = True
+        self._raw.pop(key, None)
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        if key in self._raw:
+            del self._raw[key]
+        else:
+            del self._data[key]
+        self._changed = True
+
+    def _decode_all(self):
+        for key in list(self._raw):
+            self[key]
+
+    def __contains__(self, key):
+        return key in self._data or key in self._raw
+
+    def has_key(self, key):
+        return key in self
+
+    def __len__(self):
+        return len(self._data) + len(self._raw)
+
+    def __iter__(self):
+        return iter(list(self._data) + list(self._raw))
+
+    def copy(self):
+        self._decode_all()
+        return dict(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, _LazyInfo):
+            other = other.copy()
+        elif not isinstance(other, Mapping):
+            return NotImplemented
+        return self.copy() == other
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __repr__(self):
+        return repr(self.copy())
+
+    def __reduce__(self):
+        return (dict, (self.copy(), ))
+
+
 class _Record(object):
     """ A set of calls at a site.  Equivalent to a row in a VCF file.
 
@@ -172,6 +407,12 @@ class _Record(object):
             Neither the upstream nor downstream flanking bases are
             included in the region.
     """
+
+
+    __slots__ = ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO',
+                 'FORMAT', 'start', 'end', 'samples', '_sample_indexes',
+                 '_alleles', '_affected', '_raw', '_tally']
+
     def __init__(self, CHROM, POS, ID, REF, ALT, QUAL, FILTER, INFO, FORMAT,
             sample_indexes, samples=None):
         self.CHROM = CHROM
@@ -185,27 +426,66 @@ class _Record(object):
         self.INFO = INFO
         self.FORMAT = FORMAT
         #: zero-based, half-open start coordinate of ``REF``
-        self.start = self.POS - 1
+        self.start = POS - 1
         #: zero-based, half-open end coordinate of ``REF``
-        self.end = self.start + len(self.REF)
-        #: list of alleles. [0] = REF, [1:] = ALTS
-        self.alleles = [self.REF]
-        self.alleles.extend(self.ALT)
+        self.end = self.start + len(REF)
         #: list of ``_Calls`` for each sample ordered as in source VCF
         self.samples = samples or []
         self._sample_indexes = sample_indexes
+        # alleles and affected coordinates, built on first access
+        self._alleles = None
+        self._affected = None
+        # genotype counts, built on first access
+        self._tally = None
+        #: ``(columns, fields)`` of a record read by ``Reader``: the source
+        #: text of the columns up to FORMAT and the values parsed from them
+        self._raw = None
 
-        # Setting affected_start and affected_end here for Sphinx
-        # autodoc purposes...
-        #: zero-based, half-open start coordinate of affected region of reference genome
-        self.affected_start = None
-        #: zero-based, half-open end coordinate of affected region of reference genome (not included in the region)
-        self.affected_end = None
-        self._set_start_and_end()
+    def __getstate__(self):
+        # the source text is not kept, unpickled fields are new objects
+        return dict((attr, getattr(self, attr)) for attr in self.__slots__
+                    if attr not in ('_raw', '_tally'))
 
+    def __setstate__(self, state):
+        for attr in self.__slots__:
+            setattr(self, attr, state.get(attr))
+
+    @property
+    def alleles(self):
+        """ list of alleles. [0] = REF, [1:] = ALTS """
+        if self._alleles is None:
+            self._alleles = [self.REF]
+            self._alleles.extend(self.ALT)
+        return self._alleles
+
+    @alleles.setter
+    def alleles(self, alleles):
+        self._alleles = alleles
+
+    @property
+    def affected_start(self):
+        """ zero-based, half-open start coordinate of affected region of reference genome """
+        if self._affected is None:
+            self._set_start_and_end()
+        return self._affected[0]
+
+    @affected_start.setter
+    def affected_start(self, start):
+        self._affected = (start, self.affected_end)
+
+    @property
+    def affected_end(self):
+        """ zero-based, half-open end coordinate of affected region of reference genome (not included in the region) """
+        if self._affected is None:
+            self._set_start_and_end()
+        return self._affected[1]
+
+    @affected_end.setter
+    def affected_end(self, end):
+        self._affected = (self.affected_start, end)
 
     def _set_start_and_end(self):
-        self.affected_start = self.affected_end = self.POS
+        affected_start = affected_end = self.POS
         for alt in self.ALT:
             if alt is None:
                 start, end = self._compute_coordinates_for_none_alt()
@@ -215,8 +495,9 @@ class _Record(object):
                 start, end = self._compute_coordinates_for_indel()
             else:
                 start, end = self._compute_coordinates_for_sv()
-            self.affected_start = min(self.affected_start, start)
-            self.affected_end = max(self.affected_end, end)
+            affected_start = min(affected_start, start)
+            affected_end = max(affected_end, end)
+        self._affected = (affected_start, affected_end)
 
 
     def _compute_coordinates_for_none_alt(self):
@@ -270,7 +551,8 @@ class _Record(object):
         return iter(self.samples)
 
     def __str__(self):
-        return "Record(CHROM=%(CHROM)s, POS=%(POS)s, REF=%(REF)s, ALT=%(ALT)s)" % self.__dict__
+        return "Record(CHROM=%s, POS=%s, REF=%s, ALT=%s)" % (
+            self.CHROM, self.POS, self.REF, self.ALT)
 
     def add_format(self, fmt):
         self.FORMAT = self.FORMAT + ':' + fmt
@@ -288,10 +570,52 @@ class _Record(object):
         """ Lookup a ``_Call`` for the sample given in ``name`` """
         return self.samples[self._sample_indexes[name]]
 
+    def _gt_strings(self):
+        """ The raw GT string of every sample, None where there is none.
+
+            Samples a ``_LazyCalls`` has not decoded yet are read from their
+            column text when GT is the first FORMAT key, as the spec wants.
+        """
+        samples = self.samples
+        if (type(samples) is _LazyCalls and self.FORMAT is not None
+                and self.FORMAT.partition(':')[0] == 'GT'):
+            return [column.partition(':')[0] if call is None
+                    else getattr(call.data, 'GT', None)
+                    for column, call in zip(samples._raw, samples._calls)]
+        return [getattr(s.data, 'GT', None) for s in samples]
+
+    def _genotype_tally(self):
+        """ The ``GenotypeTally`` of the samples, built in one pass.
+
+            It is cached, changes made to the calls afterwards are not seen.
+        """
+        if self._tally is not None:
+            return self._tally
+        gts = self._gt_strings()
+        codes = array.array('b', [gt_type_code(gt) for gt in gts])
+        counts = [0, 0, 0, 0]
+        allele_counts = Counter()
+        num_chroms = 0
+        for gt, n in Counter(gts).items():
+            code = gt_type_code(gt)
+            counts[code] += n
+            if code != GT_UNCALLED:
+                alleles = _gt_allele_list(gt)
+                for a in alleles:
+                    allele_counts[a] += n
+                num_chroms += n * len(alleles)
+        self._tally = _GenotypeTally(codes, counts, allele_counts, num_chroms)
+        return self._tally
+
+    def _samples_with_type(self, code):
+        samples = self.samples
+        return [samples[i] for (i, c) in enumerate(self._genotype_tally().codes)
+                if c == code]
+
     @property
     def num_called(self):
         """ The number of called samples"""
-        return sum(1 for s in self.samples if s.called)
+        return len(self.samples) - self._genotype_tally().counts[GT_UNCALLED]
 
     @property
     def call_rate(self):
@@ -301,36 +625,31 @@ class _Record(object):
     @property
     def num_hom_ref(self):
         """ The number of homozygous for ref allele genotypes"""
-        return len([s for s in self.samples if s.gt_type == 0])
+        return self._genotype_tally().counts[0]
 
     @property
     def num_hom_alt(self):
         """ The number of homozygous for alt allele genotypes"""
-        return len([s for s in self.samples if s.gt_type == 2])
+        return self._genotype_tally().counts[2]
 
     @property
     def num_het(self):
         """ The number of heterozygous genotypes"""
-        return len([s for s in self.samples if s.gt_type == 1])
+        return self._genotype_tally().counts[1]
 
     @property
     def num_unknown(self):
         """ The number of unknown genotypes"""
-        return len([s for s in self.samples if s.gt_type is None])
+        return self._genotype_tally().counts[GT_UNCALLED]
 
     @property
     def aaf(self):
         """ A list of allele frequencies of alternate alleles.
            NOTE: Denominator calc'ed from _called_ genotypes.
         """
-        num_chroms = 0.0
-        allele_counts = Counter()
-        for s in self.samples:
-            if s.gt_type is not None:
-                for a in s.gt_alleles:
-                    allele_counts.update([a])
-                    num_chroms += 1
-        return [allele_counts[str(i)]/num_chroms for i in range(1, len(self.ALT)+1)]
+        tally = self._genotype_tally()
+        num_chroms = float(tally.num_chroms)
+        return [tally.allele_counts[str(i)]/num_chroms for i in range(1, len(self.ALT)+1)]
 
     @property
     def nucl_diversity(self):
@@ -361,24 +680,25 @@ class _Record(object):
 
         If there are i alleles with frequency p_i, H=1-sum_i(p_i^2)
         """
-        allele_freqs = [1-sum(self.aaf)] + self.aaf
+        aaf = self.aaf
+        allele_freqs = [1-sum(aaf)] + aaf
         return 1 - sum(map(lambda x: x**2, allele_freqs))
 
     def get_hom_refs(self):
         """ The list of hom ref genotypes"""
-        return [s for s in self.samples if s.gt_type == 0]
+        return self._samples_with_type(0)
 
     def get_hom_alts(self):
         """ The list of hom alt genotypes"""
-        return [s for s in self.samples if s.gt_type == 2]
+        return self._samples_with_type(2)
 
     def get_hets(self):
         """ The list of het genotypes"""
-        return [s for s in self.samples if s.gt_type == 1]
+        return self._samples_with_type(1)
 
     def get_unknowns(self):
         """ The list of unknown genotypes"""
-        return [s for s in self.samples if s.gt_type is None]
+        return self._samples_with_type(GT_UNCALLED)
 
     @property
     def is_snp(self):
@@ -562,11 +882,25 @@ class _AltRecord(object):
     '''An alternative allele record: either replacement string, SV placeholder, or breakend'''
     __metaclass__ = ABCMeta
 
+    __slots__ = ['type']
+
     def __init__(self, type, **kwargs):
         super(_AltRecord, self).__init__(**kwargs)
         #: String to describe the type of variant, by default "SNV" or "MNV", but can be extended to any of the types described in the ALT lines of the header (e.g. "DUP", "DEL", "INS"...)
         self.type = type
 
+    def _slots(self):
+        for cls in type(self).__mro__:
+            for attr in getattr(cls, '__slots__', ()):
+                yield attr
+
+    def __getstate__(self):
+        return dict((attr, getattr(self, attr)) for attr in self._slots())
+
+    def __setstate__(self, state):
+        for attr in self._slots():
+            setattr(self, attr, state.get(attr))
+
     @abstractmethod
     def __str__(self):
         raise NotImplementedError
@@ -578,6 +912,8 @@ class _AltRecord(object):
 class _Substitution(_AltRecord):
     '''A basic ALT record, where a REF sequence is replaced by an ALT sequence'''
 
+    __slots__ = ['sequence']
+
     def __init__(self, nucleotides, **kwargs):
         if len(nucleotides) == 1:
             super(_Substitution, self).__init__(type="SNV", **kwargs)
@@ -606,6 +942,9 @@ class _Substitution(_AltRecord):
 class _Breakend(_AltRecord):
     '''A breakend which is paired to a remote location on or off the genome'''
 
+    __slots__ = ['chr', 'pos', 'remoteOrientation', 'withinMainAssembly',
+                 'orientation', 'connectingSequence']
+
     def __init__(self, chr, pos, orientation, remoteOrientation, connectingSequence, withinMainAssembly, **kwargs):
         super(_Breakend, self).__init__(type="BND", **kwargs)
         #: The chromosome of breakend's mate.
@@ -663,6 +1002,8 @@ class _Breakend(_AltRecord):
 class _SingleBreakend(_Breakend):
     '''A single breakend'''
 
+    __slots__ = []
+
     def __init__(self, orientation, connectingSequence, **kwargs):
         super(_SingleBreakend, self).__init__(None, None, orientation, None, connectingSequence, None, **kwargs)
 
@@ -670,6 +1011,8 @@ class _SingleBreakend(_Breakend):
 class _SV(_AltRecord):
     '''An SV placeholder'''
 
+    __slots__ = []
+
     def __init__(self, type, **kwargs):
         super(_SV, self).__init__(type, **kwargs)
 
@@ -0,0 +1,221 @@
+"""
+Multi-process parsing of VCF files.
+
+The data lines of a plain text or BGZF compressed VCF are split into byte
+ranges that can be parsed independently.  Each range is handed to a worker
+process that reads the header with its own ``Reader`` and then only parses
+the records that start inside its range.  Results come back in file order.
+
+Functions passed to ``parallel_map`` and ``map_chunks`` are sent to the
+workers by pickling, so they must be defined at module level.
+"""
+
+import multiprocessing
+import os
+
+import bgzf
+from parser import Reader
+
+
+#: bytes read at a time from plain text chunks
+_PIECE_SIZE = 1 << 20
+
+
+def split_chunks(filename, n_chunks):
+    """ Split a VCF into at most ``n_chunks`` record aligned byte ranges.
+
+        Returns a list of ``(kind, previous, start, end)`` tuples.  For
+        plain text, ``start`` and ``end`` are byte offsets; for BGZF they
+        are block offsets and ``previous`` is the offset of the block
+        before ``start``.  Gzip files that are not BGZF cannot be split and
+        come back as a single ``'whole'`` chunk.
+    """
+    if n_chunks < 1:
+        raise ValueError('n_chunks must be at least 1')
+
+    if bgzf.is_bgzf(filename):
+        with open(filename, 'rb') as handle:
+            blocks = list(bgzf.iter_block_offsets(handle))
+        total = blocks[-1][0] + blocks[-1][1] if blocks else 0
+        chunks = []
+        start_idx = 0
+        for i in range(1, n_chunks + 1):
+            # first block at or past the i-th share of the compressed size
+            target = total * i // n_chunks
+            end_idx = start_idx
+            while end_idx < len(blocks) and blocks[end_idx][0] < target:
+                end_idx += 1
+            if i == n_chunks:
+                end_idx = len(blocks)
+            if end_idx > start_idx:
+                previous = blocks[start_idx - 1][0] if start_idx else None
+                end = blocks[end_idx][0] if end_idx < len(blocks) else total
+                chunks.append(('bgzf', previous, blocks[start_idx][0], end))
+                start_idx = end_idx
+        return chunks
+
+    with open(filename, 'rb') as handle:
+        if handle.read(2) == b'\x1f\x8b':
+            return [('whole', None, 0, None)]
+
+    size = os.path.getsize(filename)
+    bounds = sorted(set(size * i // n_chunks for i in range(n_chunks + 1)))
+    return [('plain', None, start, end)
+            for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def _chunk_lines(pieces, at_line_start):
+    """ Yield the lines that start inside a chunk.
+
+        ``pieces`` yields ``(in_range, data)`` for the chunk and then for
+        the data after it.  A line running over the start of the chunk
+        belongs to the previous chunk; a line running over its end is
+        completed from the following data.
+    """
+    buf = b''
+    skipping = not at_line_start
+    for in_range, data in pieces:
+        if not in_range:
+            if skipping or not buf:
+                return
+            idx = data.find(b'\n')
+            if idx < 0:
+                buf += data
+                continue
+            yield buf + data[:idx]
+            return
+        buf += data
+        if skipping:
+            idx = buf.find(b'\n')
+            if idx < 0:
+                buf = b''
+                continue
+            buf = buf[idx + 1:]
+            skipping = False
+        lines = buf.split(b'\n')
+        buf = lines.pop()
+        for line in lines:
+            yield line
+    if buf and not skipping:
+        yield buf
+
+
+def _plain_pieces(handle, start, end):
+    handle.seek(start)
+    pos = start
+    while True:
+        size = min(_PIECE_SIZE, end - pos) if pos < end else _PIECE_SIZE
+        data = handle.read(size)
+        if not data:
+            return
+        yield pos < end, data
+        pos += len(data)
+
+
+def _bgzf_pieces(handle, start, end):
+    handle.seek(start)
+    while True:
+        block = bgzf.read_block(handle)
+        if block is None:
+            return
+        yield block[0] < end, block[1]
+
+
+def _chunk_raw_lines(filename, chunk):
+    kind, previous, start, end = chunk
+    with open(filename, 'rb') as handle:
+        if kind == 'bgzf':
+            at_line_start = True
+            if previous is not None:
+                handle.seek(previous)
+                data = bgzf.read_block(handle)[1]
+                at_line_start = not data or data.endswith(b'\n')
+            pieces = _bgzf_pieces(handle, start, end)
+        else:
+            at_line_start = True
+            if start > 0:
+                handle.seek(start - 1)
+                at_line_start = handle.read(1) == b'\n'
+            pieces = _plain_pieces(handle, start, end)
+        for line in _chunk_lines(pieces, at_line_start):
+            yield line
+
+
+def chunk_reader(filename, chunk, **kwargs):
+    """ A ``Reader`` over the records of one chunk from ``split_chunks`` """
+    reader = Reader(filename=filename, **kwargs)
+    if chunk[0] == 'whole':
+        return reader
+    reader._reader.close()
+    encoding = reader.encoding
+
+    def lines():
+        for line in _chunk_raw_lines(filename, chunk):
+            if not isinstance(line, str):
+                line = line.decode(encoding)
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+    reader.reader = lines()
+    return reader
+
+
+def _run_chunk(task):
+    filename, chunk, fn, per_record, kwargs = task
+    reader = chunk_reader(filename, chunk, **kwargs)
+    if per_record:
+        return [fn(record) for record in reader]
+    return fn(reader)
+
+
+def _imap(func, tasks, workers):
+    """ Yield ``func(task)`` for every task in order, in ``workers``
+        processes, or in this one when ``workers`` is 1 """
+    if workers == 1:
+        for task in tasks:
+            yield func(task)
+        return
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        for result in pool.imap(func, tasks):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _run(filename, fn, per_record, workers, chunks, kwargs):
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if chunks is None:
+        chunks = workers * 4
+    tasks = [(filename, chunk, fn, per_record, kwargs)
+             for chunk in split_chunks(filename, chunks)]
+    return _imap(_run_chunk, tasks, workers)
+
+
+def map_chunks(filename, fn, workers=None, chunks=None, **kwargs):
+    """ Call ``fn(reader)`` on every chunk of a VCF in a process pool.
+
+        ``reader`` is a ``Reader`` over the records of one chunk, with the
+        full header.  Yields the return values in file order, which makes
+        it the map step of a map-reduce, e.g.
+        ``reduce(operator.add, map_chunks(path, count_records))``.
+
+        ``workers`` defaults to the number of CPUs and ``chunks`` to four
+        per worker.  Other keyword arguments are passed on to ``Reader``.
+    """
+    return _run(filename, fn, False, workers, chunks, kwargs)
+
+
+def parallel_map(filename, fn, workers=None, chunks=None, **kwargs):
+    """ Yield ``fn(record)`` for every record of a VCF, in file order.
+
+        Records are parsed and ``fn`` is applied in a pool of ``workers``
+        processes, see ``map_chunks``.
+    """
+    for results in _run(filename, fn, True, workers, chunks, kwargs):
+        for result in results:
+            yield result
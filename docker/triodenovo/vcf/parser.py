@@ -1,12 +1,17 @@
 import codecs
 import collections
-import csv
 import gzip
+import hashlib
 import itertools
 import os
 import re
 import sys
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
 try:
     from collections import OrderedDict
 except ImportError:
@@ -22,8 +27,16 @@ try:
 except ImportError:
     cparse = None
 
-from model import _Call, _Record, make_calldata_tuple
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from model import _Call, _Record, _LazyCalls, _RecordInfo, _LazyInfo, make_calldata_tuple, gt_type_code
 from model import _Substitution, _Breakend, _SingleBreakend, _SV
+import bgzf
+import index
+import s3
 
 
 # Metadata parsers/constants
@@ -56,6 +69,9 @@ RESERVED_FORMAT = {
     'HAP': 'Integer', 'AHAP': 'Integer'
 }
 
+# END key of an INFO field, for region queries
+_end_pattern = re.compile(r'(?:^|;)END=(\d+)')
+
 # Spec is a bit weak on which metadata lines are singular, like fileformat
 # and which can have repeats, like contig
 SINGULAR_METADATA = ['fileformat', 'fileDate', 'reference']
@@ -75,40 +91,179 @@ _Alt = collections.namedtuple('Alt', ['id', 'desc'])
 _Format = collections.namedtuple('Format', ['id', 'num', 'type', 'desc'])
 _SampleInfo = collections.namedtuple('SampleInfo', ['samples', 'gt_bases', 'gt_types', 'gt_phases'])
 _Contig = collections.namedtuple('Contig', ['id', 'length'])
+_Block = collections.namedtuple('Block', ['CHROM', 'POS', 'REF', 'ALT', 'QUAL', 'calldata'])
+
+# ALTs of one base, built without going through _Substitution.__init__
+_SNV_BASES = frozenset('ACGTN')
+
+
+def _lists_unchanged(info, text, parse_info):
+    """ Whether the list values of a parsed INFO still equal those parsed
+        from its source ``text`` """
+    # keys a _LazyInfo has not decoded cannot have changed
+    values = info._data if isinstance(info, _LazyInfo) else info
+    keys = [key for (key, value) in values.items() if type(value) is list]
+    if not keys:
+        return True
+    source = parse_info(text)
+    return all(source[key] == values[key] for key in keys)
+
+
+def _new_snv(base):
+    """ A new single base ``_Substitution``; one per record, as callers
+        may change it in place """
+    alt = object.__new__(_Substitution)
+    alt.type = 'SNV'
+    alt.sequence = base
+    return alt
+
+
+def _data_lines(lines):
+    '''Strip lines once, skipping blank ones.'''
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def _parse_qual(text):
+    '''QUAL as an int when it is written as one, else a float or None.'''
+    if text.isdigit():
+        return int(text)
+    if text == '.':
+        return None
+    if text[:1] in ('-', '+'):
+        # signed, isdigit() is False for these
+        try:
+            return int(text)
+        except ValueError:
+            pass
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+# FORMAT fields the spec fixes at one value per sample, used for block
+# shapes when the header does not declare them
+SINGLE_FORMAT = ['GT', 'DP', 'FT', 'GQ', 'PS', 'PQ', 'MQ']
+
+
+# Converters for INFO values, built once per key by Reader._info_converter.
+# They take the text after '=', or None for a key without a value.
+_MISSING = ('.', '')
+
+
+def _flag_info(value):
+    return True
+
+
+def _int_info(value):
+    vals = value.split(',')
+    try:
+        return map(int, vals)
+    except ValueError:
+        pass
+    try:
+        return [int(x) if x not in _MISSING else None for x in vals]
+    # Allow specified integers to be flexibly parsed as floats.
+    # Handles cases with incorrectly specified header types.
+    except ValueError:
+        return [float(x) if x not in _MISSING else None for x in vals]
+
+
+def _float_info(value):
+    vals = value.split(',')
+    try:
+        return map(float, vals)
+    except ValueError:
+        return [float(x) if x not in _MISSING else None for x in vals]
+
+
+def _str_info(value):
+    if value is None:
+        return True
+    # commas are reserved characters indicating multiple values
+    vals = value.split(',')
+    if '.' in vals or '' in vals:
+        return [str(x) if x not in _MISSING else None for x in vals]
+    return map(str, vals)
+
+
+def _int_info_scalar(value):
+    if value in _MISSING:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return _int_info(value)[0]
+
+
+def _float_info_scalar(value):
+    if value in _MISSING:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return _float_info(value)[0]
+
+
+def _str_info_scalar(value):
+    if value is None:
+        return True
+    return _str_info(value)[0]
+
+
+_INFO_CONVERTERS = {
+    'Integer': (_int_info, _int_info_scalar),
+    'Float': (_float_info, _float_info_scalar),
+    'Flag': (_flag_info, _flag_info),
+    'String': (_str_info, _str_info_scalar),
+    'Character': (_str_info, _str_info_scalar),
+}
+
+
+# Header line patterns, compiled once for all readers
+_info_pattern = re.compile(r'''\#\#INFO=<
+    ID=(?P<id>[^,]+),\s*
+    Number=(?P<number>-?\d+|\.|[AGR])?,\s*
+    Type=(?P<type>Integer|Float|Flag|Character|String),\s*
+    Description="(?P<desc>[^"]*)"
+    (?:,\s*Source="(?P<source>[^"]*)")?
+    (?:,\s*Version="?(?P<version>[^"]*)"?)?
+    >''', re.VERBOSE)
+_filter_pattern = re.compile(r'''\#\#FILTER=<
+    ID=(?P<id>[^,]+),\s*
+    Description="(?P<desc>[^"]*)"
+    >''', re.VERBOSE)
+_alt_pattern = re.compile(r'''\#\#ALT=<
+    ID=(?P<id>[^,]+),\s*
+    Description="(?P<desc>[^"]*)"
+    >''', re.VERBOSE)
+_format_pattern = re.compile(r'''\#\#FORMAT=<
+    ID=(?P<id>.+),\s*
+    Number=(?P<number>-?\d+|\.|[AGR]),\s*
+    Type=(?P<type>.+),\s*
+    Description="(?P<desc>.*)"
+    >''', re.VERBOSE)
+_contig_pattern = re.compile(r'''\#\#contig=<
+    ID=(?P<id>[^>,]+)
+    (,.*length=(?P<length>-?\d+))?
+    .*
+    >''', re.VERBOSE)
+_meta_pattern = re.compile(r'''##(?P<key>.+?)=(?P<val>.+)''')
+_meta_hash_pattern = re.compile(r'##.+=<')
 
 
 class _vcf_metadata_parser(object):
     '''Parse the metadata in the header of a VCF file.'''
     def __init__(self):
         super(_vcf_metadata_parser, self).__init__()
-        self.info_pattern = re.compile(r'''\#\#INFO=<
-            ID=(?P<id>[^,]+),\s*
-            Number=(?P<number>-?\d+|\.|[AGR])?,\s*
-            Type=(?P<type>Integer|Float|Flag|Character|String),\s*
-            Description="(?P<desc>[^"]*)"
-            (?:,\s*Source="(?P<source>[^"]*)")?
-            (?:,\s*Version="?(?P<version>[^"]*)"?)?
-            >''', re.VERBOSE)
-        self.filter_pattern = re.compile(r'''\#\#FILTER=<
-            ID=(?P<id>[^,]+),\s*
-            Description="(?P<desc>[^"]*)"
-            >''', re.VERBOSE)
-        self.alt_pattern = re.compile(r'''\#\#ALT=<
-            ID=(?P<id>[^,]+),\s*
-            Description="(?P<desc>[^"]*)"
-            >''', re.VERBOSE)
-        self.format_pattern = re.compile(r'''\#\#FORMAT=<
-            ID=(?P<id>.+),\s*
-            Number=(?P<number>-?\d+|\.|[AGR]),\s*
-            Type=(?P<type>.+),\s*
-            Description="(?P<desc>.*)"
-            >''', re.VERBOSE)
-        self.contig_pattern = re.compile(r'''\#\#contig=<
-            ID=(?P<id>[^>,]+)
-            (,.*length=(?P<length>-?\d+))?
-            .*
-            >''', re.VERBOSE)
-        self.meta_pattern = re.compile(r'''##(?P<key>.+?)=(?P<val>.+)''')
+        self.info_pattern = _info_pattern
+        self.filter_pattern = _filter_pattern
+        self.alt_pattern = _alt_pattern
+        self.format_pattern = _format_pattern
+        self.contig_pattern = _contig_pattern
+        self.meta_pattern = _meta_pattern
 
     def vcf_field_count(self, num_str):
         """Cast vcf header numbers to integer or None"""
@@ -177,9 +332,8 @@ class _vcf_metadata_parser(object):
         if not match:
             raise SyntaxError(
                 "One of the contig lines is malformed: %s" % contig_string)
-        length = self.vcf_field_count(match.group('length'))
-        contig = _Contig(match.group('id'), length)
-        return (match.group('id'), contig)
+        contig_id, length = match.group('id', 'length')
+        return (contig_id, _Contig(contig_id, self.vcf_field_count(length)))
 
     def read_meta_hash(self, meta_string):
         # assert re.match("##.+=<", meta_string)
@@ -188,39 +342,33 @@ class _vcf_metadata_parser(object):
         key = items[0].lstrip('#')
         # N.B., items can have quoted values, so cannot just split on comma
         val = OrderedDict()
-        state = 0
-        k = ''
-        v = ''
-        for c in items[1].strip('[<>]'):
-
-            if state == 0:  # reading item key
-                if c == '=':
-                    state = 1  # end of key, start reading value
-                else:
-                    k += c  # extend key
-            elif state == 1:  # reading item value
-                if v == '' and c == '"':
-                    v += c  # include quote mark in value
-                    state = 2  # start reading quoted value
-                elif c == ',':
-                    val[k] = v  # store parsed item
-                    state = 0  # read next key
-                    k = ''
-                    v = ''
-                else:
-                    v += c
-            elif state == 2:  # reading quoted item value
-                if c == '"':
-                    v += c  # include quote mark in value
-                    state = 1  # end quoting
-                else:
-                    v += c
-        if k != '':
-            val[k] = v
+        text = items[1].strip('[<>]')
+        end = len(text)
+        pos = 0
+        while pos < end:
+            eq = text.find('=', pos)
+            if eq < 0:
+                # last item without a value
+                val[text[pos:]] = ''
+                break
+            k = text[pos:eq]
+            start = eq + 1
+            # a value starting with a quote runs at least to the closing
+            # quote (kept in the value), commas in between do not end it
+            search = start
+            if text.startswith('"', start):
+                search = text.find('"', start + 1) + 1 or end
+            comma = text.find(',', search)
+            if comma < 0:
+                if k != '':
+                    val[k] = text[start:]
+                break
+            val[k] = text[start:comma]
+            pos = comma + 1
         return key, val
 
     def read_meta(self, meta_string):
-        if re.match("##.+=<", meta_string):
+        if _meta_hash_pattern.match(meta_string):
             return self.read_meta_hash(meta_string)
         match = self.meta_pattern.match(meta_string)
         if not match:
@@ -231,11 +379,58 @@ class _vcf_metadata_parser(object):
         return match.group('key'), match.group('val')
 
 
+# Header dicts kept in a header cache, with the namedtuple of their values
+_HEADER_FIELDS = [('infos', _Info), ('filters', _Filter), ('alts', _Alt),
+                  ('formats', _Format), ('contigs', _Contig)]
+
+
+def _header_cache_file(cache_dir, filename):
+    """ The cache file of a VCF in ``cache_dir`` and the key its content must
+        match: the absolute path, mtime and size of the VCF.  ``(None, None)``
+        when the VCF is not a file on disk.
+    """
+    try:
+        stat = os.stat(filename)
+    except (OSError, TypeError):
+        return None, None
+    path = os.path.abspath(filename)
+    name = hashlib.sha1(path.encode('utf-8')).hexdigest() + '.header'
+    return os.path.join(cache_dir, name), (path, stat.st_mtime, stat.st_size)
+
+
+def _read_header_cache(cache_file, key):
+    """ The cached ``(n_lines, state)`` of a header, None on a miss """
+    try:
+        with open(cache_file, 'rb') as handle:
+            cached_key, n_lines, state = pickle.load(handle)
+    except Exception:
+        # missing, unreadable or stale format, parse the header instead
+        return None
+    if cached_key != key:
+        return None
+    return n_lines, state
+
+
+def _write_header_cache(cache_file, key, n_lines, state):
+    """ Store a parsed header, errors are ignored as the cache is optional """
+    tmp = '%s.%d.tmp' % (cache_file, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(cache_file)):
+            os.makedirs(os.path.dirname(cache_file))
+        with open(tmp, 'wb') as handle:
+            pickle.dump((key, n_lines, state), handle, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, cache_file)
+    except (IOError, OSError):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
 class Reader(object):
     """ Reader for a VCF v 4.0 file, an iterator returning ``_Record objects`` """
 
     def __init__(self, fsock=None, filename=None, compressed=None, prepend_chr=False,
-                 strict_whitespace=False, encoding='ascii'):
+                 strict_whitespace=False, encoding='ascii', samples=None,
+                 info_fields=None, header_cache=None, threads=None):
         """ Create a new Reader for a VCF file.
 
             You must specify either fsock (stream) or filename.  Gzipped streams
@@ -247,6 +442,28 @@ class Reader(object):
 
             'strict_whitespace=True' will split records on tabs only (as with VCF
             spec) which allows you to parse files with spaces in the sample names.
+
+            'samples' is an optional list of sample names to read.  Only those
+            columns are split and parsed, in the order given, and ``samples``
+            and the ``_Record.samples`` of every record list just them.
+
+            'info_fields' is an optional set of INFO keys to decode up front.
+            The other keys of a record's ``INFO`` keep their raw text until
+            they are first accessed.  ``INFO`` is then a ``_LazyInfo``
+            mapping rather than a ``dict``: ``isinstance(info, dict)`` is
+            False and ``json`` cannot serialize it, ``info.copy()`` or
+            ``dict(info)`` give a plain dict with every key decoded.
+
+            'header_cache' is an optional directory where parsed headers are
+            pickled, keyed by the path, mtime and size of the file.  Opening
+            the same file again only skips over its header lines.
+
+            A filename of the form 's3://bucket/key' is streamed from S3 with
+            ranged GETs (see ``vcf.s3``, requires boto3).
+
+            BGZF compressed input is inflated on 'threads' threads, which
+            defaults to ``bgzf.default_threads()``; 0 inflates in the calling
+            thread.  Other gzip input is read with ``gzip.GzipFile``.
         """
         super(Reader, self).__init__()
 
@@ -262,22 +479,35 @@ class Reader(object):
         elif filename:
             if compressed is None:
                 compressed = filename.endswith('.gz')
-            self._reader = open(filename, 'rb' if compressed else 'rt')
+            if s3.is_s3_uri(filename):
+                self._reader = s3.S3Stream(filename)
+            else:
+                self._reader = open(filename, 'rb' if compressed else 'rt')
         self.filename = filename
         if compressed:
-            self._reader = gzip.GzipFile(fileobj=self._reader)
-            if sys.version > '3':
-                self._reader = codecs.getreader(encoding)(self._reader)
+            if self._at_bgzf_block():
+                if threads is None:
+                    threads = bgzf.default_threads()
+                # inflate whole blocks, ahead of the parser when threaded
+                self._reader = bgzf.BgzfReader(
+                    fileobj=self._reader, threads=threads,
+                    encoding=encoding if sys.version > '3' else None)
+            else:
+                self._reader = gzip.GzipFile(fileobj=self._reader)
+        if (sys.version > '3' and (compressed or s3.is_s3_uri(filename))
+                and not isinstance(self._reader, bgzf.BgzfReader)):
+            self._reader = codecs.getreader(encoding)(self._reader)
 
         if strict_whitespace:
             self._separator = '\t'
         else:
             self._separator = '\t| +'
 
+        self._strict = strict_whitespace
         self._row_pattern = re.compile(self._separator)
         self._alt_pattern = re.compile('[\[\]]')
 
-        self.reader = (line.strip() for line in self._reader if line.strip())
+        self.reader = _data_lines(self._reader)
 
         #: metadata fields from header (string or hash, depending)
         self.metadata = None
@@ -297,14 +527,28 @@ class Reader(object):
         self._column_headers = []
         self._tabix = None
         self._prepend_chr = prepend_chr
-        self._parse_metainfo()
+        self._sample_columns = None
+        self._maxsplit = 0
+        self._parse_metainfo(samples, header_cache)
         self._format_cache = {}
+        self._info_cache = {}
+        self._info_fields = None
+        if info_fields is not None:
+            self._info_fields = frozenset(info_fields)
         self.encoding = encoding
 
     def __iter__(self):
         return self
 
-    def _parse_metainfo(self):
+    def _at_bgzf_block(self):
+        '''True if the raw input is a seekable stream at a BGZF block.'''
+        try:
+            return bgzf.at_block(self._reader)
+        except (AttributeError, IOError, ValueError):
+            # pipes and other streams that cannot seek
+            return False
+
+    def _parse_metainfo(self, samples=None, header_cache=None):
         '''Parse the information stored in the metainfo of the VCF.
 
         The end user shouldn't have to use this.  She can access the metainfo
@@ -312,47 +556,122 @@ class Reader(object):
         for attr in ('metadata', 'infos', 'filters', 'alts', 'contigs', 'formats'):
             setattr(self, attr, OrderedDict())
 
-        parser = _vcf_metadata_parser()
+        cache_file = cached = None
+        if header_cache is not None:
+            cache_file, key = _header_cache_file(header_cache, self.filename)
+            if cache_file is not None:
+                cached = _read_header_cache(cache_file, key)
+
+        if cached is not None:
+            line = next(self.reader)
+            while line.startswith('##'):
+                self._header_lines.append(line)
+                line = next(self.reader)
+            if len(self._header_lines) == cached[0]:
+                self._restore_header(cached[1])
+            else:
+                parser = _vcf_metadata_parser()
+                for meta_line in self._header_lines:
+                    self._parse_meta_line(meta_line, parser)
+                cached = None
+        else:
+            line = self._parse_meta_lines()
+
+        if cache_file is not None and cached is None:
+            _write_header_cache(cache_file, key, len(self._header_lines),
+                                self._header_state())
+
+        fields = self._row_pattern.split(line[1:])
+        self._column_headers = fields[:9]
+        self.samples = fields[9:]
+        if samples is not None:
+            self._project_samples(samples)
+        self._sample_indexes = dict([(x,i) for (i,x) in enumerate(self.samples)])
 
+    def _parse_meta_lines(self):
+        '''Parse the ## lines, return the #CHROM line after them.'''
+        parser = _vcf_metadata_parser()
         line = next(self.reader)
         while line.startswith('##'):
             self._header_lines.append(line)
+            self._parse_meta_line(line, parser)
+            line = next(self.reader)
+        return line
 
-            if line.startswith('##INFO'):
-                key, val = parser.read_info(line)
-                self.infos[key] = val
+    def _parse_meta_line(self, line, parser):
+        '''Add one ## line to the header dicts.'''
+        # contig lines come first, there are thousands of them in GRCh38
+        if line.startswith('##contig'):
+            key, val = parser.read_contig(line)
+            self.contigs[key] = val
 
-            elif line.startswith('##FILTER'):
-                key, val = parser.read_filter(line)
-                self.filters[key] = val
+        elif line.startswith('##INFO'):
+            key, val = parser.read_info(line)
+            self.infos[key] = val
 
-            elif line.startswith('##ALT'):
-                key, val = parser.read_alt(line)
-                self.alts[key] = val
+        elif line.startswith('##FILTER'):
+            key, val = parser.read_filter(line)
+            self.filters[key] = val
 
-            elif line.startswith('##FORMAT'):
-                key, val = parser.read_format(line)
-                self.formats[key] = val
+        elif line.startswith('##ALT'):
+            key, val = parser.read_alt(line)
+            self.alts[key] = val
 
-            elif line.startswith('##contig'):
-                key, val = parser.read_contig(line)
-                self.contigs[key] = val
+        elif line.startswith('##FORMAT'):
+            key, val = parser.read_format(line)
+            self.formats[key] = val
 
+        else:
+            key, val = parser.read_meta(line)
+            if key in SINGULAR_METADATA:
+                self.metadata[key] = val
             else:
-                key, val = parser.read_meta(line)
-                if key in SINGULAR_METADATA:
-                    self.metadata[key] = val
-                else:
-                    if key not in self.metadata:
-                        self.metadata[key] = []
-                    self.metadata[key].append(val)
-
-            line = next(self.reader)
-
-        fields = self._row_pattern.split(line[1:])
-        self._column_headers = fields[:9]
-        self.samples = fields[9:]
-        self._sample_indexes = dict([(x,i) for (i,x) in enumerate(self.samples)])
+                if key not in self.metadata:
+                    self.metadata[key] = []
+                self.metadata[key].append(val)
+
+    def _header_state(self):
+        '''The parsed header as plain picklable values.'''
+        state = {'metadata': self.metadata}
+        for (attr, _) in _HEADER_FIELDS:
+            state[attr] = [tuple(val) for val in getattr(self, attr).values()]
+        return state
+
+    def _restore_header(self, state):
+        '''Set the header dicts from a ``_header_state``.'''
+        self.metadata = state['metadata']
+        for (attr, field) in _HEADER_FIELDS:
+            setattr(self, attr, OrderedDict(
+                (val[0], field(*val)) for val in state[attr]))
+
+    def _project_samples(self, samples):
+        '''Restrict parsing to the given samples.
+
+        The columns are looked up once here, so records only split the line
+        as far as the last wanted column and slice out those columns.'''
+        columns = dict((name, i + 9) for (i, name) in enumerate(self.samples))
+        missing = [name for name in samples if name not in columns]
+        if missing:
+            raise ValueError('Samples not found in the VCF header: %s'
+                             % ', '.join(missing))
+        self._sample_columns = [columns[name] for name in samples]
+        self._maxsplit = max(self._sample_columns or [8]) + 1
+        self.samples = list(samples)
+
+    def _split_row(self, line):
+        '''Split a data line into columns, up to ``_maxsplit`` splits.
+
+        Lines without spaces only need ``str.split``, the regex is kept for
+        space separated files when whitespace is not strict.'''
+        if self._strict or ' ' not in line:
+            return line.split('\t', self._maxsplit or -1)
+        return self._row_pattern.split(line, self._maxsplit)
+
+    def _sample_fields(self, row):
+        '''The sample columns of a split data line.'''
+        if self._sample_columns is None:
+            return row[9:]
+        return [row[i] for i in self._sample_columns]
 
     def _map(self, func, iterable, bad=['.', '']):
         '''``map``, but make bad values None.'''
@@ -376,57 +695,73 @@ class Reader(object):
         '''Parse the INFO field of a VCF entry into a dictionary of Python
         types.
 
+        Every key is converted by the function ``_info_converter`` picked
+        for it the first time it was seen.
+
+        NOTE: this method has a cython equivalent and care must be taken
+        to keep the two methods equivalent
         '''
+        if self._info_fields is not None:
+            return self._parse_info_lazy(info_str)
+
+        if cparse:
+            return _RecordInfo(cparse.parse_info(info_str, self._info_cache, self._info_converter))
+
         if info_str == '.':
-            return {}
+            return _RecordInfo()
 
-        entries = info_str.split(';')
+        converters = self._info_cache
         retdict = {}
 
-        for entry in entries:
-            entry = entry.split('=', 1)
-            ID = entry[0]
+        for entry in info_str.split(';'):
+            ID, sep, value = entry.partition('=')
             try:
-                entry_type = self.infos[ID].type
+                convert = converters[ID]
             except KeyError:
-                try:
-                    entry_type = RESERVED_INFO[ID]
-                except KeyError:
-                    if entry[1:]:
-                        entry_type = 'String'
-                    else:
-                        entry_type = 'Flag'
+                convert = converters[ID] = self._info_converter(ID)
+            retdict[ID] = convert(value if sep else None)
 
-            if entry_type == 'Integer':
-                vals = entry[1].split(',')
-                try:
-                    val = self._map(int, vals)
-                # Allow specified integers to be flexibly parsed as floats.
-                # Handles cases with incorrectly specified header types.
-                except ValueError:
-                    val = self._map(float, vals)
-            elif entry_type == 'Float':
-                vals = entry[1].split(',')
-                val = self._map(float, vals)
-            elif entry_type == 'Flag':
-                val = True
-            elif entry_type in ('String', 'Character'):
-                try:
-                    vals = entry[1].split(',') # commas are reserved characters indicating multiple values
-                    val = self._map(str, vals)
-                except IndexError:
-                    entry_type = 'Flag'
-                    val = True
+        return _RecordInfo(retdict)
 
-            try:
-                if self.infos[ID].num == 1 and entry_type not in ( 'Flag', ):
-                    val = val[0]
-            except KeyError:
-                pass
+    def _parse_info_lazy(self, info_str):
+        '''Parse the INFO field into a ``_LazyInfo``, decoding only the keys
+        in ``info_fields`` now.'''
+        if info_str == '.':
+            return _RecordInfo()
 
-            retdict[ID] = val
+        wanted = self._info_fields
+        decoded = {}
+        raw = {}
 
-        return retdict
+        for entry in info_str.split(';'):
+            ID, sep, value = entry.partition('=')
+            if ID in wanted:
+                decoded[ID] = self._convert_info(ID, value if sep else None)
+            else:
+                raw[ID] = value if sep else None
+
+        return _LazyInfo(decoded, raw, self._convert_info)
+
+    def _convert_info(self, ID, value):
+        '''Convert the text of one INFO key, None for a key without value.'''
+        try:
+            convert = self._info_cache[ID]
+        except KeyError:
+            convert = self._info_cache[ID] = self._info_converter(ID)
+        return convert(value)
+
+    def _info_converter(self, ID):
+        """ The function converting the values of an INFO key.
+
+        The type comes from the header, then the reserved keys; other keys
+        are strings, or flags when they have no value.  Keys declared with
+        Number=1 convert to a single value instead of a list.
+        """
+        info = self.infos.get(ID)
+        if info is not None:
+            converters = _INFO_CONVERTERS.get(info.type, _INFO_CONVERTERS['String'])
+            return converters[1] if info.num == 1 else converters[0]
+        return _INFO_CONVERTERS[RESERVED_INFO.get(ID, 'String')][0]
 
     def _parse_sample_format(self, samp_fmt):
         """ Parse the format of the calls in this _Record """
@@ -447,81 +782,89 @@ class Reader(object):
         return samp_fmt
 
     def _parse_samples(self, samples, samp_fmt, site):
-        '''Parse a sample entry according to the format specified in the FORMAT
-        column.
+        '''Wrap the sample entries of a record in a ``_LazyCalls`` list.
 
-        NOTE: this method has a cython equivalent and care must be taken
-        to keep the two methods equivalent
+        Each entry is only parsed according to the format specified in the
+        FORMAT column, by ``_parse_sample``, the first time it is accessed.
         '''
 
         # check whether we already know how to parse this format
         if samp_fmt not in self._format_cache:
             self._format_cache[samp_fmt] = self._parse_sample_format(samp_fmt)
         samp_fmt = self._format_cache[samp_fmt]
+        names = self.samples
 
-        if cparse:
-            return cparse.parse_samples(
-                self.samples, samples, samp_fmt, samp_fmt._types, samp_fmt._nums, site)
+        def decode(i, sample):
+            return self._parse_sample(names[i], sample, samp_fmt, site)
 
-        samp_data = []
-        _map = self._map
+        return _LazyCalls(samples, decode)
 
-        nfields = len(samp_fmt._fields)
+    def _parse_sample(self, name, sample, samp_fmt, site):
+        '''Parse a single sample entry into a ``_Call``.
 
-        for name, sample in itertools.izip(self.samples, samples):
+        NOTE: this method has a cython equivalent and care must be taken
+        to keep the two methods equivalent
+        '''
+        if cparse:
+            return cparse.parse_sample(
+                name, sample, samp_fmt, samp_fmt._types, samp_fmt._nums, site)
 
-            # parse the data for this sample
-            sampdat = [None] * nfields
+        _map = self._map
 
-            for i, vals in enumerate(sample.split(':')):
+        # parse the data for this sample
+        sampdat = [None] * len(samp_fmt._fields)
 
-                # short circuit the most common
-                if samp_fmt._fields[i] == 'GT':
-                    sampdat[i] = vals
-                    continue
-                # genotype filters are a special case
-                elif samp_fmt._fields[i] == 'FT':
-                    sampdat[i] = self._parse_filter(vals)
-                    continue
-                elif not vals or vals == ".":
-                    sampdat[i] = None
-                    continue
+        for i, vals in enumerate(sample.split(':')):
 
-                entry_num = samp_fmt._nums[i]
-                entry_type = samp_fmt._types[i]
-
-                # we don't need to split single entries
-                if entry_num == 1:
-                    if entry_type == 'Integer':
-                        try:
-                            sampdat[i] = int(vals)
-                        except ValueError:
-                            sampdat[i] = float(vals)
-                    elif entry_type == 'Float' or entry_type == 'Numeric':
-                        sampdat[i] = float(vals)
-                    else:
-                        sampdat[i] = vals
-                    continue
+            # short circuit the most common
+            if samp_fmt._fields[i] == 'GT':
+                sampdat[i] = vals
+                continue
+            # genotype filters are a special case
+            elif samp_fmt._fields[i] == 'FT':
+                sampdat[i] = self._parse_filter(vals)
+                continue
+            elif not vals or vals == ".":
+                sampdat[i] = None
+                continue
+
+            entry_num = samp_fmt._nums[i]
+            entry_type = samp_fmt._types[i]
 
-                vals = vals.split(',')
+            # we don't need to split single entries
+            if entry_num == 1:
                 if entry_type == 'Integer':
                     try:
-                        sampdat[i] = _map(int, vals)
+                        sampdat[i] = int(vals)
                     except ValueError:
-                        sampdat[i] = _map(float, vals)
+                        sampdat[i] = float(vals)
                 elif entry_type == 'Float' or entry_type == 'Numeric':
-                    sampdat[i] = _map(float, vals)
+                    sampdat[i] = float(vals)
                 else:
                     sampdat[i] = vals
+                continue
 
-            # create a call object
-            call = _Call(site, name, samp_fmt(*sampdat))
-            samp_data.append(call)
+            vals = vals.split(',')
+            if entry_type == 'Integer':
+                try:
+                    sampdat[i] = _map(int, vals)
+                except ValueError:
+                    sampdat[i] = _map(float, vals)
+            elif entry_type == 'Float' or entry_type == 'Numeric':
+                sampdat[i] = _map(float, vals)
+            else:
+                sampdat[i] = vals
 
-        return samp_data
+        # create a call object
+        return _Call(site, name, samp_fmt(*sampdat))
 
     def _parse_alt(self, str):
-        if self._alt_pattern.search(str) is not None:
+        if str in _SNV_BASES:
+            return _new_snv(str)
+        if str.isalpha():
+            # plain bases, by far the most common case after SNVs
+            return _Substitution(str)
+        if '[' in str or ']' in str:
             # Paired breakend
             items = self._alt_pattern.split(str)
             remoteCoords = items[1].split(':')
@@ -533,7 +876,7 @@ class Reader(object):
                 withinMainAssembly = True
             pos = remoteCoords[1]
             orientation = (str[0] == '[' or str[0] == ']')
-            remoteOrientation = (re.search('\[', str) is not None)
+            remoteOrientation = '[' in str
             if orientation:
                 connectingSequence = items[2]
             else:
@@ -548,10 +891,17 @@ class Reader(object):
         else:
             return _Substitution(str)
 
-    def next(self):
+    def __next__(self):
         '''Return the next record in the file.'''
-        line = next(self.reader)
-        row = self._row_pattern.split(line.rstrip())
+        return self._parse_line(next(self.reader))
+
+    next = __next__  # Python 2
+
+    def _parse_line(self, line):
+        '''Parse a data line into a ``_Record``.
+
+        ``line`` is stripped already, as ``self.reader`` yields it.'''
+        row = self._split_row(line)
         chrom = row[0]
         if self._prepend_chr:
             chrom = 'chr' + chrom
@@ -563,15 +913,12 @@ class Reader(object):
             ID = None
 
         ref = row[3]
-        alt = self._map(self._parse_alt, row[4].split(','))
+        if row[4] in _SNV_BASES:
+            alt = [_new_snv(row[4])]
+        else:
+            alt = self._map(self._parse_alt, row[4].split(','))
 
-        try:
-            qual = int(row[5])
-        except ValueError:
-            try:
-                qual = float(row[5])
-            except ValueError:
-                qual = None
+        qual = _parse_qual(row[5])
 
         filt = self._parse_filter(row[6])
         info = self._parse_info(row[7])
@@ -587,12 +934,177 @@ class Reader(object):
         record = _Record(chrom, pos, ID, ref, alt, qual, filt,
                 info, fmt, self._sample_indexes)
 
+        columns = row[:9]
+        columns[0] = chrom
+        record._raw = (columns, (chrom, pos, ID, ref, tuple(alt), qual,
+                                 tuple(filt) if filt is not None else None,
+                                 info, fmt), self._parse_info)
+
         if fmt is not None:
-            samples = self._parse_samples(row[9:], fmt, record)
+            samples = self._parse_samples(self._sample_fields(row), fmt, record)
             record.samples = samples
 
         return record
 
+    def iter_blocks(self, n_records, fields=('GT', 'DP', 'GQ')):
+        """ Iterate over the remaining records in blocks of NumPy arrays.
+
+            Each block is a ``Block`` namedtuple with one row per site:
+            ``CHROM``, ``POS``, ``REF``, ``ALT`` (a list of strings per
+            site), ``QUAL`` (NaN when missing) and ``calldata``, a dict
+            holding a sites x samples array for every name in ``fields``.
+
+            ``GT`` is stored as int8 ``gt_type`` codes (hom_ref = 0,
+            het = 1, hom_alt = 2, uncalled = -1).  Other FORMAT fields are
+            int32 (missing is -1) or float32 (missing is NaN) following
+            their header type.  Fields with more than one value per sample,
+            like AD or PL, get a third axis as wide as the longest value in
+            the block, padded with the missing value.
+
+            No ``_Record`` or ``_Call`` objects are built, which makes this
+            the mode to use for whole-cohort scans.  Every block holds
+            ``n_records`` sites except possibly the last one.
+
+            requires numpy
+        """
+        if not numpy:
+            raise Exception('numpy not available, try "pip install numpy"?')
+        if n_records < 1:
+            raise ValueError('n_records must be at least 1')
+
+        specs = [self._block_field_spec(field) for field in fields]
+        while True:
+            lines = list(itertools.islice(self.reader, n_records))
+            if not lines:
+                return
+            yield self._parse_block(lines, specs)
+
+    def iter_record_blocks(self, n_records, fields=None):
+        """ Iterate over the remaining records in lists of ``n_records``.
+
+            Yields ``(records, block)`` pairs.  When ``fields`` is given,
+            ``block`` is the ``Block`` that ``iter_blocks`` would build for
+            the same sites, holding the FORMAT fields in ``fields`` (which
+            may be empty).  Without ``fields``, or without numpy, ``block``
+            is None.  This lets filters use arrays where they can and fall
+            back to the records otherwise.
+        """
+        if n_records < 1:
+            raise ValueError('n_records must be at least 1')
+
+        specs = None
+        if fields is not None and numpy:
+            specs = [self._block_field_spec(field) for field in fields]
+        while True:
+            lines = list(itertools.islice(self.reader, n_records))
+            if not lines:
+                return
+            records = [self._parse_line(line) for line in lines]
+            block = self._parse_block(lines, specs) if specs is not None else None
+            yield records, block
+
+    def _block_field_spec(self, field):
+        """ Work out (name, dtype, missing value, single) for a block field """
+        if field == 'GT':
+            return (field, numpy.int8, -1, True)
+        try:
+            entry_type = self.formats[field].type
+            single = self.formats[field].num == 1
+        except KeyError:
+            entry_type = RESERVED_FORMAT.get(field, 'String')
+            single = field in SINGLE_FORMAT
+        if entry_type == 'Integer':
+            return (field, numpy.int32, -1, single)
+        elif entry_type == 'Float':
+            return (field, numpy.float32, numpy.nan, single)
+        raise ValueError('Only GT and numeric FORMAT fields can be read '
+                         'in blocks, not %s (%s)' % (field, entry_type))
+
+    def _parse_block(self, lines, specs):
+        """ Convert raw data lines into a ``Block`` of arrays """
+        n_sites = len(lines)
+        n_samples = len(self.samples)
+
+        chrom = numpy.empty(n_sites, dtype=object)
+        pos = numpy.empty(n_sites, dtype=numpy.int64)
+        ref = numpy.empty(n_sites, dtype=object)
+        alt = numpy.empty(n_sites, dtype=object)
+        qual = numpy.empty(n_sites, dtype=numpy.float64)
+        # raw FORMAT substrings per field, one list of samples per site
+        raw = dict((spec[0], [None] * n_sites) for spec in specs)
+
+        for i, line in enumerate(lines):
+            row = self._split_row(line)
+            chrom[i] = 'chr' + row[0] if self._prepend_chr else row[0]
+            pos[i] = int(row[1])
+            ref[i] = row[3]
+            alt[i] = row[4].split(',')
+            try:
+                qual[i] = float(row[5])
+            except ValueError:
+                qual[i] = numpy.nan
+
+            if len(row) < 9 or row[8] == '.':
+                continue
+            keys = row[8].split(':')
+            calls = [sample.split(':') for sample in self._sample_fields(row)]
+            for spec in specs:
+                try:
+                    j = keys.index(spec[0])
+                except ValueError:
+                    continue
+                raw[spec[0]][i] = [call[j] if len(call) > j else '.'
+                                   for call in calls]
+
+        calldata = {}
+        for (name, dtype, missing, single) in specs:
+            if name == 'GT':
+                calldata[name] = self._block_gt(raw[name], n_samples)
+            else:
+                calldata[name] = self._block_values(
+                    raw[name], n_samples, dtype, missing, single)
+
+        return _Block(chrom, pos, ref, alt, qual, calldata)
+
+    def _block_gt(self, raw, n_samples):
+        codes = numpy.full((len(raw), n_samples), -1, dtype=numpy.int8)
+        for i, site in enumerate(raw):
+            if site is not None:
+                codes[i] = [gt_type_code(gt) for gt in site]
+        return codes
+
+    def _block_values(self, raw, n_samples, dtype, missing, single):
+        convert = int if dtype is numpy.int32 else float
+        bad = ('.', '')
+
+        def value(val):
+            if val in bad:
+                return missing
+            try:
+                return convert(val)
+            except ValueError:
+                # Integer fields can carry floats, see _parse_samples
+                return convert(float(val))
+
+        if single:
+            values = numpy.full((len(raw), n_samples), missing, dtype=dtype)
+            for i, site in enumerate(raw):
+                if site is not None:
+                    values[i] = [value(val) for val in site]
+            return values
+
+        split = [[val.split(',') for val in site] if site is not None else None
+                 for site in raw]
+        width = max([len(vals) for site in split if site is not None
+                     for vals in site] or [1])
+        values = numpy.full((len(raw), n_samples, width), missing, dtype=dtype)
+        for i, site in enumerate(split):
+            if site is None:
+                continue
+            for k, vals in enumerate(site):
+                values[i, k, :len(vals)] = [value(val) for val in vals]
+        return values
+
     def fetch(self, chrom, start=None, end=None):
         """ Fetches records from a tabix-indexed VCF file and returns an
             iterable of ``_Record`` instances
@@ -618,37 +1130,88 @@ class Reader(object):
             If start and end are omitted, all variants on chrom will be
             returned.
 
-            requires pysam
+            Uses pysam when it is installed, otherwise the ``.tbi`` or
+            ``.csi`` index next to the BGZF compressed file is read directly.
 
         """
-        if not pysam:
-            raise Exception('pysam not available, try "pip install pysam"?')
         if not self.filename:
             raise Exception('Please provide a filename (or a "normal" fsock)')
 
-        if not self._tabix:
-            self._tabix = pysam.Tabixfile(self.filename,
-                                          encoding=self.encoding)
-
         if self._prepend_chr and chrom[:3] == 'chr':
             chrom = chrom[3:]
 
-        self.reader = self._tabix.fetch(chrom, start, end)
+        if pysam:
+            if not self._tabix:
+                self._tabix = pysam.Tabixfile(self.filename,
+                                              encoding=self.encoding)
+            self.reader = self._tabix.fetch(chrom, start, end)
+            return self
+
+        if not self._tabix:
+            index_file = index.find_index(self.filename)
+            if index_file is None:
+                raise Exception('No .tbi or .csi index found for %s, '
+                                'try "tabix -p vcf"?' % self.filename)
+            self._tabix = index.read_index(index_file)
+
+        self.reader = self._fetch_lines(chrom, start, end)
         return self
 
+    def _fetch_lines(self, chrom, start, end):
+        """ Data lines overlapping a region, read through the index """
+        start = start or 0
+        handle = bgzf.BgzfReader(self.filename)
+        try:
+            for (begin, stop) in self._tabix.chunks(chrom, start, end):
+                handle.seek(begin)
+                while handle.tell() < stop:
+                    line = handle.readline()
+                    if not line:
+                        break
+                    if not isinstance(line, str):
+                        line = line.decode(self.encoding)
+                    line = line.rstrip()
+                    row = line.split('\t', 8)
+                    if row[0] != chrom:
+                        continue
+                    rec_start = int(row[1]) - 1
+                    if end is not None and rec_start >= end:
+                        return
+                    # like tabix, an END in INFO extends the record
+                    rec_end = rec_start + len(row[3])
+                    match = _end_pattern.search(row[7]) if len(row) > 7 else None
+                    if match:
+                        rec_end = max(rec_end, int(match.group(1)))
+                    if rec_end > start:
+                        yield line
+        finally:
+            handle.close()
+
 
 class Writer(object):
-    """VCF Writer. On Windows Python 2, open stream with 'wb'."""
+    """VCF Writer. On Windows Python 2, open stream with 'wb'.
+
+    With ``compressed=True`` the output is BGZF compressed, as with bgzip,
+    on ``threads`` threads (default ``bgzf.default_threads()``), and the
+    stream must be opened in binary mode.  With ``indexed`` as well, a
+    tabix index of the file is written next to it on ``close``, see
+    ``index.IndexingWriter``."""
 
     # Reverse keys and values in header field count dictionary
     counts = dict((v,k) for k,v in field_counts.iteritems())
 
-    def __init__(self, stream, template, lineterminator="\n"):
-        self.writer = csv.writer(stream, delimiter="\t",
-                                 lineterminator=lineterminator,
-                                 quotechar='', quoting=csv.QUOTE_NONE)
+    def __init__(self, stream, template, lineterminator="\n", compressed=False,
+                 threads=None, encoding='ascii', indexed=False):
+        if indexed and not compressed:
+            raise ValueError('Only a compressed VCF can be indexed')
+        if compressed:
+            if threads is None:
+                threads = bgzf.default_threads()
+            writer = index.IndexingWriter if indexed else bgzf.BgzfWriter
+            stream = writer(fileobj=stream, threads=threads, encoding=encoding)
         self.template = template
         self.stream = stream
+        self.lineterminator = lineterminator
 
         # Order keys for INFO fields defined in the header (undefined fields
         # get a maximum key).
@@ -692,15 +1255,77 @@ class Writer(object):
 
     def write_record(self, record):
         """ write a record to the file """
+        self.stream.write(self._format_record(record))
+
+    def write_records(self, records, batch_size=1000):
+        """ write records to the file, ``batch_size`` lines per write call """
+        batch = []
+        for record in records:
+            batch.append(self._format_record(record))
+            if len(batch) >= batch_size:
+                self.stream.writelines(batch)
+                batch = []
+        if batch:
+            self.stream.writelines(batch)
+
+    def _format_record(self, record):
+        """ The line of a record, reusing its source text where unchanged """
+        ffs = self._site_columns(record)
+        samples = record.samples
+        raw = record._raw
+        if (type(samples) is _LazyCalls and raw is not None
+                and record.FORMAT == raw[1][8]):
+            # samples that were never accessed cannot have changed
+            ffs.extend(self._format_sample(record.FORMAT, call)
+                       if call is not None else column
+                       for column, call in zip(samples._raw, samples._calls))
+        else:
+            ffs.extend(self._format_sample(record.FORMAT, sample)
+                       for sample in samples)
+        return '\t'.join(ffs) + self.lineterminator
+
+    def _site_columns(self, record):
+        """ The CHROM to FORMAT columns of a record.
+
+            Records read by ``Reader`` keep the text of these columns.  It is
+            written as is when none of the fields changed, and INFO, the
+            costly column to format, is reused whenever it did not change.
+            ALT and the list values of INFO may be changed in place, so
+            they are compared by value with their source text.
+        """
+        info = record.INFO
+        filt = record.FILTER
+        raw = record._raw
+        info_same = qual_same = False
+        if raw is not None:
+            columns, fields, parse_info = raw
+            qual_same = record.QUAL == fields[5]
+            info_same = (fields[7] is info and not info._changed
+                         and _lists_unchanged(info, columns[7], parse_info))
+            if info_same and fields == (
+                    record.CHROM, record.POS, record.ID, record.REF,
+                    tuple(record.ALT), record.QUAL,
+                    tuple(filt) if isinstance(filt, list) else filt,
+                    info, record.FORMAT) \
+                    and self._format_alt(record.ALT) == columns[4]:
+                return list(columns)
+
         ffs = self._map(str, [record.CHROM, record.POS, record.ID, record.REF]) \
-              + [self._format_alt(record.ALT), record.QUAL or '.', self._format_filter(record.FILTER),
-                 self._format_info(record.INFO)]
+              + [self._format_alt(record.ALT),
+                 columns[5] if qual_same else self._format_qual(record.QUAL),
+                 self._format_filter(filt),
+                 columns[7] if info_same else self._format_info(info)]
         if record.FORMAT:
             ffs.append(record.FORMAT)
+        return ffs
 
-        samples = [self._format_sample(record.FORMAT, sample)
-            for sample in record.samples]
-        self.writer.writerow(ffs + samples)
+    def _format_qual(self, qual):
+        # repr keeps every digit of a float, as csv.writer did
+        if not qual:
+            return '.'
+        if isinstance(qual, float):
+            return repr(qual)
+        return str(qual)
 
     def flush(self):
         """Flush the writer"""
@@ -0,0 +1,165 @@
+"""
+Streaming reads of VCF files stored on S3.
+
+``S3Stream`` is a read-only, seekable file object over one S3 object.  It
+fetches the object in fixed size chunks with ranged GETs, keeping a few
+chunks ahead of the read position in flight on a thread pool, so parsing
+can start right away and the file never has to be written to disk.
+
+``Reader(filename='s3://bucket/key.vcf.gz')`` opens one of these; BGZF
+compressed objects are inflated block by block with ``bgzf.BgzfReader``.
+
+requires boto3, unless an S3 client is passed in
+"""
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+
+#: bytes per ranged GET
+CHUNK_SIZE = 8 << 20
+#: chunks requested ahead of the one being read
+READ_AHEAD = 4
+
+
+def is_s3_uri(name):
+    """ Return True for an ``s3://bucket/key`` location """
+    return isinstance(name, basestring) and name.startswith('s3://')
+
+
+def parse_s3_uri(uri):
+    """ Split ``s3://bucket/key`` into ``(bucket, key)`` """
+    if not is_s3_uri(uri):
+        raise ValueError('Not an S3 URI: %s' % uri)
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    if not bucket or not key:
+        raise ValueError('S3 URI needs a bucket and a key: %s' % uri)
+    return bucket, key
+
+
+class S3Stream(object):
+    """ Read-only binary file object over an S3 object.
+
+        The object is fetched ``chunk_size`` bytes at a time.  Reading a
+        chunk also requests the ``read_ahead`` chunks after it, which are
+        downloaded in parallel on ``threads`` threads.  Seeking is
+        supported; a seek outside the chunks in flight just starts fetching
+        from the new position.
+
+        ``client`` is a boto3 S3 client, one is created when not given.
+    """
+
+    def __init__(self, uri, client=None, chunk_size=CHUNK_SIZE,
+                 read_ahead=READ_AHEAD, threads=None):
+        if client is None:
+            if boto3 is None:
+                raise Exception('boto3 not available, try "pip install boto3"?')
+            client = boto3.client('s3')
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+        self.name = uri
+        self.bucket, self.key = parse_s3_uri(uri)
+        self.chunk_size = chunk_size
+        self.read_ahead = read_ahead
+        self._client = client
+        self.size = client.head_object(Bucket=self.bucket, Key=self.key)['ContentLength']
+        self._pool = ThreadPool(threads or max(read_ahead, 1))
+        self._lock = threading.Lock()
+        # chunk index -> AsyncResult of its GET
+        self._pending = {}
+        self._chunk_index = None
+        self._chunk = b''
+        self._pos = 0
+        self.closed = False
+
+    def _fetch(self, index):
+        """ GET one chunk, run on the pool """
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.size) - 1
+        response = self._client.get_object(
+            Bucket=self.bucket, Key=self.key, Range='bytes=%d-%d' % (start, end))
+        return response['Body'].read()
+
+    def _load(self, index):
+        """ Make chunk ``index`` the current one and queue the read-ahead """
+        n_chunks = (self.size + self.chunk_size - 1) // self.chunk_size
+        wanted = range(index, min(index + self.read_ahead + 1, n_chunks))
+        with self._lock:
+            # forget chunks behind us or past the read-ahead after a seek
+            for stale in [i for i in self._pending if i not in wanted]:
+                del self._pending[stale]
+            for i in wanted:
+                if i not in self._pending:
+                    self._pending[i] = self._pool.apply_async(self._fetch, (i,))
+            result = self._pending.pop(index)
+        self._chunk = result.get()
+        self._chunk_index = index
+
+    def _current(self):
+        """ The current chunk and the offset of the position in it, or
+            (None, 0) at the end of the object """
+        if self._pos >= self.size:
+            return None, 0
+        index = self._pos // self.chunk_size
+        if index != self._chunk_index:
+            self._load(index)
+        within = self._pos - index * self.chunk_size
+        if within >= len(self._chunk):
+            raise IOError('Short read of %s at byte %d' % (self.name, self._pos))
+        return self._chunk, within
+
+    def read(self, size=-1):
+        """ Read up to ``size`` bytes, everything left if negative """
+        if size is None or size < 0:
+            size = self.size - self._pos
+        parts = []
+        while size > 0:
+            chunk, within = self._current()
+            if chunk is None:
+                break
+            data = chunk[within:within + size]
+            parts.append(data)
+            self._pos += len(data)
+            size -= len(data)
+        return b''.join(parts)
+
+    def readline(self):
+        """ Read one line, including the newline, b'' at end of object """
+        parts = []
+        while True:
+            chunk, within = self._current()
+            if chunk is None:
+                break
+            idx = chunk.find(b'\n', within)
+            end = idx + 1 if idx >= 0 else len(chunk)
+            parts.append(chunk[within:end])
+            self._pos += end - within
+            if idx >= 0:
+                break
+        return b''.join(parts)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self.size
+        if offset < 0:
+            raise IOError('Negative seek position %d' % offset)
+        self._pos = offset
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._pool.terminate()
+            self._pending.clear()
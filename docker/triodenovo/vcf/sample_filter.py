@@ -12,35 +12,12 @@ from parser import Reader, Writer
 
 class SampleFilter(object):
     """
-    Modifies the vcf Reader to filter each row by sample as it is parsed.
+    Filters a VCF by sample, with a Reader that only parses the kept samples.
 
     """
 
     def __init__(self, infile, outfile=None, filters=None, invert=False):
-        # Methods to add to Reader
-        def get_filter(self):
-            return self._samp_filter
-
-        def set_filter(self, filt):
-            self._samp_filter = filt
-            if filt:
-                self.samples = [val for idx, val in enumerate(self.samples)
-                               if idx not in set(filt)]
-
-        def filter_samples(fn):
-            """Decorator function to filter sample parameter"""
-            def filt(self, samples, *args):
-                samples = [val for idx, val in enumerate(samples)
-                           if idx not in set(self.sample_filter)]
-                return fn(self, samples, *args)
-            return filt
-
-        # Add property to Reader for filter list
-        Reader.sample_filter = property(get_filter, set_filter)
-        Reader._samp_filter = []
-        # Modify Reader._parse_samples to filter samples
-        self._orig_parse_samples = Reader._parse_samples
-        Reader._parse_samples = filter_samples(Reader._parse_samples)
+        self.infile = infile
         self.parser = Reader(filename=infile)
         # Store initial samples and indices
         self.samples = self.parser.samples
@@ -53,12 +30,6 @@ class SampleFilter(object):
             self.set_filters()
             self.write()
 
-    def __del__(self):
-        try:
-            self._undo_monkey_patch()
-        except AttributeError:
-            pass
-
     def set_filters(self, filters=None, invert=False):
         """Convert filters from string to list of indices, set on Reader"""
         if filters is not None:
@@ -89,8 +60,10 @@ class SampleFilter(object):
         if self.invert:
             filters = set(xrange(len(self.samples))).difference(filters)
 
-        # `sample_filter` setter updates `samples`
-        self.parser.sample_filter = filters
+        keep = [val for idx, val in enumerate(self.samples)
+                if idx not in filters]
+        self.parser._reader.close()
+        self.parser = Reader(filename=self.infile, samples=keep)
         if len(self.parser.samples) == 0:
             warnings.warn("Number of samples to keep is zero", RuntimeWarning)
         logging.info("Keeping these samples: {0}\n".format(self.parser.samples))
@@ -107,9 +80,4 @@ class SampleFilter(object):
             _out = open(self.outfile, "wb")
         logging.info("Writing to '{0}'\n".format(self.outfile))
         writer = Writer(_out, self.parser)
-        for row in self.parser:
-            writer.write_record(row)
-
-    def _undo_monkey_patch(self):
-        Reader._parse_samples = self._orig_parse_samples
-        delattr(Reader, 'sample_filter')
+        writer.write_records(self.parser)
@@ -0,0 +1,191 @@
+"""
+Scatter/gather of VCF processing over shards of a VCF.
+
+``plan_shards`` splits a VCF into shards of about the same amount of work.
+For a BGZF file with a ``.tbi`` or ``.csi`` index, a shard is a list of
+``(chrom, start, end)`` regions (zero-based, half-open, ``end`` None for
+the end of the contig), the shards follow each other in contig order and
+the work per region is estimated from the index (compressed bytes of the
+records in each 16kb window).  Every other file is split into the record
+aligned byte ranges of ``parallel.split_chunks``, so that no worker reads
+more of the file than its own share.
+
+A record belongs to the region or the byte range it starts in, so every
+record is in exactly one shard.  ``map_shards`` runs a function on a
+``Reader`` over every shard in a process pool and ``scatter_vcf``
+concatenates the VCFs written for the shards into one file, keeping the
+header of the first.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import bgzf
+import index
+from parallel import _imap, chunk_reader, split_chunks
+from parser import Reader
+
+
+def _index_units(idx):
+    """ (chrom, start, end, weight) per indexed window, in index order """
+    units = []
+    for name, bins in zip(idx.names, idx.bins):
+        weights = {}
+        for b, chunks in bins.items():
+            start = index.bin_start(b, idx.min_shift, idx.depth)
+            if start is None:
+                continue
+            weight = sum((end >> 16) - (begin >> 16) + 1 for (begin, end) in chunks)
+            weights[start] = weights.get(start, 0) + weight
+        starts = sorted(weights)
+        # the first region starts at 0 and the last runs to the end of the
+        # contig, so records outside the indexed windows are kept
+        bounds = [0] + starts[1:] + [None]
+        for i, start in enumerate(starts):
+            units.append((name, bounds[i], bounds[i + 1], weights[start]))
+    return units
+
+
+def plan_shards(filename, n_shards, **kwargs):
+    """ Split a VCF into at most ``n_shards`` shards, see the module docs.
+
+        Keyword arguments are accepted for symmetry with ``map_shards``,
+        the plan does not depend on them.
+    """
+    if n_shards < 1:
+        raise ValueError('n_shards must be at least 1')
+
+    index_file = index.find_index(filename) if bgzf.is_bgzf(filename) else None
+    if index_file is None:
+        return split_chunks(filename, n_shards)
+
+    units = _index_units(index.read_index(index_file))
+    if not units:
+        return []
+
+    total = float(sum(unit[3] for unit in units))
+    shards = [[]]
+    done = 0
+    for chrom, start, end, weight in units:
+        if shards[-1] and done >= total * len(shards) / n_shards:
+            shards.append([])
+        shard = shards[-1]
+        if shard and shard[-1][0] == chrom and shard[-1][2] == start:
+            shard[-1] = (chrom, shard[-1][1], end)
+        else:
+            shard.append((chrom, start, end))
+        done += weight
+    return shards
+
+
+def _in_region(row, start, end):
+    pos = int(row[1]) - 1
+    return pos >= start and (end is None or pos < end)
+
+
+def _indexed_lines(source, shard):
+    for chrom, start, end in shard:
+        for line in source.fetch(chrom, start, end).reader:
+            row = line.split('\t', 2)
+            if row[0] == chrom and _in_region(row, start, end):
+                yield line
+
+
+def shard_reader(filename, shard, **kwargs):
+    """ A ``Reader`` over the records that start in a shard """
+    if isinstance(shard, tuple):
+        # a byte range of split_chunks
+        return chunk_reader(filename, shard, **kwargs)
+    reader = Reader(filename=filename, **kwargs)
+    reader._reader.close()
+    source = Reader(filename=filename, **kwargs)
+    source._reader.close()
+    reader.reader = _indexed_lines(source, shard)
+    return reader
+
+
+def header_lines(reader):
+    """ The header of a ``Reader`` as text lines, ``#CHROM`` line last """
+    return reader._header_lines + [
+        '#' + '\t'.join(reader._column_headers + reader.samples)]
+
+
+def _run_shard(task):
+    filename, shard, fn, kwargs = task
+    return fn(shard_reader(filename, shard, **kwargs))
+
+
+def _write_shard(task):
+    filename, shard, fn, part, kwargs = task
+    with open(part, 'w') as handle:
+        fn(shard_reader(filename, shard, **kwargs), handle)
+
+
+def _shards(filename, workers, shards, kwargs):
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if shards is None:
+        shards = plan_shards(filename, workers * 4, **kwargs)
+    return workers, shards
+
+
+def map_shards(filename, fn, workers=None, shards=None, **kwargs):
+    """ Call ``fn(reader)`` on every shard of a VCF in a process pool.
+
+        Yields the return values in shard order.  ``shards`` defaults to
+        ``plan_shards`` with four shards per worker and ``workers`` to the
+        number of CPUs.  Other keyword arguments are passed on to ``Reader``.
+    """
+    workers, shards = _shards(filename, workers, shards, kwargs)
+    tasks = [(filename, shard, fn, kwargs) for shard in shards]
+    return _imap(_run_shard, tasks, workers)
+
+
+def _append_part(out, part, keep_header):
+    with open(part) as handle:
+        # readline, file iteration reads ahead of copyfileobj
+        for line in iter(handle.readline, ''):
+            if keep_header or not line.startswith('#'):
+                out.write(line)
+                break
+        shutil.copyfileobj(handle, out)
+
+
+def scatter_vcf(filename, fn, output, workers=None, shards=None,
+                indexed=False, **kwargs):
+    """ Run ``fn(reader, handle)`` on every shard of a VCF and gather the
+        results into ``output``.
+
+        ``fn`` writes a VCF, header included, for the records of ``reader``
+        to the text file ``handle``.  The files are concatenated in shard
+        order; the header is taken from the first shard and dropped from
+        the others.  They are written to a temporary directory next to
+        ``output``.  An ``output`` ending in .gz is BGZF compressed, and
+        with ``indexed`` gets a tabix index too.  See ``map_shards`` for
+        the other arguments.
+    """
+    workers, shards = _shards(filename, workers, shards, kwargs)
+    tmp_dir = tempfile.mkdtemp(prefix='.scatter',
+                               dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        parts = [os.path.join(tmp_dir, '%06d.vcf' % i) for i in range(len(shards))]
+        tasks = [(filename, shard, fn, part, kwargs)
+                 for (shard, part) in zip(shards, parts)]
+        for _ in _imap(_write_shard, tasks, workers):
+            pass
+        if output.endswith('.gz'):
+            writer = index.IndexingWriter if indexed else bgzf.BgzfWriter
+            out = writer(output, threads=bgzf.default_threads())
+        else:
+            out = open(output, 'w')
+        with out:
+            if not parts:
+                # nothing to split, fn still writes the header
+                fn(Reader(filename=filename, **kwargs), out)
+            for i, part in enumerate(parts):
+                _append_part(out, part, i == 0)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return output
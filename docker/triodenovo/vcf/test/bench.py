@@ -0,0 +1,338 @@
+"""
+Benchmarks for VCF parsing, writing and the triodenovo input steps.
+
+Every case runs over synthetic VCFs with the requested sample counts, in a
+fresh process so that its peak RSS is its own.  Results are records (or
+header opens) per second, best of ``--repeat`` runs, and can be saved as
+JSON and compared against an earlier run::
+
+    python vcf/test/bench.py --samples 3,100,1000 --output base.json
+    # ... change things ...
+    python vcf/test/bench.py --samples 3,100,1000 --baseline base.json
+
+With ``--baseline`` the exit status is 1 when a case got slower than
+``--threshold`` (default 0.2, i.e. 20%) of its baseline rate.
+
+``--profile CASE`` runs one case under cProfile instead.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import vcf
+from vcf import utils
+from vcf.sample_filter import SampleFilter
+
+
+#: the directory with InputAdapters.py, two levels up
+_TRIODENOVO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+_BASES = 'ACGT'
+_INFO_HEAVY_KEYS = 30
+
+
+def make_vcf(path, n_records, n_samples, info_heavy=False, n_contigs=25,
+             seed=0):
+    """ Write a synthetic VCF with GT:AD:DP:GQ:PL calls.
+
+        The first three samples are named as a trio (child, father,
+        mother).  ``info_heavy`` adds 30 extra INFO keys to every record.
+    """
+    rand = random.Random(seed)
+    lines = ['##fileformat=VCFv4.2', '##source=bench.py']
+    for i in range(n_contigs):
+        lines.append('##contig=<ID=chr%d,length=%d>' % (i + 1, 250000000 - i))
+    lines += [
+        '##INFO=<ID=AC,Number=A,Type=Integer,Description="Allele count">',
+        '##INFO=<ID=AF,Number=A,Type=Float,Description="Allele frequency">',
+        '##INFO=<ID=AN,Number=1,Type=Integer,Description="Allele number">',
+        '##INFO=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+        '##INFO=<ID=MQ,Number=1,Type=Float,Description="Mapping quality">',
+        '##INFO=<ID=QD,Number=1,Type=Float,Description="Quality by depth">',
+        '##INFO=<ID=DB,Number=0,Type=Flag,Description="dbSNP">',
+    ]
+    for k in range(_INFO_HEAVY_KEYS if info_heavy else 0):
+        kind = ('Integer', 'Float', 'String')[k % 3]
+        lines.append('##INFO=<ID=K%d,Number=1,Type=%s,Description="Key %d">'
+                     % (k, kind, k))
+    lines += [
+        '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+        '##FORMAT=<ID=AD,Number=R,Type=Integer,Description="Allelic depths">',
+        '##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">',
+        '##FORMAT=<ID=GQ,Number=1,Type=Integer,Description="Genotype quality">',
+        '##FORMAT=<ID=PL,Number=G,Type=Integer,Description="Likelihoods">',
+    ]
+    names = (['child', 'father', 'mother'] +
+             ['S%d' % i for i in range(3, n_samples)])[:n_samples]
+    lines.append('\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL',
+                            'FILTER', 'INFO', 'FORMAT'] + names))
+
+    per_contig = max(n_records // n_contigs, 1)
+    gts = ['0/0', '0/0', '0/0', '0/1', '0/1', '1/1', './.']
+    with open(path, 'w') as out:
+        out.write('\n'.join(lines) + '\n')
+        for i in range(n_records):
+            ref = rand.choice(_BASES)
+            alt = rand.choice(_BASES.replace(ref, ''))
+            dp = rand.randint(10, 60) * n_samples
+            info = ['AC=%d' % rand.randint(1, 2 * n_samples),
+                    'AF=%.3f' % rand.random(), 'AN=%d' % (2 * n_samples),
+                    'DP=%d' % dp, 'MQ=%.2f' % rand.uniform(20, 60),
+                    'QD=%.2f' % rand.uniform(0, 30)]
+            if rand.random() < 0.3:
+                info.append('DB')
+            if info_heavy:
+                info += ['K%d=%s' % (k, (rand.randint(0, 999),
+                                         '%.4f' % rand.random(), 'tag%d' % k)[k % 3])
+                         for k in range(_INFO_HEAVY_KEYS)]
+            calls = []
+            for _ in range(n_samples):
+                gt = rand.choice(gts)
+                if gt == './.':
+                    calls.append('./.:0,0:0:.:.')
+                    continue
+                depth = rand.randint(5, 60)
+                alt_depth = rand.randint(0, depth)
+                calls.append('%s:%d,%d:%d:%d:%d,%d,%d' % (
+                    gt, depth - alt_depth, alt_depth, depth,
+                    rand.randint(0, 99), rand.randint(0, 200),
+                    rand.randint(0, 200), rand.randint(0, 200)))
+            out.write('\t'.join(
+                ['chr%d' % (min(i // per_contig, n_contigs - 1) + 1),
+                 str(1000 + 100 * (i % per_contig)), '.', ref, alt,
+                 '%.1f' % rand.uniform(10, 5000), 'PASS', ';'.join(info),
+                 'GT:AD:DP:GQ:PL'] + calls) + '\n')
+
+
+# Cases take the workspace dict built by ``_workspace`` and return the
+# number of units (records, or header opens) they processed.
+
+def case_open(ws):
+    n = 200
+    for _ in range(n):
+        vcf.Reader(filename=ws['vcf'])
+    return n
+
+
+def case_parse(ws):
+    n = 0
+    for record in vcf.Reader(filename=ws['vcf']):
+        record.INFO
+        for call in record.samples:
+            call.data
+        n += 1
+    return n
+
+
+def case_sites(ws):
+    n = 0
+    for record in vcf.Reader(filename=ws['vcf']):
+        record.CHROM, record.POS, record.REF, record.ALT, record.QUAL
+        n += 1
+    return n
+
+
+def case_info(ws):
+    n = 0
+    for record in vcf.Reader(filename=ws['info_vcf']):
+        for value in record.INFO.values():
+            pass
+        n += 1
+    return n
+
+
+def case_roundtrip(ws):
+    reader = vcf.Reader(filename=ws['vcf'])
+    with open(os.path.join(ws['dir'], 'out.vcf'), 'w') as out:
+        writer = vcf.Writer(out, reader)
+        records = list(reader)
+        for record in records:
+            record.add_filter('bench')
+        writer.write_records(records)
+    return len(records)
+
+
+def case_walk(ws):
+    readers = [vcf.Reader(filename=ws['vcf']) for _ in range(4)]
+    return sum(1 for _ in utils.walk_together(*readers))
+
+
+def case_sample_filter(ws):
+    reader = vcf.Reader(filename=ws['vcf'])
+    dropped = ','.join(reader.samples[::2])
+    SampleFilter(ws['vcf'], os.path.join(ws['dir'], 'kept.vcf'), dropped)
+    return ws['records']
+
+
+def case_adapter(ws):
+    if _TRIODENOVO_DIR not in sys.path:
+        sys.path.insert(0, _TRIODENOVO_DIR)
+    from InputAdapters import TrioDeNovoInputAdapter
+    with open(os.path.join(ws['dir'], 'adapted.vcf'), 'w') as out:
+        TrioDeNovoInputAdapter(ws['vcf'], out).parse()
+    return ws['records']
+
+
+CASES = [
+    ('open', case_open),
+    ('parse', case_parse),
+    ('sites', case_sites),
+    ('info', case_info),
+    ('roundtrip', case_roundtrip),
+    ('walk', case_walk),
+    ('sample_filter', case_sample_filter),
+    ('adapter', case_adapter),
+]
+
+
+def _workspace(directory, n_records, n_samples):
+    ws = {'dir': directory, 'records': n_records, 'samples': n_samples,
+          'vcf': os.path.join(directory, 'bench.vcf'),
+          'info_vcf': os.path.join(directory, 'info.vcf')}
+    if not os.path.exists(ws['vcf']):
+        make_vcf(ws['vcf'], n_records, n_samples)
+        make_vcf(ws['info_vcf'], n_records, n_samples, info_heavy=True)
+    return ws
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def run_case(fn, ws, repeat=3):
+    """ Best rate of ``repeat`` runs of a case, in this process """
+    best = None
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        n = fn(ws)
+        elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best[1]:
+            best = (n, elapsed)
+    n, elapsed = best
+    return {'units': n, 'seconds': elapsed,
+            'rate': n / elapsed if elapsed else float('inf'),
+            'peak_rss_kb': _peak_rss_kb()}
+
+
+def _child(conn, name, ws, repeat):
+    try:
+        conn.send(run_case(dict(CASES)[name], ws, repeat))
+    except Exception as e:
+        conn.send({'error': '%s: %s' % (type(e).__name__, e)})
+    conn.close()
+
+
+def run_isolated(name, ws, repeat=3):
+    """ ``run_case`` in a child process, so peak RSS is per case """
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=_child, args=(child, name, ws, repeat))
+    proc.start()
+    result = parent.recv()
+    proc.join()
+    return result
+
+
+def compare(results, baseline, threshold):
+    """ The ``(key, rate, baseline rate)`` of cases slower than allowed """
+    regressions = []
+    for key, result in sorted(results.items()):
+        base = baseline.get(key)
+        if not base or 'rate' not in base or 'rate' not in result:
+            continue
+        if result['rate'] < base['rate'] * (1 - threshold):
+            regressions.append((key, result['rate'], base['rate']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark VCF parsing, see the module docstring')
+    parser.add_argument('--samples', default='3,100',
+                        help='comma separated sample counts (default 3,100)')
+    parser.add_argument('--records', type=int, default=2000,
+                        help='records per synthetic VCF (default 2000)')
+    parser.add_argument('--cases', default=','.join(name for name, _ in CASES),
+                        help='comma separated cases to run (default all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per case, the best one counts (default 3)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown against the baseline (default 0.2)')
+    parser.add_argument('--profile', metavar='CASE',
+                        help='run one case under cProfile and print the stats')
+    args = parser.parse_args(argv)
+
+    counts = [int(n) for n in args.samples.split(',')]
+    names = args.cases.split(',')
+    unknown = [name for name in names if name not in dict(CASES)]
+    if unknown:
+        parser.error('unknown cases: %s' % ', '.join(unknown))
+
+    tmp = tempfile.mkdtemp(prefix='vcf-bench-')
+    try:
+        if args.profile:
+            import cProfile
+            import pstats
+            ws = _workspace(tmp, args.records, counts[0])
+            prof = cProfile.Profile()
+            prof.runcall(dict(CASES)[args.profile], ws)
+            pstats.Stats(prof).strip_dirs().sort_stats('time').print_stats(25)
+            return 0
+
+        results = {}
+        for n_samples in counts:
+            directory = os.path.join(tmp, str(n_samples))
+            os.mkdir(directory)
+            ws = _workspace(directory, args.records, n_samples)
+            for name in names:
+                key = '%s/%d' % (name, n_samples)
+                results[key] = result = run_isolated(name, ws, args.repeat)
+                if 'error' in result:
+                    print('%-22s %s' % (key, result['error']))
+                else:
+                    print('%-22s %12.0f /s %10s KB peak RSS' % (
+                        key, result['rate'], result['peak_rss_kb']))
+    finally:
+        shutil.rmtree(tmp)
+
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump({'python': platform.python_version(),
+                       'cparse': bool(vcf.parser.cparse),
+                       'records': args.records,
+                       'results': results}, out, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for key, rate, base in regressions:
+            print('REGRESSION %s: %.0f/s, baseline %.0f/s (%.0f%% slower)' % (
+                key, rate, base, 100 * (1 - rate / base)))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
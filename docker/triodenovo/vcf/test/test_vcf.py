@@ -4,21 +4,33 @@ try:
     unittest.skip
 except AttributeError:
     import unittest2 as unittest
+import argparse
 import doctest
+import gzip
+import json
+import math
 import os
 import commands
+import shutil
 import cPickle
 from StringIO import StringIO
 import subprocess
 import sys
+import tempfile
 
 try:
     import pysam
 except ImportError:
     pysam = None
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import vcf
-from vcf import model, utils
+from vcf import model, utils, bgzf, index, parallel, filters, s3, columnar, scatter, families
+from vcf import parser as vcf_parser
 
 IS_PYTHON2 = sys.version_info[0] == 2
 IS_NOT_PYPY = 'PyPy' not in sys.version
@@ -30,6 +42,35 @@ def fh(fname, mode='rt'):
     return open(os.path.join(os.path.dirname(__file__), fname), mode)
 
 
+def write_bgzf(fname, block_size):
+    """ Copy a test file into a temporary BGZF file with small blocks """
+    data = fh(fname, 'rb').read()
+    fd, path = tempfile.mkstemp(suffix='.vcf.gz')
+    with os.fdopen(fd, 'wb') as out:
+        for i in range(0, len(data), block_size):
+            out.write(bgzf.compress_block(data[i:i + block_size]))
+        out.write(bgzf.EOF_BLOCK)
+    return path
+
+
+def record_site(record):
+    return (record.CHROM, record.POS)
+
+
+def count_records(reader):
+    return sum(1 for _ in reader)
+
+
+def record_sites(reader):
+    return [record_site(record) for record in reader]
+
+
+def write_records(reader, handle):
+    writer = vcf.Writer(handle, reader)
+    for record in reader:
+        writer.write_record(record)
+
+
 class TestVcfSpecs(unittest.TestCase):
 
     def test_vcf_4_0(self):
@@ -354,6 +395,9 @@ class TestInfoOrder(unittest.TestCase):
         writer = vcf.Writer(out, reader, lineterminator='\n')
 
         for record in reader:
+            # unchanged records are written as read, replace INFO to have
+            # the writer format it
+            record.INFO = dict(record.INFO)
             writer.write_record(record)
         out.seek(0)
         out_str = out.getvalue()
@@ -411,6 +455,93 @@ class TestBadInfoFields(unittest.TestCase):
         pass
 
 
+class TestInfoConverters(unittest.TestCase):
+
+    def test_converters_cached_per_key(self):
+        reader = vcf.Reader(fh('freebayes.vcf'))
+        record = next(reader)
+        self.assertEqual(sorted(reader._info_cache), sorted(record.INFO))
+        converters = dict(reader._info_cache)
+        for record in reader:
+            pass
+        for key, convert in converters.items():
+            self.assertTrue(reader._info_cache[key] is convert)
+
+    def test_converter_types(self):
+        reader = vcf.Reader(fh('example-4.0.vcf'))
+        self.assertEqual(reader._info_converter('DP')('14'), 14)
+        self.assertEqual(reader._info_converter('AF')('0.5,.'), [0.5, None])
+        self.assertEqual(reader._info_converter('DB')(None), True)
+        # reserved and unknown keys stay lists
+        self.assertEqual(reader._info_converter('END')('10'), [10])
+        self.assertEqual(reader._info_converter('XX')('a,b'), ['a', 'b'])
+        self.assertEqual(reader._info_converter('XX')(None), True)
+
+
+class TestInfoFields(unittest.TestCase):
+
+    def test_same_values(self):
+        full = list(vcf.Reader(fh('freebayes.vcf')))
+        lazy = list(vcf.Reader(fh('freebayes.vcf'), info_fields=['DP', 'AF']))
+        for l, r in zip(full, lazy):
+            self.assertEqual(sorted(l.INFO), sorted(r.INFO))
+            self.assertEqual(len(l.INFO), len(r.INFO))
+            for key in l.INFO:
+                self.assertEqual(l.INFO[key], r.INFO[key])
+            self.assertEqual(l.INFO, r.INFO)
+
+    def test_decoded_on_access(self):
+        reader = vcf.Reader(fh('example-4.0.vcf'), info_fields=['DP'])
+        info = next(reader).INFO
+        self.assertTrue(isinstance(info, vcf.model.Mapping))
+        self.assertEqual(sorted(info._raw), ['AF', 'DB', 'H2', 'NS'])
+        self.assertTrue('AF' in info)
+        self.assertEqual(info['DP'], 14)
+        self.assertEqual(info.get('AF'), [0.5])
+        self.assertEqual(info['DB'], True)
+        self.assertEqual(info.get('XX', 1), 1)
+        self.assertRaises(KeyError, info.__getitem__, 'XX')
+        self.assertEqual(sorted(info._raw), ['H2', 'NS'])
+        info['NS'] = 4
+        self.assertEqual(info['NS'], 4)
+        del info['H2']
+        self.assertFalse('H2' in info)
+        self.assertEqual(info, {'DP': 14, 'AF': [0.5], 'DB': True, 'NS': 4})
+
+    def test_copies(self):
+        full = next(vcf.Reader(fh('example-4.0.vcf'))).INFO
+        info = next(vcf.Reader(fh('example-4.0.vcf'), info_fields=['DP'])).INFO
+        self.assertEqual(dict(info), full)
+        updated = {}
+        updated.update(info)
+        self.assertEqual(updated, full)
+        self.assertEqual(info.copy(), full)
+        self.assertEqual(sorted(info.items()), sorted(full.items()))
+        self.assertFalse(info._changed)
+        # not a dict, as documented, its copy is
+        self.assertFalse(isinstance(info, dict))
+        self.assertTrue(type(info.copy()) is dict)
+        self.assertEqual(json.loads(json.dumps(info.copy(), sort_keys=True)),
+                         json.loads(json.dumps(full, sort_keys=True)))
+
+    def test_write_and_pickle(self):
+        reader = vcf.Reader(fh('example-4.0.vcf'))
+        expected = StringIO()
+        writer = vcf.Writer(expected, reader)
+        records = list(reader)
+        for record in records:
+            writer.write_record(record)
+
+        reader = vcf.Reader(fh('example-4.0.vcf'), info_fields=[])
+        out = StringIO()
+        writer = vcf.Writer(out, reader)
+        for record in reader:
+            writer.write_record(record)
+            self.assertEqual(cPickle.loads(cPickle.dumps(record)).INFO,
+                             record.INFO)
+        self.assertEqual(out.getvalue(), expected.getvalue())
+
+
 class TestParseMetaLine(unittest.TestCase):
     def test_parse(self):
         reader = vcf.Reader(fh('parse-meta-line.vcf'))
@@ -506,6 +637,91 @@ class TestBcfToolsOutputWriter(unittest.TestCase):
                 self.assertEqual(l_call.data, r_call.data)
 
 
+class TestWriterPassthrough(unittest.TestCase):
+
+    def data_lines(self, fname):
+        return [line for line in fh(fname).read().splitlines()
+                if not line.startswith('#')]
+
+    def write(self, reader, records):
+        out = StringIO()
+        vcf.Writer(out, reader).write_records(records, batch_size=2)
+        return [line for line in out.getvalue().splitlines()
+                if not line.startswith('#')]
+
+    def test_unchanged_verbatim(self):
+        reader = vcf.Reader(fh('example-4.0.vcf'))
+        records = list(reader)
+        for record in records:
+            # reading fields does not change them
+            record.INFO.get('DP')
+            record.samples[0]['GT']
+        self.assertEqual(self.write(reader, records),
+                         self.data_lines('example-4.0.vcf'))
+
+    def test_changed_fields(self):
+        reader = vcf.Reader(fh('example-4.0.vcf'))
+        records = list(reader)
+        records[0].add_filter('q10')
+        records[1].add_info('XX', 5)
+        records[2].samples[2].data = records[2].samples[2].data._replace(GQ=99)
+        records[3].POS = 5
+        lines = self.write(reader, records)
+        expected = self.data_lines('example-4.0.vcf')
+
+        self.assertEqual(lines[0].split('\t')[6], 'q10')
+        # the unchanged INFO column keeps its source text
+        self.assertEqual(lines[0].split('\t')[7], 'NS=3;DP=14;AF=0.5;DB;H2')
+        self.assertTrue(lines[1].split('\t')[7].endswith(';XX=5'))
+        self.assertEqual(lines[2].split('\t')[:11], expected[2].split('\t')[:11])
+        self.assertEqual(lines[2].split('\t')[11], '2/2:99:4:.')
+        self.assertEqual(lines[3].split('\t')[1], '5')
+        self.assertEqual(lines[4:], expected[4:])
+
+        header = [line for line in fh('example-4.0.vcf').read().splitlines()
+                  if line.startswith('#')]
+        reread = list(vcf.Reader(StringIO('\n'.join(header + lines))))
+        self.assertEqual(reread[0].FILTER, ['q10'])
+        self.assertEqual(reread[1].INFO['XX'], ['5'])
+        self.assertEqual(reread[2].samples[2]['GQ'], 99)
+
+    def test_changed_in_place(self):
+        expected = self.data_lines('example-4.0.vcf')
+        for info_fields in (None, [], ['AF']):
+            reader = vcf.Reader(fh('example-4.0.vcf'), info_fields=info_fields)
+            records = list(reader)
+            records[0].INFO['AF'].append(0.25)
+            records[1].ALT[0].sequence = 'T'
+            lines = self.write(reader, records)
+            self.assertEqual(lines[0].split('\t')[7], 'NS=3;DP=14;AF=0.5,0.25;DB;H2')
+            self.assertEqual(lines[1].split('\t')[4], 'T')
+            self.assertEqual(lines[2:], expected[2:])
+
+    def test_qual_precision(self):
+        reader = vcf.Reader(fh('example-4.0.vcf'))
+        records = list(reader)
+        records[0].QUAL = 1234567.891234
+        records[1].QUAL = 3.14159265358979
+        records[2].add_filter('q10')
+        lines = self.write(reader, records[:3])
+        self.assertEqual(lines[0].split('\t')[5], '1234567.891234')
+        self.assertEqual(lines[1].split('\t')[5], '3.14159265358979')
+        self.assertEqual(lines[2].split('\t')[5],
+                         self.data_lines('example-4.0.vcf')[2].split('\t')[5])
+        out = StringIO()
+        vcf.Writer(out, reader).write_records(records[:2])
+        out.seek(0)
+        reread = list(vcf.Reader(out))
+        self.assertEqual(reread[0].QUAL, 1234567.891234)
+        self.assertEqual(reread[1].QUAL, 3.14159265358979)
+
+    def test_projected_samples(self):
+        reader = vcf.Reader(fh('example-4.0.vcf'), samples=['NA00003'])
+        lines = self.write(reader, reader)
+        expected = [line.split('\t') for line in self.data_lines('example-4.0.vcf')]
+        self.assertEqual(lines, ['\t'.join(cols[:9] + cols[11:]) for cols in expected])
+
+
 class TestWriterDictionaryMeta(unittest.TestCase):
 
     def testWrite(self):
@@ -1191,6 +1407,61 @@ class TestRecord(unittest.TestCase):
         self.assert_has_expected_coordinates(record, (9, 12), (9, 12))
 
 
+class TestRecordSlots(unittest.TestCase):
+
+    def test_no_instance_dict(self):
+        reader = vcf.Reader(fh('example-4.1-sv.vcf'))
+        for record in reader:
+            self.assertFalse(hasattr(record, '__dict__'))
+            for alt in record.ALT:
+                self.assertFalse(hasattr(alt, '__dict__'))
+
+    def test_snv_alts_not_shared(self):
+        records = list(vcf.Reader(fh('gatk.vcf')))
+        alts = [r.ALT[0] for r in records if r.ALT[0] == 'A']
+        self.assertTrue(len(alts) > 1)
+        self.assertEqual(len(set(map(id, alts))), len(alts))
+        self.assertEqual((alts[0].type, alts[0].sequence), ('SNV', 'A'))
+        self.assertFalse(hasattr(alts[0], '__dict__'))
+
+    def test_lazy_coordinates(self):
+        record = next(vcf.Reader(fh('example-4.0.vcf')))
+        self.assertEqual(record._affected, None)
+        self.assertEqual(record._alleles, None)
+        self.assertEqual((record.affected_start, record.affected_end), (14369, 14370))
+        self.assertEqual(record.alleles, ['G', 'A'])
+        record.affected_end = 20
+        self.assertEqual((record.affected_start, record.affected_end), (14369, 20))
+
+
+class TestGenotypeTally(unittest.TestCase):
+
+    def test_matches_calls(self):
+        for fname in ('example-4.0.vcf', 'gatk.vcf', 'uncalled_genotypes.vcf',
+                      'example-4.1-ploidy.vcf'):
+            # tallied from the raw GT text, compared to decoded calls
+            for record, other in zip(vcf.Reader(fh(fname)), vcf.Reader(fh(fname))):
+                calls = list(other.samples)
+                types = [c.gt_type for c in calls]
+                self.assertEqual(record.num_hom_ref, types.count(0))
+                self.assertEqual(record.num_het, types.count(1))
+                self.assertEqual(record.num_hom_alt, types.count(2))
+                self.assertEqual(record.num_unknown, types.count(None))
+                self.assertEqual(record.num_called, sum(1 for c in calls if c.called))
+                self.assertEqual([c.sample for c in record.get_hets()],
+                                 [c.sample for c in calls if c.gt_type == 1])
+
+    def test_single_pass_from_raw(self):
+        record = next(vcf.Reader(fh('example-4.0.vcf')))
+        self.assertEqual((record.num_hom_ref, record.num_het, record.num_hom_alt),
+                         (1, 1, 1))
+        # counted from the GT text without decoding the calls
+        self.assertEqual(record.samples._calls, [None] * 3)
+        self.assertEqual(list(record._tally.codes), [0, 1, 2])
+        self.assertEqual(record.aaf, [0.5])
+        self.assertTrue(record._genotype_tally() is record._tally)
+
+
 class TestCall(unittest.TestCase):
 
     def test_dunder_eq(self):
@@ -1254,7 +1525,6 @@ class TestCall(unittest.TestCase):
                 self.assertEqual([None,1,2], gt_types)
 
 
-@unittest.skipUnless(pysam, "test requires installation of PySAM.")
 class TestFetch(unittest.TestCase):
 
     def setUp(self):
@@ -1304,7 +1574,6 @@ class TestFetch(unittest.TestCase):
         )
 
 
-@unittest.skipUnless(pysam, "test requires installation of PySAM.")
 class TestIssue201(unittest.TestCase):
     def setUp(self):
         # This file contains some non-ASCII characters in a UTF-8 encoding.
@@ -1474,9 +1743,12 @@ class TestSampleFilter(unittest.TestCase):
         # init filter with filename, get list of samples
         filt = vcf.SampleFilter('vcf/test/example-4.1.vcf')
         self.assertEqual(filt.samples, ['NA00001', 'NA00002', 'NA00003'])
+        first = filt.parser
         # set filter, check which samples will be kept
         filtered = filt.set_filters(filters="0", invert=True)
         self.assertEqual(filtered, ['NA00001'])
+        # the unprojected reader is closed when it is replaced
+        self.assertTrue(first._reader.closed)
         # write filtered file to StringIO
         buf = StringIO()
         filt.write(buf)
@@ -1543,6 +1815,182 @@ class TestFilter(unittest.TestCase):
         assert 'sq30' in reader.filters
 
 
+def _log_dbinom(k, n, p):
+    """ log(dbinom(k, n, p)) as R computes it """
+    ll = math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+    if k:
+        ll += k * math.log(p)
+    if n - k:
+        ll += (n - k) * math.log(1 - p)
+    return ll
+
+
+@unittest.skipUnless(filters.numpy and filters.stats,
+                     "test requires installation of NumPy and SciPy.")
+class TestErrorBiasFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.filt = filters.ErrorBiasFilter(argparse.Namespace(eblr=-10))
+
+    def reference(self, ra, aa, gt):
+        """ The R function the filter used to embed, in plain python """
+        ab = float(sum(aa)) / (sum(ra) + sum(aa))
+        error = sum(_log_dbinom(a, r + a, ab) for (r, a) in zip(ra, aa))
+        geno = sum(_log_dbinom(a, r + a, 0.5 + 0.48 * (g - 1))
+                   for (r, a, g) in zip(ra, aa, gt))
+        return error - geno, ab
+
+    def test_bias_test(self):
+        n = 0
+        for record in vcf.Reader(fh('freebayes.vcf')):
+            calls = [c for c in record.samples if c.called]
+            ra = [c['RO'] for c in calls]
+            aa = [c['AO'][0] for c in calls]
+            if not sum(ra) + sum(aa):
+                continue
+            passed, tv, ab = self.filt.bias_test(record.samples)
+            ex_tv, ex_ab = self.reference(ra, aa, [c.gt_type for c in calls])
+            self.assertAlmostEqual(tv, ex_tv, places=6)
+            self.assertAlmostEqual(ab, ex_ab)
+            self.assertEqual(passed, ex_tv < 0)
+            n += 1
+        self.assertTrue(n > 50)
+
+    def test_block_test(self):
+        for name, fields in (('freebayes.vcf', ('GT', 'RO', 'AO')),
+                             ('gatk.vcf', ('GT', 'AD'))):
+            records = list(vcf.Reader(fh(name)))
+            blocks = vcf.Reader(fh(name)).iter_blocks(16, fields=fields)
+            test_val = numpy.concatenate(
+                [self.filt.block_test(b)[0] for b in blocks])
+            self.assertEqual(len(test_val), len(records))
+            for record, tv in zip(records, test_val):
+                if record.is_monomorphic:
+                    self.assertTrue(numpy.isnan(tv))
+                    continue
+                expected = self.filt.bias_test(record.samples)[1]
+                if numpy.isnan(expected):
+                    self.assertTrue(numpy.isnan(tv))
+                else:
+                    self.assertAlmostEqual(tv, expected, places=6)
+                self.assertEqual(self.filt(record),
+                                 tv if tv > self.filt.threshold else None)
+
+
+class TestFilterBlocks(unittest.TestCase):
+
+    def filters(self):
+        args = argparse.Namespace(site_quality=50, genotype_quality=90,
+                                  depth_per_sample=20, avg_depth_per_sample=215)
+        return [filters.SiteQuality(args), filters.VariantGenotypeQuality(args),
+                filters.DepthPerSample(args), filters.AvgDepthPerSample(args),
+                filters.SnpOnly(args)]
+
+    def test_iter_record_blocks(self):
+        expected = [record_site(r) for r in vcf.Reader(fh('gatk.vcf'))]
+        reader = vcf.Reader(fh('gatk.vcf'))
+        pairs = list(reader.iter_record_blocks(10))
+        self.assertEqual([len(records) for records, _ in pairs], [10, 10, 10, 7])
+        self.assertTrue(all(block is None for _, block in pairs))
+        self.assertEqual([record_site(r) for records, _ in pairs for r in records],
+                         expected)
+
+    @unittest.skipUnless(numpy, "test requires installation of NumPy.")
+    def test_blocks_match_records(self):
+        for filt in self.filters():
+            filtered = 0
+            reader = vcf.Reader(fh('gatk.vcf'))
+            for records, block in reader.iter_record_blocks(8, filt.block_fields or ()):
+                if block is not None:
+                    self.assertEqual(len(block.POS), len(records))
+                expected = [filt(record) for record in records]
+                mask, values = filt.filter_block(records, block)
+                self.assertEqual(list(mask), [v is not None for v in expected])
+                for value, ex in zip(values, expected):
+                    if ex is None:
+                        self.assertEqual(value, None)
+                    else:
+                        self.assertAlmostEqual(value, ex, places=3)
+                filtered += sum(mask)
+            if filt.name != 'snp-only':
+                self.assertTrue(filtered, filt.name)
+
+    @unittest.skipUnless(numpy, "test requires installation of NumPy.")
+    def test_integer_gq(self):
+        # modern GATK declares GQ as an Integer, missing GQ must not count
+        text = ('##fileformat=VCFv4.2\n'
+                '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+                '##FORMAT=<ID=GQ,Number=1,Type=Integer,Description="Quality">\n'
+                '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\n'
+                '1\t1\t.\tA\tC\t50\tPASS\t.\tGT:GQ\t0/1:.\t0/0:99\n'
+                '1\t2\t.\tA\tC\t50\tPASS\t.\tGT\t0/1\t0/0\n'
+                '1\t3\t.\tA\tC\t50\tPASS\t.\tGT:GQ\t0/1:20\t1/1:30\n'
+                '1\t4\t.\tA\tC\t50\tPASS\t.\tGT:GQ\t0/1:95\t0/0:.\n')
+        filt = self.filters()[1]
+        reader = vcf.Reader(StringIO(text))
+        (records, block), = list(reader.iter_record_blocks(8, filt.block_fields))
+        self.assertEqual(block.calldata['GQ'].dtype.kind, 'i')
+        expected = [filt(record) for record in records]
+        self.assertEqual(expected, [None, None, 30, None])
+        mask, values = filt.filter_block(records, block)
+        self.assertEqual(mask, [False, False, True, False])
+        self.assertEqual(values, [None, None, 30, None])
+
+    def test_chain_skips_failed(self):
+        import imp
+        script = imp.load_source('vcf_filter', os.path.join(
+            os.path.dirname(__file__), '..', '..', 'scripts', 'vcf_filter.py'))
+
+        class Seen(filters.Base):
+            name = 'seen'
+            threshold = ''
+            block_fields = ('DP',)
+
+            def __init__(self):
+                self.seen = []
+                self.block_sizes = []
+
+            def filter_block(self, records, block):
+                if block is not None:
+                    self.block_sizes.append((len(records), len(block.POS)))
+                return filters.Base.filter_block(self, records, block)
+
+            def __call__(self, record):
+                self.seen.append(record.POS)
+
+        sites = [r.POS for r in vcf.Reader(fh('gatk.vcf'))]
+        failed = [r.POS for r in vcf.Reader(fh('gatk.vcf')) if r.QUAL < 50]
+        self.assertTrue(failed)
+        for short_circuit, drop_filtered in ((True, False), (False, True),
+                                             (False, False)):
+            first, later = self.filters()[0], Seen()
+            out = list(script.filter_records(vcf.Reader(fh('gatk.vcf')),
+                                             [first, later],
+                                             short_circuit, drop_filtered))
+            positions = later.seen
+            if short_circuit or drop_filtered:
+                self.assertEqual(positions,
+                                 [pos for pos in sites if pos not in failed])
+            else:
+                self.assertEqual(positions, sites)
+            if numpy:
+                self.assertTrue(later.block_sizes)
+                self.assertTrue(all(n == m for n, m in later.block_sizes))
+            if drop_filtered:
+                self.assertEqual([r.POS for r in out], positions)
+            else:
+                self.assertEqual([r.FILTER for r in out if r.POS in failed],
+                                 [['sq50']] * len(failed))
+
+    def test_default_block(self):
+        filt = self.filters()[0]
+        records = list(vcf.Reader(fh('example-4.0.vcf')))
+        mask, values = filt.filter_block(records, None)
+        self.assertEqual(values, [filt(r) for r in records])
+        self.assertEqual(mask, [r.QUAL is not None and r.QUAL < 50
+                                for r in records])
+
+
 class TestRegression(unittest.TestCase):
 
     def test_issue_16(self):
@@ -1613,6 +2061,62 @@ class TestUtils(unittest.TestCase):
                 else:
                      self.assertEqual(recs[i], None)
 
+    def test_walk_contigs(self):
+        # same files, chromosome order given as contig names
+        chr_order = ['chr%s' % c for c in map(str, range(1, 30)) + ['X', 'Y', 'M']]
+        readers = [vcf.Reader(fh('issue-140-file%d.vcf' % i)) for i in (1, 2, 3)]
+        expected = "66642577752767662466"
+        walked = list(utils.walk_together(*readers, contigs=chr_order))
+        self.assertEqual(len(walked), len(expected))
+        for ex, recs in zip(expected, walked):
+            flags = [recs[i] is not None for i in range(3)]
+            self.assertEqual(flags, [bool(int(ex) & f) for f in (0x4, 0x2, 0x1)])
+
+    def test_walk_header_contigs(self):
+        # ##contig order wins over the alphabetical order of the names
+        header = ('##fileformat=VCFv4.1\n##contig=<ID=chr2>\n##contig=<ID=chr10>\n'
+                  '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+        left = header + 'chr2\t5\t.\tA\tC\t.\t.\t.\nchr10\t1\t.\tA\tC\t.\t.\t.\n'
+        right = header + 'chr10\t1\t.\tA\tC\t.\t.\t.\nchr10\t9\t.\tA\tC\t.\t.\t.\n'
+        walked = list(utils.walk_together(vcf.Reader(StringIO(left)),
+                                          vcf.Reader(StringIO(right))))
+        self.assertEqual([(r[0] is not None, r[1] is not None) for r in walked],
+                         [(True, False), (True, True), (False, True)])
+        self.assertEqual([[x.CHROM for x in r if x][0] for r in walked],
+                         ['chr2', 'chr10', 'chr10'])
+
+    def test_walk_unlisted_contigs(self):
+        def reader(header, sites):
+            return vcf.Reader(StringIO(header +
+                '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n' +
+                ''.join('%s\t%d\t.\tA\tC\t.\t.\t.\n' % site for site in sites)))
+
+        def walk(*readers):
+            return [[(r.CHROM, r.POS) if r else None for r in recs]
+                    for recs in utils.walk_together(*readers)]
+
+        # no ##contig lines, and contig sets that differ
+        left = [('chr1', 1), ('chr2', 1), ('chr3', 1)]
+        walked = walk(reader('', left), reader('', [('chr3', 1)]))
+        self.assertEqual(walked, [[('chr1', 1), None], [('chr2', 1), None],
+                                  [('chr3', 1), ('chr3', 1)]])
+        # a contig missing from the headers, met part way through
+        header = '##contig=<ID=chr2>\n##contig=<ID=chr10>\n'
+        walked = walk(reader(header, [('chr2', 5), ('chr10', 1), ('chrU', 3)]),
+                      reader(header, [('chr10', 1), ('chrU', 3), ('chrU', 7)]))
+        self.assertEqual(walked, [[('chr2', 5), None], [('chr10', 1), ('chr10', 1)],
+                                  [('chrU', 3), ('chrU', 3)], [None, ('chrU', 7)]])
+
+    def test_walk_many(self):
+        # plain iterators, as on Python 3, and many inputs
+        readers = [iter(list(vcf.Reader(fh('example-4.0.vcf'))))
+                   for _ in range(50)]
+        walked = list(utils.walk_together(*readers))
+        self.assertEqual(len(walked), 6)
+        for recs in walked:
+            self.assertEqual(len(recs), 50)
+            self.assertTrue(all(r is not None for r in recs))
+
     def test_trim(self):
         tests = [('TAA GAA', 'T G'),
                  ('TA TA', 'T T'),
@@ -1626,6 +2130,70 @@ class TestUtils(unittest.TestCase):
 
 
 
+class TestHeaderParsing(unittest.TestCase):
+
+    def test_meta_hash(self):
+        parser = vcf.parser._vcf_metadata_parser()
+        cases = [
+            ('##X=<ID=a,Description="b, c",Other=d>',
+             [('ID', 'a'), ('Description', '"b, c"'), ('Other', 'd')]),
+            ('##X=<ID=a,Cmd="x=1,y"z,Flag>',
+             [('ID', 'a'), ('Cmd', '"x=1,y"z'), ('Flag', '')]),
+            ('##X=<ID=a,Open="no end, at all>',
+             [('ID', 'a'), ('Open', '"no end, at all')]),
+            ('##X=<ID=a,=b,Last=>', [('ID', 'a'), ('', 'b'), ('Last', '')]),
+            ('##X=<>', []),
+        ]
+        for line, expected in cases:
+            key, val = parser.read_meta_hash(line)
+            self.assertEqual(key, 'X')
+            self.assertEqual(list(val.items()), expected)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'gatk.vcf')
+        self.cache = os.path.join(self.tmp, 'cache')
+        with open(self.path, 'w') as out:
+            out.write(fh('gatk.vcf').read())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def header(self, reader):
+        return (reader.metadata, reader.infos, reader.filters, reader.alts,
+                reader.formats, reader.contigs, reader.samples,
+                reader._header_lines)
+
+    def test_header_cache(self):
+        expected = vcf.Reader(filename=self.path)
+        first = vcf.Reader(filename=self.path, header_cache=self.cache)
+        self.assertEqual(len(os.listdir(self.cache)), 1)
+        cached = vcf.Reader(filename=self.path, header_cache=self.cache)
+        self.assertEqual(self.header(first), self.header(expected))
+        self.assertEqual(self.header(cached), self.header(expected))
+        self.assertEqual(type(cached.infos['DP']), type(expected.infos['DP']))
+        self.assertEqual([record_site(r) for r in cached],
+                         [record_site(r) for r in expected])
+
+    def test_header_cache_stale(self):
+        vcf.Reader(filename=self.path, header_cache=self.cache)
+        data = fh('gatk.vcf').read().replace(
+            '##fileformat=VCFv4.1', '##fileformat=VCFv4.1\n##source=edited', 1)
+        with open(self.path, 'w') as out:
+            out.write(data)
+        reader = vcf.Reader(filename=self.path, header_cache=self.cache)
+        self.assertEqual(reader.metadata['source'], ['edited'])
+        self.assertEqual(self.header(reader),
+                         self.header(vcf.Reader(filename=self.path)))
+
+    def test_header_cache_stream(self):
+        # nothing to key a stream on, the cache is not used
+        reader = vcf.Reader(StringIO(fh('gatk.vcf').read()),
+                            header_cache=self.cache)
+        self.assertEqual(len(reader.contigs), 93)
+        self.assertFalse(os.path.exists(self.cache))
+
+
 class TestGATKMeta(unittest.TestCase):
 
     def test_meta(self):
@@ -1709,6 +2277,927 @@ class TestUncalledGenotypes(unittest.TestCase):
         for (in_line, out_line) in zip(in_lines, out_lines):
             self.assertEqual(in_line,out_line)
 
+class TestBgzf(unittest.TestCase):
+
+    def setUp(self):
+        self.path = write_bgzf('example-4.0.vcf', 300)
+        self.lines = fh('example-4.0.vcf', 'rb').readlines()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_readline(self):
+        reader = bgzf.BgzfReader(self.path)
+        self.assertEqual(list(reader), self.lines)
+        reader.seek(0)
+        self.assertEqual(reader.read(), b''.join(self.lines))
+
+    def test_virtual_offsets(self):
+        reader = bgzf.BgzfReader(self.path)
+        offsets = []
+        for _ in self.lines:
+            offsets.append(reader.tell())
+            reader.readline()
+        self.assertTrue(any(offset & 0xffff for offset in offsets))
+        self.assertTrue(len(set(offset >> 16 for offset in offsets)) > 1)
+        for offset, line in reversed(list(zip(offsets, self.lines))):
+            reader.seek(offset)
+            self.assertEqual(reader.readline(), line)
+
+    def test_threads(self):
+        reader = bgzf.BgzfReader(self.path, threads=2, read_ahead=3)
+        self.assertEqual(list(reader), self.lines)
+        # seeking drops the blocks queued ahead and queues from there
+        reader.seek(0)
+        first = reader.readline()
+        offset = reader.tell()
+        self.assertEqual(reader.read(), b''.join(self.lines)[len(first):])
+        reader.seek(offset)
+        self.assertEqual(reader.readline(), self.lines[1])
+        reader.close()
+
+    def test_text_lines(self):
+        reader = bgzf.BgzfReader(self.path, encoding='ascii')
+        lines = list(reader)
+        self.assertEqual(lines, [line.decode('ascii') for line in self.lines])
+
+    def test_reader_threads(self):
+        expected = [r._raw[:2] for r in vcf.Reader(fh('example-4.0.vcf'))]
+        for threads in (0, 2):
+            reader = vcf.Reader(filename=self.path, threads=threads)
+            self.assertTrue(isinstance(reader._reader, bgzf.BgzfReader))
+            self.assertEqual([r._raw[:2] for r in reader], expected)
+        # plain gzip still goes through GzipFile
+        reader = vcf.Reader(fh('1kg.vcf.gz', 'rb'))
+        self.assertFalse(isinstance(reader._reader, bgzf.BgzfReader))
+
+    def test_writer(self):
+        data = b''.join(self.lines) * 200
+        for threads in (0, 2):
+            fd, path = tempfile.mkstemp(suffix='.vcf.gz')
+            os.close(fd)
+            offsets = []
+            with bgzf.BgzfWriter(path, threads=threads) as writer:
+                for line in self.lines * 200:
+                    offsets.append(writer.tell())
+                    writer.write(line)
+            with open(path, 'rb') as handle:
+                raw = handle.read()
+            self.assertTrue(raw.endswith(bgzf.EOF_BLOCK))
+            with open(path, 'rb') as handle:
+                sizes = [size for (_, size) in bgzf.iter_block_offsets(handle)]
+            self.assertEqual(len(sizes), len(data) // bgzf.MAX_BLOCK_DATA + 2)
+            reader = bgzf.BgzfReader(path)
+            self.assertEqual(reader.read(), data)
+            self.assertEqual(gzip.GzipFile(path).read(), data)
+            for offset, line in list(zip(offsets, self.lines * 200))[::97]:
+                reader.seek(offset)
+                self.assertEqual(reader.readline(), line)
+            os.remove(path)
+
+    def test_vcf_writer(self):
+        out = tempfile.NamedTemporaryFile(suffix='.vcf.gz', delete=False)
+        reader = vcf.Reader(fh('gatk.vcf'))
+        writer = vcf.Writer(out, reader, compressed=True, threads=2)
+        writer.write_records(reader)
+        writer.close()
+        self.assertTrue(bgzf.is_bgzf(out.name))
+        records = list(vcf.Reader(filename=out.name))
+        self.assertEqual([r._raw[1] for r in records],
+                         [r._raw[1] for r in vcf.Reader(fh('gatk.vcf'))])
+        os.remove(out.name)
+
+    def test_reg2bins(self):
+        self.assertEqual(index.reg2bins(0, 1), [0, 1, 9, 73, 585, 4681])
+        self.assertEqual(index.reg2bins(16384, 16385)[-1], 4682)
+
+
+class TestIndexBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def assertSameIndex(self, a, b):
+        pseudo = index._pseudo_bin(a.depth)
+        self.assertEqual(a.names, b.names)
+        for bins_a, bins_b in zip(a.bins, b.bins):
+            bins_a.pop(pseudo, None)
+            bins_b.pop(pseudo, None)
+            self.assertEqual(bins_a, bins_b)
+
+    def fetched(self, path, chrom, start, end):
+        return [r.POS for r in vcf.Reader(filename=path).fetch(chrom, start, end)]
+
+    def scanned(self, path, chrom, start, end):
+        return [r.POS for r in vcf.Reader(filename=path)
+                if r.CHROM == chrom and r.end > start and r.start < end]
+
+    def test_reg2bin(self):
+        self.assertEqual(index.reg2bin(0, 1), 4681)
+        self.assertEqual(index.reg2bin(16384, 16385), 4682)
+        self.assertEqual(index.reg2bin(16000, 17000), 585)
+        self.assertEqual(index.reg2bin(0, 1 << 29), 0)
+        for b in (0, 1, 9, 585, 4682):
+            start = index.bin_start(b)
+            self.assertTrue(index.reg2bin(start, start + 1) in
+                            index.reg2bins(start, start + 1))
+
+    def test_vcf_span(self):
+        self.assertEqual(index.vcf_span(b'1\t100\t.\tACG\tA\t.\t.\tDP=3\n'),
+                         ('1', 99, 102))
+        self.assertEqual(index.vcf_span(b'1\t100\t.\tA\t<DEL>\t.\t.\tSVTYPE=DEL;END=500'),
+                         ('1', 99, 500))
+        self.assertEqual(index.vcf_span(b'1\t100\t.\tA\tT\t.\t.\tBEND=500'),
+                         ('1', 99, 100))
+
+    def test_build_index(self):
+        # the same chunks as the tabix index of the file
+        path = os.path.join(self.tmp, 'tb.vcf.gz')
+        shutil.copy(fh('tb.vcf.gz').name, path)
+        self.assertEqual(index.build_index(path), path + '.tbi')
+        self.assertSameIndex(index.read_index(path + '.tbi'),
+                             index.read_index(fh('tb.vcf.gz').name + '.tbi'))
+        self.assertEqual(self.fetched(path, '20', 1230236, 1234568),
+                         [1230237, 1234567])
+        plain = write_bgzf('gatk.vcf', 500)
+        try:
+            tbi = index.build_index(plain)
+            self.assertEqual(index.read_index(tbi).names, ['chr22'])
+            self.assertEqual(len(self.fetched(plain, 'chr22', 0, 1 << 29)), 37)
+            os.remove(tbi)
+        finally:
+            os.remove(plain)
+        self.assertRaises(ValueError, index.build_index, fh('1kg.vcf.gz').name)
+
+    def test_indexing_writer(self):
+        from vcf.test import bench
+        source = os.path.join(self.tmp, 'in.vcf')
+        bench.make_vcf(source, 3000, 3, n_contigs=3)
+        last = list(vcf.Reader(filename=source))[-1].POS
+        for threads in (0, 2):
+            path = os.path.join(self.tmp, 'out%d.vcf.gz' % threads)
+            reader = vcf.Reader(filename=source)
+            with open(path, 'wb') as out:
+                writer = vcf.Writer(out, reader, compressed=True, threads=threads,
+                                    indexed=True)
+                writer.write_records(reader)
+                writer.close()
+            scan = index.build_index(path, os.path.join(self.tmp, 'scan.tbi'))
+            self.assertSameIndex(index.read_index(path + '.tbi'),
+                                 index.read_index(scan))
+            for chrom, start, end in (('chr1', 0, 1 << 28), ('chr2', 5000, 6000000),
+                                      ('chr3', last - 10, last + 10)):
+                self.assertEqual(self.fetched(path, chrom, start, end),
+                                 self.scanned(path, chrom, start, end))
+
+    def test_csi(self):
+        path = os.path.join(self.tmp, 'long.vcf.gz')
+        writer = index.IndexingWriter(path)
+        writer.write(b'##fileformat=VCFv4.1\n##contig=<ID=1,length=900000000>\n'
+                     b'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+        for pos in (10, 600000000, 600000001, 899999999):
+            writer.write(b'1\t%d\t.\tA\tT\t.\t.\t.\n' % pos)
+        writer.close()
+        self.assertEqual(writer.index_filename, path + '.csi')
+        idx = index.read_index(path + '.csi')
+        self.assertFalse(idx.linear)
+        self.assertTrue(idx.max_position > 900000000)
+        self.assertEqual(self.fetched(path, '1', 599999999, 600000000), [600000000])
+        self.assertEqual(self.fetched(path, '1', 0, 900000000),
+                         [10, 600000000, 600000001, 899999999])
+        self.assertRaises(ValueError, index.build_index, path, csi=False)
+
+    def test_unsorted(self):
+        builder = index.IndexBuilder()
+        builder.add('1', 100, 101, 0, 10)
+        self.assertRaises(ValueError, builder.add, '1', 50, 51, 10, 20)
+        builder.add('2', 50, 51, 10, 20)
+        self.assertRaises(ValueError, builder.add, '1', 200, 201, 20, 30)
+
+
+class TestParallel(unittest.TestCase):
+
+    def setUp(self):
+        self.expected = [record_site(r) for r in vcf.Reader(fh('gatk.vcf'))]
+        self.bgzf_path = write_bgzf('gatk.vcf', 700)
+
+    def tearDown(self):
+        os.remove(self.bgzf_path)
+
+    def test_plain_chunks(self):
+        path = fh('gatk.vcf').name
+        for n in (1, 2, 7, 50):
+            sites = list(parallel.parallel_map(path, record_site,
+                                               workers=1, chunks=n))
+            self.assertEqual(sites, self.expected)
+
+    def test_bgzf_chunks(self):
+        self.assertTrue(len(parallel.split_chunks(self.bgzf_path, 6)) > 1)
+        for n in (1, 3, 6, 100):
+            sites = list(parallel.parallel_map(self.bgzf_path, record_site,
+                                               workers=1, chunks=n))
+            self.assertEqual(sites, self.expected)
+
+    def test_pool(self):
+        sites = list(parallel.parallel_map(self.bgzf_path, record_site,
+                                           workers=2, chunks=5))
+        self.assertEqual(sites, self.expected)
+        counts = list(parallel.map_chunks(fh('gatk.vcf').name, count_records,
+                                          workers=2, chunks=4))
+        self.assertEqual(len(counts), 4)
+        self.assertEqual(sum(counts), len(self.expected))
+
+    def test_gzip_not_split(self):
+        path = fh('1kg.vcf.gz').name
+        self.assertEqual(len(parallel.split_chunks(path, 4)), 1)
+        self.assertEqual(sum(parallel.map_chunks(path, count_records, workers=1)),
+                         count_records(vcf.Reader(filename=path)))
+
+
+class FakeS3Client(object):
+    """ Serves objects from memory like a boto3 S3 client, logs the GETs """
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.ranges = []
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.objects[Bucket, Key])}
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = map(int, Range[len('bytes='):].split('-'))
+        self.ranges.append((start, end))
+        return {'Body': StringIO(self.objects[Bucket, Key][start:end + 1])}
+
+
+class TestScatter(unittest.TestCase):
+
+    def setUp(self):
+        from vcf.test import bench
+        self.tmp = tempfile.mkdtemp()
+        self.vcf = os.path.join(self.tmp, 'in.vcf')
+        bench.make_vcf(self.vcf, 120, 3, n_contigs=4)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_plan_chunks(self):
+        # without an index the shards are byte ranges, not contig regions
+        shards = scatter.plan_shards(self.vcf, 6)
+        self.assertEqual(shards, parallel.split_chunks(self.vcf, 6))
+        expected = [record_site(r) for r in vcf.Reader(filename=self.vcf)]
+        sites = [record_site(r) for shard in shards
+                 for r in scatter.shard_reader(self.vcf, shard)]
+        self.assertEqual(sites, expected)
+        self.assertEqual(len(scatter.plan_shards(fh('1kg.vcf.gz').name, 2)), 1)
+
+    def test_map_shards(self):
+        expected = [record_site(r) for r in vcf.Reader(filename=self.vcf)]
+        for n in (1, 3, 8):
+            sites = list(scatter.map_shards(self.vcf, record_sites, workers=1,
+                                            shards=scatter.plan_shards(self.vcf, n)))
+            self.assertEqual(len(sites), n)
+            self.assertEqual(sum(sites, []), expected)
+        counts = list(scatter.map_shards(fh('gatk.vcf').name, count_records,
+                                         workers=2))
+        self.assertEqual(sum(counts), 37)
+
+    def test_indexed(self):
+        path = fh('tb.vcf.gz').name
+        shards = scatter.plan_shards(path, 3)
+        self.assertEqual(shards, [[('20', 0, None)]])
+        sites = list(scatter.map_shards(path, record_sites, workers=1))
+        self.assertEqual(sites, [[record_site(r) for r in vcf.Reader(filename=path)]])
+        reader = scatter.shard_reader(path, [('20', 1230237, 1234567)])
+        self.assertEqual([r.POS for r in reader], [1234567])
+
+    def write_unlisted(self, contig_lines):
+        path = os.path.join(self.tmp, 'unlisted.vcf')
+        with open(path, 'w') as handle:
+            handle.write('##fileformat=VCFv4.1\n' + contig_lines +
+                         '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n')
+            for chrom in ('chr1', 'chrU', 'chr2'):
+                for pos in (1, 2000000, 3000000):
+                    handle.write('%s\t%d\t.\tA\tC\t.\t.\t.\tGT:DP:PL\t0/1:9:9,0,9\n'
+                                 % (chrom, pos))
+        return path
+
+    def test_unlisted_contigs(self):
+        path = self.write_unlisted('##contig=<ID=chr1,length=4000000>\n'
+                                   '##contig=<ID=chr2,length=4000000>\n')
+        expected = [record_site(r) for r in vcf.Reader(filename=path)]
+        for n in (1, 3):
+            sites = list(scatter.map_shards(path, record_sites, workers=1,
+                                            shards=scatter.plan_shards(path, n)))
+            self.assertEqual(len(sites), n)
+            self.assertEqual(sum(sites, []), expected)
+
+    def test_scrub_without_contigs(self):
+        # no ##contig lines or index, scrubbed in byte ranges
+        path = self.write_unlisted('')
+        out = os.path.join(self.tmp, 'scrubbed.vcf')
+        proc = subprocess.Popen(['python', 'InputAdapters.py', '-i', path,
+                                 '-o', out, '--workers', '2'],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, err = proc.communicate()
+        self.assertEqual(proc.returncode, 0, err)
+        self.assertEqual(len(list(vcf.Reader(filename=out))), 9)
+
+    def test_scatter_vcf(self):
+        whole = os.path.join(self.tmp, 'whole.vcf')
+        with open(whole, 'w') as handle:
+            write_records(vcf.Reader(filename=self.vcf), handle)
+        out = os.path.join(self.tmp, 'out.vcf')
+        self.assertEqual(scatter.scatter_vcf(self.vcf, write_records, out,
+                                             workers=2), out)
+        with open(whole) as a, open(out) as b:
+            self.assertEqual(a.read(), b.read())
+        self.assertEqual(sorted(os.listdir(self.tmp)),
+                         ['in.vcf', 'out.vcf', 'whole.vcf'])
+
+
+class TestFamilies(unittest.TestCase):
+
+    def setUp(self):
+        from vcf.test import bench
+        self.tmp = tempfile.mkdtemp()
+        self.vcf = os.path.join(self.tmp, 'cohort.vcf')
+        bench.make_vcf(self.vcf, 300, 9, n_contigs=3)
+        self.fam = os.path.join(self.tmp, 'fams.txt')
+        with open(self.fam, 'w') as handle:
+            handle.write('F1\tfather\tchild\tmother\n'
+                         'F2\tS4\tS3\tS5\n'
+                         '\n'
+                         'F3\tS7\tS8\tS6\n')
+        self.families = families.read_fam_file(self.fam)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def expected(self, family, variant_only=False):
+        trio = (family.father, family.child, family.mother)
+        sites = []
+        for record in vcf.Reader(filename=self.vcf):
+            calls = [call for call in record.samples if call.sample in trio]
+            if variant_only and not any(call.gt_type for call in calls):
+                continue
+            sites.append((record.CHROM, record.POS,
+                          [(call.sample, call.data) for call in calls]))
+        return sites
+
+    def split(self, path):
+        reader = vcf.Reader(filename=path)
+        return [(record.CHROM, record.POS,
+                 [(call.sample, call.data) for call in record.samples])
+                for record in reader]
+
+    def test_read_fam_file(self):
+        self.assertEqual([f.fam_id for f in self.families], ['F1', 'F2', 'F3'])
+        self.assertEqual(self.families[1],
+                         families.Family('F2', 'S4', 'S3', 'S5'))
+        self.assertEqual([f.fam_id for f in families.shard_families(self.families, 1, 2)],
+                         ['F2'])
+        self.assertRaises(ValueError, families.shard_families, self.families, 2, 2)
+
+    def test_split(self):
+        out = os.path.join(self.tmp, 'out')
+        os.mkdir(out)
+        vcfs, peds = families.split_families(self.vcf, self.families, out,
+                                             buffer_size=4096)
+        self.assertEqual(vcfs, [os.path.join(out, 'F%d.vcf' % i) for i in (1, 2, 3)])
+        for family, path in zip(self.families, vcfs):
+            self.assertEqual(self.split(path), self.expected(family))
+        self.assertEqual(vcf.Reader(filename=vcfs[2]).samples, ['S6', 'S7', 'S8'])
+        with open(peds[0]) as handle:
+            self.assertEqual(handle.read(), 'F1\tfather\t0\t0\t1\n'
+                             'F1\tmother\t0\t0\t2\n'
+                             'F1\tchild\tfather\tmother\t2\n')
+
+    def test_variant_only_compressed(self):
+        vcfs, _ = families.split_families(self.vcf, self.families, self.tmp,
+                                          suffix='.vcf.gz', buffer_size=4096,
+                                          variant_only=True, threads=2)
+        for family, path in zip(self.families, vcfs):
+            self.assertTrue(bgzf.is_bgzf(path))
+            self.assertEqual(self.split(path), self.expected(family, True))
+
+    def test_workers(self):
+        out = os.path.join(self.tmp, 'out')
+        os.mkdir(out)
+        vcfs, _ = families.split_families(self.vcf, self.families, out,
+                                          workers=2)
+        for family, path in zip(self.families, vcfs):
+            self.assertEqual(self.split(path), self.expected(family))
+        self.assertEqual(sorted(os.listdir(out)),
+                         ['F1.ped', 'F1.vcf', 'F2.ped', 'F2.vcf', 'F3.ped', 'F3.vcf'])
+
+    def test_missing_sample(self):
+        missing = families.Family('F4', 'S4', 'nobody', 'S5')
+        self.assertRaises(ValueError, families.split_families, self.vcf,
+                          self.families + [missing], self.tmp)
+
+    def test_trio_from_samples(self):
+        self.assertEqual(families.trio_from_samples(['X1', 'F7', 'M7', 'D7']),
+                         families.Family('7', 'D7', 'F7', 'M7'))
+        self.assertRaises(ValueError, families.trio_from_samples,
+                          ['D7', 'F7', 'M7', 'X1'])
+
+    def test_keep_call_line(self):
+        site = '1\t10\t.\tA\t%s\t50\tPASS\t.\t%s\t'
+        self.assertTrue(families.keep_call_line(
+            site % ('C', 'GT:DP:PL') + '0/1:9:1,0,9\t0/0:3:0,9,90\n'))
+        self.assertFalse(families.keep_call_line(
+            site % ('C', 'GT:DP:PL') + '0/1:9:1,0,9\t0/0:3:.'))
+        self.assertFalse(families.keep_call_line(
+            site % ('C', 'GT:DP:PL') + '0/1:9:1,0,9\t./.'))
+        self.assertFalse(families.keep_call_line(
+            site % ('C', 'GT:PL') + '0/1:1,0,9\t0/0:0,9,90'))
+        self.assertFalse(families.keep_call_line(
+            site % ('*', 'GT:DP:PL') + '0/1:9:1,0,9\t0/0:3:0,9,90'))
+        self.assertTrue(families.keep_call_line(
+            site % ('*,C', 'GT:DP:PL') + '0/1:9:1,0,9\t0/0:3:0,9,90'))
+
+    def test_prepare_trio(self):
+        trio = os.path.join(self.tmp, 'trio.vcf')
+        calls = ['0/1:9:1,0,9', '0/0:3:0,9,90', '0/0:.:0,9,90']
+        with open(trio, 'w') as handle:
+            handle.write('##fileformat=VCFv4.1\n#' + '\t'.join(
+                ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER',
+                 'INFO', 'FORMAT', 'M12', 'D12', 'F12']) + '\n')
+            for pos, alt, mother in ((10, 'C', 0), (20, 'C', 2), (30, '*', 0),
+                                     (40, 'G', 1)):
+                handle.write('1\t%d\t.\tA\t%s\t50\tPASS\t.\tGT:DP:PL\t%s\t%s\t%s\n'
+                             % (pos, alt, calls[mother], calls[1], calls[0]))
+        for suffix in ('.vcf', '.vcf.gz'):
+            out = os.path.join(self.tmp, 'ready' + suffix)
+            ped = os.path.join(self.tmp, 'ready.ped')
+            family, kept, dropped = families.prepare_trio(trio, out, ped)
+            self.assertEqual(family, families.Family('12', 'D12', 'F12', 'M12'))
+            self.assertEqual((kept, dropped), (2, 2))
+            reader = vcf.Reader(filename=out)
+            self.assertEqual(reader.samples, ['M12', 'D12', 'F12'])
+            self.assertEqual([record.POS for record in reader], [10, 40])
+            with open(ped) as handle:
+                self.assertEqual(handle.read(), '12\tD12\t0\t0\t1\n'
+                                 '12\tM12\t0\t0\t2\n'
+                                 '12\tF12\tD12\tM12\t2\n')
+        self.assertEqual(index.find_index(out), out + '.tbi')
+
+    def test_prepare_trio_family(self):
+        # the trio of the fam file, whatever its sample names
+        out = os.path.join(self.tmp, 'ready.vcf')
+        ped = os.path.join(self.tmp, 'ready.ped')
+        family = families.Family('FAM1', 'S4', 'S3', 'S5')
+        self.assertEqual(families.prepare_trio(self.vcf, out, ped, family)[0],
+                         family)
+        with open(ped) as handle:
+            self.assertEqual(handle.read(), '\n'.join(families.ped_lines(family)) + '\n')
+        self.assertRaises(ValueError, families.prepare_trio, self.vcf, out, ped,
+                          families.Family('FAM1', 'S4', 'nobody', 'S5'))
+
+        proc = subprocess.Popen(['python', 'prepare_trio_main.py', '-i', self.vcf,
+                                 '-o', out, '--ped', ped, '--fam-id', 'FAM1',
+                                 '--father', 'S4', '--child', 'S3',
+                                 '--mother', 'S5'],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, err = proc.communicate()
+        self.assertEqual(proc.returncode, 0, err)
+        self.assertTrue(stdout.startswith('Family FAM1:'))
+        with open(ped) as handle:
+            self.assertEqual(handle.readline().split('\t')[:2], ['FAM1', 'S4'])
+
+        # without the samples only the id is replaced
+        trio = os.path.join(self.tmp, 'trio.vcf')
+        with open(trio, 'w') as handle:
+            handle.write('##fileformat=VCFv4.1\n#' + '\t'.join(
+                ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER',
+                 'INFO', 'FORMAT', 'M12', 'D12', 'F12']) + '\n')
+        self.assertEqual(families.prepare_trio(trio, out, fam_id='FAM12')[0],
+                         families.Family('FAM12', 'D12', 'F12', 'M12'))
+
+
+class TestS3(unittest.TestCase):
+
+    def setUp(self):
+        self.bgzf_path = write_bgzf('gatk.vcf', 700)
+        self.objects = {
+            ('bucket', 'gatk.vcf'): fh('gatk.vcf', 'rb').read(),
+            ('bucket', 'gatk.vcf.gz'): open(self.bgzf_path, 'rb').read(),
+            ('bucket', '1kg.vcf.gz'): fh('1kg.vcf.gz', 'rb').read(),
+        }
+        self.client = FakeS3Client(self.objects)
+
+    def tearDown(self):
+        os.remove(self.bgzf_path)
+
+    def stream(self, key, **kwargs):
+        return s3.S3Stream('s3://bucket/' + key, client=self.client, **kwargs)
+
+    def test_parse_uri(self):
+        self.assertEqual(s3.parse_s3_uri('s3://b/dir/x.vcf'), ('b', 'dir/x.vcf'))
+        self.assertRaises(ValueError, s3.parse_s3_uri, 's3://b')
+        self.assertRaises(ValueError, s3.parse_s3_uri, '/tmp/x.vcf')
+
+    def test_stream(self):
+        data = self.objects['bucket', 'gatk.vcf']
+        stream = self.stream('gatk.vcf', chunk_size=1000, read_ahead=2)
+        self.assertEqual(stream.readline(), data[:data.index('\n') + 1])
+        self.assertEqual(stream.read(2500), data[stream.tell() - 2500:stream.tell()])
+        stream.seek(-100, 2)
+        self.assertEqual(stream.read(), data[-100:])
+        self.assertEqual(stream.read(), b'')
+        stream.seek(10)
+        self.assertEqual(b''.join(stream), data[10:])
+        # every GET stays inside the object and within one chunk
+        for start, end in self.client.ranges:
+            self.assertEqual(start % 1000, 0)
+            self.assertTrue(end < min(start + 1000, len(data)))
+        stream.close()
+
+    def test_reader(self):
+        expected = [record_site(r) for r in vcf.Reader(fh('gatk.vcf'))]
+        for key in ('gatk.vcf', 'gatk.vcf.gz'):
+            reader = vcf.Reader(self.stream(key, chunk_size=4096))
+            self.assertEqual([record_site(r) for r in reader], expected)
+        reader = vcf.Reader(self.stream('gatk.vcf.gz'))
+        self.assertTrue(isinstance(reader._reader, bgzf.BgzfReader))
+        # plain gzip goes through GzipFile
+        reader = vcf.Reader(self.stream('1kg.vcf.gz', chunk_size=10000))
+        self.assertEqual(len(list(reader)),
+                         len(list(vcf.Reader(fh('1kg.vcf.gz', 'rb')))))
+
+    def test_reader_uri(self):
+        client = self.client
+
+        class FakeBoto3(object):
+            @staticmethod
+            def client(service):
+                return client
+
+        boto3, s3.boto3 = s3.boto3, FakeBoto3
+        try:
+            reader = vcf.Reader(filename='s3://bucket/gatk.vcf.gz')
+            self.assertEqual(reader.filename, 's3://bucket/gatk.vcf.gz')
+            self.assertEqual(len(reader.samples), 7)
+            self.assertEqual(len(list(reader)), 37)
+        finally:
+            s3.boto3 = boto3
+
+
+class TestBench(unittest.TestCase):
+
+    def setUp(self):
+        from vcf.test import bench
+        self.bench = bench
+        self.tmp = tempfile.mkdtemp()
+        self.ws = bench._workspace(self.tmp, 30, 4)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_synthetic_vcf(self):
+        records = list(vcf.Reader(filename=self.ws['vcf']))
+        self.assertEqual(len(records), 30)
+        self.assertEqual(records[0].samples[0].sample, 'child')
+        self.assertEqual(len(records[0].samples), 4)
+        heavy = next(vcf.Reader(filename=self.ws['info_vcf']))
+        self.assertTrue(len(heavy.INFO) >= 36)
+
+    def test_cases(self):
+        for name, fn in self.bench.CASES:
+            result = self.bench.run_case(fn, self.ws, repeat=1)
+            self.assertEqual(result['units'], 200 if name == 'open' else 30, name)
+            self.assertTrue(result['rate'] > 0)
+
+    def test_compare(self):
+        baseline = {'parse/3': {'rate': 100.0}, 'walk/3': {'rate': 100.0}}
+        results = {'parse/3': {'rate': 85.0}, 'walk/3': {'rate': 70.0},
+                   'open/3': {'rate': 1.0}}
+        self.assertEqual(self.bench.compare(results, baseline, 0.2),
+                         [('walk/3', 70.0, 100.0)])
+
+
+class TestLineDecoding(unittest.TestCase):
+
+    def test_strict_matches_regex(self):
+        loose = list(vcf.Reader(fh('gatk.vcf')))
+        strict = list(vcf.Reader(fh('gatk.vcf'), strict_whitespace=True))
+        self.assertEqual(len(loose), len(strict))
+        for a, b in zip(loose, strict):
+            self.assertEqual(a._raw[:2], b._raw[:2])
+            self.assertEqual([c.data for c in a.samples],
+                             [c.data for c in b.samples])
+
+    def test_space_separated(self):
+        # runs of spaces separate columns unless whitespace is strict
+        reader = vcf.Reader(StringIO(
+            '##fileformat=VCFv4.1\n'
+            '#CHROM POS ID REF ALT QUAL FILTER INFO\n'
+            '1  100 .  A  C,GT  50 PASS .\n'))
+        record = next(reader)
+        self.assertEqual((record.CHROM, record.POS), ('1', 100))
+        self.assertEqual(record.ALT, ['C', 'GT'])
+        self.assertEqual(record.QUAL, 50)
+
+    def test_fields(self):
+        reader = vcf.Reader(StringIO(
+            '##fileformat=VCFv4.1\n'
+            '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+            '1\t1\t.\tA\tC\t50\tPASS\t.\n'
+            '1\t2\t.\tA\tT\t12.5\tPASS\t.\n'
+            '1\t3\t.\tA\tG[2:3[\t.\tPASS\t.\n'
+            '1\t4\t.\tA\tACGT,<DEL>\t1e3\tPASS\t.\n'))
+        first, second, third, fourth = list(reader)
+        self.assertTrue(isinstance(first.QUAL, int))
+        self.assertEqual(second.QUAL, 12.5)
+        self.assertEqual(third.QUAL, None)
+        self.assertEqual(fourth.QUAL, 1000.0)
+        for text, qual in (('-5', -5), ('+5', 5), ('-0.5', -0.5), ('5', 5),
+                           ('x', None)):
+            self.assertEqual(vcf_parser._parse_qual(text), qual)
+            self.assertEqual(type(vcf_parser._parse_qual(text)), type(qual))
+        self.assertEqual(first.ALT, [vcf.model._Substitution('C')])
+        # every record gets its own ALT objects
+        first.ALT[0].sequence = 'T'
+        self.assertEqual(next(vcf.Reader(StringIO(
+            '##fileformat=VCFv4.1\n'
+            '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+            '1\t1\t.\tA\tC\t50\tPASS\t.\n'))).ALT, ['C'])
+        self.assertEqual(third.ALT[0].type, 'BND')
+        self.assertTrue(third.ALT[0].remoteOrientation)
+        self.assertEqual(fourth.ALT[0].type, 'MNV')
+        self.assertEqual(fourth.ALT[1].type, 'DEL')
+
+    def test_next(self):
+        reader = vcf.Reader(fh('gatk.vcf'))
+        self.assertEqual(reader.__next__().POS, 42522392)
+        self.assertEqual(reader.next().POS, 42522613)
+
+
+class TestSampleProjection(unittest.TestCase):
+
+    def test_subset(self):
+        full = list(vcf.Reader(fh('gatk.vcf')))
+        reader = vcf.Reader(fh('gatk.vcf'), samples=['NA19240', 'NA12878'])
+        self.assertEqual(reader.samples, ['NA19240', 'NA12878'])
+        n = 0
+        for record, expected in zip(reader, full):
+            n += 1
+            self.assertEqual(len(record.samples), 2)
+            self.assertEqual(record.INFO, expected.INFO)
+            for name in reader.samples:
+                self.assertEqual(record.genotype(name).sample, name)
+                self.assertEqual(record.genotype(name).data,
+                                 expected.genotype(name).data)
+        self.assertEqual(n, len(full))
+
+    def test_no_samples(self):
+        reader = vcf.Reader(fh('gatk.vcf'), samples=[])
+        record = next(reader)
+        self.assertEqual(reader.samples, [])
+        self.assertEqual(len(record.samples), 0)
+        self.assertEqual(record.FORMAT, 'GT:AD:DP:GQ:PL')
+
+    def test_unknown_sample(self):
+        self.assertRaises(ValueError, vcf.Reader, fh('gatk.vcf'),
+                          samples=['NA12878', 'nobody'])
+
+    def test_writer(self):
+        reader = vcf.Reader(fh('example-4.0.vcf'), samples=['NA00002'])
+        out = StringIO()
+        writer = vcf.Writer(out, reader)
+        for record in reader:
+            writer.write_record(record)
+        out.seek(0)
+        reread = vcf.Reader(out)
+        self.assertEqual(reread.samples, ['NA00002'])
+        self.assertEqual(next(reread).samples[0]['GT'], '1|0')
+
+    @unittest.skipUnless(numpy, "test requires installation of NumPy.")
+    def test_blocks(self):
+        reader = vcf.Reader(fh('gatk.vcf'), samples=['NA12878'])
+        block = next(reader.iter_blocks(5))
+        self.assertEqual(block.calldata['DP'].shape, (5, 1))
+        self.assertEqual(block.calldata['DP'][0, 0], 250)
+
+
+class TestLazySamples(unittest.TestCase):
+
+    def test_decoded_on_access(self):
+        reader = vcf.Reader(fh('gatk.vcf'))
+        record = next(reader)
+        self.assertEqual(record.samples._calls, [None] * 7)
+        self.assertEqual(len(record.samples), 7)
+        call = record.genotype('NA12878')
+        self.assertEqual(call.sample, 'NA12878')
+        self.assertEqual(call['DP'], 250)
+        self.assertTrue(record.samples[1] is call)
+        self.assertEqual(
+            [c is not None for c in record.samples._calls],
+            [False, True, False, False, False, False, False])
+
+    def test_list_behaviour(self):
+        record = next(vcf.Reader(fh('example-4.0.vcf')))
+        calls = list(record.samples)
+        self.assertEqual(record.samples, calls)
+        self.assertEqual(record.samples[-1].sample, 'NA00003')
+        self.assertEqual([c.sample for c in record.samples[:2]],
+                         ['NA00001', 'NA00002'])
+        self.assertEqual(list(record), calls)
+
+
+@unittest.skipUnless(numpy, "test requires installation of NumPy.")
+class TestIterBlocks(unittest.TestCase):
+
+    def test_block_sizes(self):
+        reader = vcf.Reader(fh('gatk.vcf'))
+        sizes = [len(block.POS) for block in reader.iter_blocks(10)]
+        self.assertEqual(sizes, [10, 10, 10, 7])
+
+    def test_matches_records(self):
+        records = list(vcf.Reader(fh('gatk.vcf')))
+        reader = vcf.Reader(fh('gatk.vcf'))
+        blocks = list(reader.iter_blocks(8, fields=('GT', 'DP', 'GQ', 'AD')))
+        gt = numpy.concatenate([b.calldata['GT'] for b in blocks])
+        dp = numpy.concatenate([b.calldata['DP'] for b in blocks])
+        pos = numpy.concatenate([b.POS for b in blocks])
+
+        self.assertEqual(gt.dtype, numpy.int8)
+        self.assertEqual(dp.dtype, numpy.int32)
+        self.assertEqual(gt.shape, (len(records), len(reader.samples)))
+        self.assertEqual(list(pos), [r.POS for r in records])
+        for i, record in enumerate(records):
+            for j, call in enumerate(record.samples):
+                expected = call.gt_type if call.gt_type is not None else -1
+                self.assertEqual(gt[i, j], expected)
+                self.assertEqual(dp[i, j], call['DP'] if call['DP'] is not None else -1)
+
+        first = records[0]
+        ad = blocks[0].calldata['AD']
+        self.assertEqual(ad.ndim, 3)
+        self.assertEqual(list(ad[0, 1, :len(first.samples[1]['AD'])]),
+                         first.samples[1]['AD'])
+        gq = blocks[0].calldata['GQ']
+        self.assertEqual(gq.dtype, numpy.float32)
+        self.assertAlmostEqual(gq[0, 1], first.samples[1]['GQ'], places=3)
+
+    def test_missing_values(self):
+        reader = vcf.Reader(fh('uncalled_genotypes.vcf'))
+        block = next(reader.iter_blocks(10, fields=('GT', 'DP')))
+        self.assertEqual(block.calldata['GT'].tolist(),
+                         [[0, -1, 2], [-1, 1, 0], [1, 1, -1], [1, 1, -1]])
+
+    def test_string_field(self):
+        reader = vcf.Reader(fh('gatk.vcf'))
+        self.assertRaises(ValueError, next, reader.iter_blocks(10, fields=('FT',)))
+
+
+@unittest.skipUnless(numpy, "test requires installation of NumPy.")
+class TestColumnar(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.vcf = os.path.join(self.tmp, 'gatk.vcf')
+        shutil.copy(os.path.join(os.path.dirname(__file__), 'gatk.vcf'), self.vcf)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_records(self):
+        path = columnar.write_sidecar(self.vcf, fields=('GT', 'DP', 'GQ', 'AD'),
+                                      chunk_size=10)
+        self.assertEqual(path, self.vcf + '.npc')
+        reader = columnar.ColumnarReader(path)
+        self.assertEqual(reader.chunk_sizes, [10, 10, 10, 7])
+        self.assertEqual(reader.samples, vcf.Reader(fh('gatk.vcf')).samples)
+
+        n = 0
+        for expected, record in zip(vcf.Reader(fh('gatk.vcf')), reader):
+            self.assertEqual(record.CHROM, expected.CHROM)
+            self.assertEqual(record.POS, expected.POS)
+            self.assertEqual(record.ID, expected.ID)
+            self.assertEqual(record.ALT, expected.ALT)
+            self.assertEqual(record.QUAL, expected.QUAL)
+            self.assertEqual(record.FILTER, expected.FILTER)
+            self.assertEqual(dict(record.INFO), dict(expected.INFO))
+            self.assertEqual(record.FORMAT, 'GT:DP:GQ:AD')
+            for call, want in zip(record.samples, expected.samples):
+                self.assertEqual(call.sample, want.sample)
+                self.assertEqual(call.gt_type, want.gt_type)
+                for field in ('GT', 'DP', 'GQ', 'AD'):
+                    self.assertEqual(getattr(call.data, field),
+                                     getattr(want.data, field))
+            n += 1
+        self.assertEqual(n, 37)
+
+    def test_blocks(self):
+        path = columnar.write_sidecar(self.vcf, info=('AF', 'DB'), chunk_size=8)
+        reader = columnar.ColumnarReader(path)
+        blocks = list(reader.iter_blocks())
+        expected = list(vcf.Reader(fh('gatk.vcf')).iter_blocks(8, columnar.FIELDS))
+        self.assertEqual(len(blocks), len(expected))
+        for block, want in zip(blocks, expected):
+            self.assertTrue(isinstance(block.POS, numpy.memmap))
+            numpy.testing.assert_array_equal(block.POS, want.POS)
+            for field in columnar.FIELDS:
+                numpy.testing.assert_array_equal(block.calldata[field],
+                                                 want.calldata[field])
+
+        chunk = reader.chunk(0)
+        self.assertEqual(chunk['INFO_AF'][0], 0.143)
+        self.assertEqual(chunk['INFO_DB'].tolist()[:3], [1.0, 1.0, 0.0])
+
+    def test_text_columns(self):
+        # text is stored unpadded, one long value costs only its own bytes
+        lines = open(self.vcf).read().splitlines(True)
+        first = [i for i, line in enumerate(lines) if not line.startswith('#')][0]
+        row = lines[first].split('\t')
+        row[7] += ';CSQ=' + 'A' * 5000
+        lines[first] = '\t'.join(row)
+        with open(self.vcf, 'w') as handle:
+            handle.writelines(lines)
+        reader = columnar.ColumnarReader(columnar.write_sidecar(self.vcf))
+        chunk = reader.chunk(0)
+        infos = [line.split('\t')[7] for line in lines[first:]]
+        self.assertEqual(chunk['INFO'].tolist(), infos)
+        self.assertEqual(chunk['INFO'][1], infos[1])
+        self.assertEqual(len(chunk['INFO']), 37)
+        self.assertEqual(len(chunk['INFO'].data), sum(len(info) for info in infos))
+        records = list(reader)
+        self.assertTrue(records[0].INFO['CSQ'] == ['A' * 5000])
+        self.assertFalse('CSQ' in records[1].INFO)
+
+    def test_writer_template(self):
+        reader = columnar.open_sidecar(self.vcf)
+        out = StringIO()
+        writer = vcf.Writer(out, reader)
+        for record in reader:
+            writer.write_record(record)
+        out.seek(0)
+        records = list(vcf.Reader(out))
+        self.assertEqual(len(records), 37)
+        self.assertEqual(records[0].samples[1]['PL'], [1961, 0, 3049])
+
+    def test_freshness(self):
+        self.assertFalse(columnar.is_fresh(self.vcf))
+        path = columnar.write_sidecar(self.vcf)
+        self.assertTrue(columnar.is_fresh(self.vcf))
+        with open(self.vcf, 'a') as handle:
+            handle.write('\n')
+        self.assertFalse(columnar.is_fresh(self.vcf))
+        columnar.open_sidecar(self.vcf)
+        self.assertTrue(columnar.is_fresh(self.vcf))
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['gatk.vcf', 'gatk.vcf.npc'])
+
+    def test_fresh_options(self):
+        samples = vcf.Reader(fh('gatk.vcf')).samples[:2]
+        columnar.open_sidecar(self.vcf)
+        self.assertTrue(columnar.is_fresh(self.vcf, fields=['GT', 'DP', 'GQ', 'PL']))
+        reader = columnar.open_sidecar(self.vcf, fields=('GT', 'AD'), info=('DP',),
+                                       samples=samples)
+        self.assertEqual(reader.fields, ['GT', 'AD'])
+        self.assertEqual(reader.info_fields, ['DP'])
+        self.assertEqual(reader.samples, samples)
+        self.assertTrue('INFO_DP' in reader.chunk(0))
+        self.assertFalse(columnar.is_fresh(self.vcf))
+        self.assertTrue(columnar.is_fresh(self.vcf, fields=('AD', ), info=['DP'],
+                                          samples=samples, chunk_size=5))
+
+    def test_uncalled_gt(self):
+        uncalled = os.path.join(self.tmp, 'uncalled.vcf')
+        shutil.copy(os.path.join(os.path.dirname(__file__),
+                                 'uncalled_genotypes.vcf'), uncalled)
+        reader = columnar.open_sidecar(uncalled, fields=('GT', ))
+        expected = vcf.Reader(fh('uncalled_genotypes.vcf'))
+        for record, want in zip(reader, expected):
+            self.assertEqual([(c['GT'], c.called, c.gt_type) for c in record.samples],
+                             [(c['GT'], c.called, c.gt_type) for c in want.samples])
+
+
+@unittest.skipUnless(vcf_parser.cparse, "test requires the compiled cparse module.")
+class TestCparse(unittest.TestCase):
+
+    def parse(self, fname, compiled):
+        saved = vcf_parser.cparse
+        if not compiled:
+            vcf_parser.cparse = None
+        try:
+            return [(r.INFO, [c.data for c in r.samples])
+                    for r in vcf.Reader(fh(fname))]
+        finally:
+            vcf_parser.cparse = saved
+
+    def test_same_as_python(self):
+        for fname in ('example-4.0.vcf', 'example-4.1.vcf', 'gatk.vcf',
+                      'freebayes.vcf', 'string_as_flag.vcf',
+                      'info-type-character.vcf', 'uncalled_genotypes.vcf',
+                      'FT.vcf', 'example-4.1-info-multiple-values.vcf'):
+            self.assertEqual(self.parse(fname, True), self.parse(fname, False))
+
+
 class TestStrelka(unittest.TestCase):
 
     def test_strelka(self):
@@ -1729,14 +3218,19 @@ suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestGoNL))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestStringAsFlag))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestInfoOrder))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestInfoTypeCharacter))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestInfoConverters))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestInfoFields))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestParseMetaLine))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestGatkOutputWriter))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestBcfToolsOutputWriter))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestWriterPassthrough))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestWriterDictionaryMeta))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSamplesSpace))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMetadataWhitespace))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestMixedFiltering))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRecord))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRecordSlots))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestGenotypeTally))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCall))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFetch))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestIssue201))
@@ -1747,9 +3241,25 @@ suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestIsFiltered))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestOpenMethods))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSampleFilter))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFilter))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestErrorBiasFilter))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFilterBlocks))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestRegression))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestUtils))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestHeaderParsing))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestGATKMeta))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestUncalledGenotypes))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestBgzf))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestIndexBuilder))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestParallel))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestScatter))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestFamilies))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestS3))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestBench))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestLineDecoding))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestSampleProjection))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestLazySamples))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestIterBlocks))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestColumnar))
+suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestCparse))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestStrelka))
 suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestBadInfoFields))
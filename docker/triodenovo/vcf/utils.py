@@ -2,6 +2,47 @@
 Utilities for VCF files.
 """
 
+import heapq
+
+
+def _contig_order(readers):
+    """
+    Rank the contigs declared in the ``##contig`` lines of the readers, in
+    the order they first appear across all of the headers.
+    """
+    order = {}
+    for reader in readers:
+        for contig in (getattr(reader, 'contigs', None) or ()):
+            order.setdefault(contig, len(order))
+    return order
+
+
+def _walk_scan(readers, nexts, get_key, contig_key, min_k=(None,)):
+    """
+    Merge the readers by comparing the next record of every reader, given
+    in ``nexts`` (None for an exhausted reader), finishing the contig of
+    ``min_k`` before moving on to the contig of the smallest
+    ``contig_key(key)``.
+    """
+    while any([r is not None for r in nexts]):
+        next_idx_to_k = dict(
+            (i, get_key(r)) for i, r in enumerate(nexts) if r is not None)
+        keys_with_prev_contig = [
+            k for k in next_idx_to_k.values() if k[0] == min_k[0]]
+
+        if any(keys_with_prev_contig):
+            min_k = min(keys_with_prev_contig)   # finish previous contig
+        else:
+            # move on to next contig
+            min_k = min(next_idx_to_k.values(), key=contig_key)
+
+        min_k_idxs = set([i for i, k in next_idx_to_k.items() if k == min_k])
+        yield [nexts[i] if i in min_k_idxs else None for i in range(len(nexts))]
+
+        for i in min_k_idxs:
+            nexts[i] = next(readers[i], None)
+
+
 def walk_together(*readers, **kwargs):
     """
     Simultaneously iteratate over two or more VCF readers. For each 
@@ -11,6 +52,15 @@ def walk_together(*readers, **kwargs):
     The caller must make sure that inputs are sorted in the same way and use the 
     same reference otherwise behaviour is undefined.
 
+    By default contigs are ordered as declared in the ``##contig`` header
+    lines of the readers, and records are merged with a heap, so each step
+    costs O(log k) for k readers and hundreds of inputs can be walked in one
+    pass.  From the first record on a contig missing from the headers, and
+    with a ``vcf_record_sort_key``, the next records of all the readers are
+    compared instead: the current contig is finished first, then the
+    smallest key is taken, and contigs missing from the headers sort after
+    those, by name.
+
     Args:
         vcf_record_sort_key: function that takes a VCF record and returns a 
             tuple that can be used as a key for comparing and sorting VCF 
@@ -19,39 +69,65 @@ def walk_together(*readers, **kwargs):
             their allele values), and implicitly determines the chromosome 
             ordering since the tuple's 1st element is typically the chromosome 
             name (or calculated from it).
+        contigs: list of contig names giving the chromosome ordering, used
+            instead of the ``##contig`` header lines.
     """
+    nexts = [next(reader, None) for reader in readers]
+
     if 'vcf_record_sort_key' in kwargs:
         get_key = kwargs['vcf_record_sort_key']
+        for current in _walk_scan(readers, nexts, get_key, lambda k: k):
+            yield current
+        return
+
+    if kwargs.get('contigs') is not None:
+        order = dict((c, i) for (i, c) in enumerate(kwargs['contigs']))
     else:
-        get_key = lambda r: (r.CHROM, r.POS) #, r.REF, r.ALT)
+        order = _contig_order(readers)
 
-    nexts = []
-    for reader in readers:
-        try:
-            nexts.append(next(reader))
-        except StopIteration:
-            nexts.append(None)
+    def scan_key(r):
+        return (r.CHROM, r.POS)
 
-    min_k = (None,)   # keep track of the previous min key's contig
-    while any([r is not None for r in nexts]):
-        next_idx_to_k = dict(
-            (i, get_key(r)) for i, r in enumerate(nexts) if r is not None)
-        keys_with_prev_contig = [
-            k for k in next_idx_to_k.values() if k[0] == min_k[0]]
+    def contig_key(k):
+        return (order.get(k[0], len(order)), k)
 
-        if any(keys_with_prev_contig):
-            min_k = min(keys_with_prev_contig)   # finish previous contig
-        else:
-            min_k = min(next_idx_to_k.values())   # move on to next contig
+    # entries are ((rank, POS), reader index, record), the index breaks
+    # ties so records themselves are never compared
+    heap = [((order[r.CHROM], r.POS), i, r) for (i, r) in enumerate(nexts)
+            if r is not None and r.CHROM in order]
+    heapq.heapify(heap)
+    min_k = (None,)
+    if len(heap) == len([r for r in nexts if r is not None]):
+        nexts = None
+        n = len(readers)
+        while heap:
+            min_k, i, record = heapq.heappop(heap)
+            current = [None] * n
+            current[i] = record
+            min_k_idxs = [i]
+            while heap and heap[0][0] == min_k:
+                _, i, record = heapq.heappop(heap)
+                current[i] = record
+                min_k_idxs.append(i)
+            yield current
+            min_k = (record.CHROM, )
 
-        min_k_idxs = set([i for i, k in next_idx_to_k.items() if k == min_k])
-        yield [nexts[i] if i in min_k_idxs else None for i in range(len(nexts))]
+            advanced = [(i, next(readers[i], None)) for i in min_k_idxs]
+            if any(r is not None and r.CHROM not in order for (_, r) in advanced):
+                # a contig missing from the order, compare from here on
+                nexts = [None] * n
+                for _, i, record in heap:
+                    nexts[i] = record
+                for i, record in advanced:
+                    nexts[i] = record
+                break
+            for i, record in advanced:
+                if record is not None:
+                    heapq.heappush(heap, ((order[record.CHROM], record.POS), i, record))
 
-        for i in min_k_idxs:
-            try:
-                nexts[i] = readers[i].next()
-            except StopIteration:
-                nexts[i] = None
+    if nexts is not None:
+        for current in _walk_scan(readers, nexts, scan_key, contig_key, min_k):
+            yield current
 
 
 def trim_common_suffix(*sequences):
@@ -56,6 +56,7 @@ def merge_configs(user_settings, args):
         'FASTQ_SUFFIX',
         'MODE',
         'POLL_TIME',
+        'SPLIT_JOBS',
         'RESOURCE_CFN_TMPL_DEPLOY_BUCKET'
     ]
 
@@ -138,9 +139,11 @@ def merge_configs(user_settings, args):
         'vqsr_indel_apply' : 'gatk',
         'pipeline_bam_qc' : 'picard',
         'fam_vcf_from_cohort' : 'gatk',
+        'split_families' : 'triodenovo',
         'ped_from_vcf' : 'triodenovo',
         'scrub_vcf' : 'triodenovo',
         'triodenovo' : 'triodenovo',
+        'denovo' : 'triodenovo',
         'dproc_create' : 'dproc',
         'dproc_submit' : 'dproc',
         'dproc_delete' : 'dproc'
@@ -150,6 +153,9 @@ def merge_configs(user_settings, args):
     conf['FASTQ_SUFFIX'] = '_001'
     conf['MODE'] = 'prod'
     conf['POLL_TIME'] = 300
+    # split_families jobs the families are dealt out to, each reads the
+    # cohort vcf once
+    conf['SPLIT_JOBS'] = 1
 
     conf['VQSR_TEST_DATA_URI_PREFIX'] = 's3://pipeline-validation/sfn-test/'
     conf['VQSR_TEST_COHORT_KEY'] = 'SSC_chr17_02_28_sentieon'
@@ -442,9 +448,11 @@ def merge_configs(user_settings, args):
             'dproc_submit' : '6000',
             'dproc_delete' : '6000',
             'fam_vcf_from_cohort' : '30000',
+            'split_families' : '15000',
             'scrub_vcf' : '15000',
             'ped_from_vcf' : '15000',
-            'triodenovo' : '15000'
+            'triodenovo' : '15000',
+            'denovo' : '15000'
         },
         'prod': {
             'submitter': '6000',
@@ -466,9 +474,11 @@ def merge_configs(user_settings, args):
             'dproc_submit' : '6000',
             'dproc_delete' : '6000',
             'fam_vcf_from_cohort' : '56000',
+            'split_families' : '30000',
             'scrub_vcf' : '15000',
             'ped_from_vcf' : '15000',
-            'triodenovo' : '15000'
+            'triodenovo' : '15000',
+            'denovo' : '15000'
         }
     }
     conf['VCPUS'] = {
@@ -492,9 +502,11 @@ def merge_configs(user_settings, args):
             'dproc_submit' : '2',
             'dproc_delete' : '2',
             'fam_vcf_from_cohort' : '4',
+            'split_families' : '4',
             'scrub_vcf' : '8',
             'ped_from_vcf' : '8',
-            'triodenovo' : '8'
+            'triodenovo' : '8',
+            'denovo' : '8'
         },
         'prod': {
             'submitter': '2',
@@ -516,9 +528,11 @@ def merge_configs(user_settings, args):
             'dproc_submit' : '2',
             'dproc_delete' : '2',
             'fam_vcf_from_cohort' : '8',
+            'split_families' : '16',
             'scrub_vcf' : '8',
             'ped_from_vcf' : '8',
-            'triodenovo' : '8'
+            'triodenovo' : '8',
+            'denovo' : '8'
         }
     }
 
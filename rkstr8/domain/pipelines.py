@@ -822,9 +822,11 @@ class MultiSampleWGSRefactoredNested(PipelineSpecification):
 
         # Denovo calling job defs
         fam_vcf_from_cohort_job_def = get_phys_resource_id('famvcffromcohortJobDef')
+        split_families_job_def = get_phys_resource_id('splitfamiliesJobDef')
         scrub_vcf_job_def = get_phys_resource_id('scrubvcfJobDef')
         ped_from_vcf_job_def = get_phys_resource_id('pedfromvcfJobDef')
         triodenovo_job_def = get_phys_resource_id('triodenovoJobDef')
+        denovo_job_def = get_phys_resource_id('denovoJobDef')
 
         # GCP job defs
         dproc_create_job_def = get_phys_resource_id('dproccreateJobDef')
@@ -889,6 +891,7 @@ class MultiSampleWGSRefactoredNested(PipelineSpecification):
             'sample_s3_bucket' : sample_s3_bucket,
             'sample_file' : sample_file,
             'fam_file' : fam_file,
+            'split_jobs' : self.conf['SPLIT_JOBS'],
             'remap' : remap,
             'suffix' : suffix,
             'cohort_prefix': cohort_prefix,
@@ -903,7 +906,8 @@ class MultiSampleWGSRefactoredNested(PipelineSpecification):
                     'threads': {
                         'bwa' : 8,
                         'brt' : 4,
-                        'hap' : 8
+                        'hap' : 8,
+                        'split' : 4
                     }
 
                 },
@@ -911,7 +915,8 @@ class MultiSampleWGSRefactoredNested(PipelineSpecification):
                     'threads': {
                         'bwa' : 36,
                         'brt' : 16,
-                        'hap' : 36
+                        'hap' : 36,
+                        'split' : 16
                     }
 
                 }
@@ -946,9 +951,11 @@ class MultiSampleWGSRefactoredNested(PipelineSpecification):
                 'vqsr_indel_model_job' : vqsr_indel_model_job_def,
                 'vqsr_indel_apply_job' : vqsr_indel_apply_job_def,
                 'fam_vcf_from_cohort_job' : fam_vcf_from_cohort_job_def,
+                'split_families_job' : split_families_job_def,
                 'scrub_vcf_job' : scrub_vcf_job_def,
                 'ped_from_vcf_job' : ped_from_vcf_job_def,
                 'triodenovo_job' : triodenovo_job_def,
+                'denovo_job' : denovo_job_def,
                 'dproc_create_job' : dproc_create_job_def,
                 'dproc_submit_job' : dproc_submit_job_def,
                 'dproc_delete_job' : dproc_delete_job_def